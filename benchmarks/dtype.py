@@ -0,0 +1,119 @@
+"""
+Peak memory, time and accuracy of the [snowav] dtype options on the
+tests/lakes workload: the gold snow.nc and em.nc images are read with
+outputs() and the Lakes Basin elevation band swe_vol, swe_z, depth and
+density are calculated with ZonalStats, as Process does. float32 results are
+compared with float64, and swe_vol with the tests/lakes gold database.
+
+Example:
+    python benchmarks/dtype.py
+    python benchmarks/dtype.py --runs /path/to/runs/run20190401 ...
+"""
+
+import argparse
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from snowav.database.database import collect, configure_result_cache
+from snowav.framework.outputs import outputs
+from snowav.utils.utilities import masks
+from snowav.utils.zonal_stats import ZonalStats
+
+lakes = os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
+                                     'tests', 'lakes'))
+bands = ['swe_z', 'depth', 'density', 'coldcont']
+edges = [8000, 9000, 10000, 11000]
+
+
+def run(runs, dtype):
+    """ Read images and calculate basin results with a dtype. """
+
+    out = masks(os.path.join(lakes, 'topo', 'topo.nc'), False)
+    basin = out['plotorder'][0]
+    ixd = np.digitize(out['dem'] * 3.28, np.arange(9000, 13000, 1000))
+    zs = ZonalStats({basin: out['masks'][basin]}, ixd, edges, 50, 'TAF', 3)
+
+    tracemalloc.start()
+    t0 = time.time()
+
+    store = outputs(runs, 2019, bands, datetime(2018, 10, 1),
+                    datetime(2019, 9, 30, 23), dtype=dtype)
+    o = store['outputs']
+    results = {}
+
+    for i in range(0, len(o['dates'])):
+        results[(i, 'swe_vol')] = zs.calculate(o['swe_z'][i], 'sum', 'volume')
+        for band in ('swe_z', 'depth', 'density'):
+            results[(i, band)] = zs.calculate(o[band][i], 'mean', 'depth')
+
+    elapsed = time.time() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    o.close()
+
+    return results, o['dates'], peak, elapsed
+
+
+def report(connector, out, dates):
+    """ swe_vol differences from the gold database. """
+
+    for dtype in (np.float64, np.float32):
+        diff = 0.0
+        for i, date in enumerate(dates):
+            df = collect(connector, ['Lakes'], {'Lakes': {'basin_id': 16}},
+                         date, date, 'swe_vol', 'lakes_wy2019_gold',
+                         edges, 'end')
+            calc = out[dtype][0][(i, 'swe_vol')]
+            calc = calc.iloc[:, 0].loc[edges].values.astype(float)
+            diff = max(diff, float(np.nanmax(np.abs(
+                calc - df['Lakes'].values.astype(float)))))
+
+        print('{:>8}: swe_vol max difference from gold.db {}'.format(
+            np.dtype(dtype).name, diff))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark image dtypes')
+    parser.add_argument('--runs', nargs='+', default=[
+        os.path.join(lakes, 'gold', 'runs', r)
+        for r in ('run20190401', 'run20190402')])
+    args = parser.parse_args()
+
+    configure_result_cache(enabled=False)
+    out = {}
+
+    for dtype in (np.float64, np.float32):
+        out[dtype] = run(args.runs, dtype)
+        print('{:>8}: peak {:.1f} MB, {:.2f} s'.format(
+            np.dtype(dtype).name, out[dtype][2] / 1e6, out[dtype][3]))
+
+    r64 = out[np.float64][0]
+    r32 = out[np.float32][0]
+    diff = max(float(np.nanmax(np.abs(r32[k].values - r64[k].values)))
+               for k in r64)
+    print('float32 max difference from float64: {}'.format(diff))
+
+    # the gold database was made with float64 images, read from a copy so
+    # that the tracked file isn't changed
+    path = tempfile.mkdtemp()
+    gold = os.path.join(path, 'gold.db')
+    shutil.copy(os.path.join(lakes, 'results', 'gold.db'), gold)
+    connector = 'sqlite:///' + gold
+    dates = out[np.float64][1]
+
+    try:
+        report(connector, out, dates)
+
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Query plans and timings for collect() and the Process existing record check
+on a database without the Results composite indexes, before and after
+adding them with snowav.database.migrate.migrate().
+
+Example:
+    python benchmarks/indexes.py
+    python benchmarks/indexes.py --basins 8 --bands 20 --days 365 --runs 4
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from snowav.database.database import collect, configure_result_cache, \
+    get_engine, Database
+from snowav.database.migrate import explain, migrate
+from snowav.database.tables import Results, RunMetadata
+
+
+def make_results(connector, basins, edges, variables, start, days, runs,
+                 seed=0):
+    """ Write days of synthetic results for several run_names. """
+
+    rng = np.random.RandomState(seed)
+    engine = get_engine(connector)
+
+    with engine.begin() as conn:
+        for run_id in range(1, runs + 1):
+            conn.execute(RunMetadata.__table__.insert(),
+                         {'run_id': run_id,
+                          'run_name': 'bench_{}'.format(run_id)})
+
+            for d in range(0, days):
+                rows = []
+                for i, v in enumerate(variables):
+                    for basin_id in basins.values():
+                        for elev in list(edges) + ['total']:
+                            rows.append({'basin_id': basin_id,
+                                         'run_id': run_id,
+                                         'date_time': start + timedelta(days=d),
+                                         'variable': v,
+                                         'variable_id': i + 1,
+                                         'value': float(rng.rand()),
+                                         'elevation': str(elev)})
+
+                conn.execute(Results.__table__.insert(), rows)
+
+
+def run_queries(connector, db, plotorder, basins, start, end, edges, n=5):
+    """ Mean collect() and results_index() times. """
+
+    times = {}
+    basins = dict((b, {'basin_id': i}) for b, i in basins.items())
+
+    for method in ['end', 'sum', 'difference', 'daily']:
+        e = edges if method != 'daily' else 'total'
+        t0 = time.time()
+        for i in range(0, n):
+            collect(connector, plotorder, basins, start, end, 'swe_vol',
+                    'bench_1', e, method)
+        times['collect {}'.format(method)] = (time.time() - t0) / n
+
+    t0 = time.time()
+    for i in range(0, n):
+        db.results_index('bench_1', end, end)
+    times['results_index'] = (time.time() - t0) / n
+
+    return times
+
+
+def report(label, times, plans):
+
+    print('\n{}'.format(label))
+    for name, t in times.items():
+        print('  {:<20} {:.4f} s'.format(name, t))
+        for row in plans[name]:
+            print('      {}'.format(row))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark Results indexes')
+    parser.add_argument('--basins', type=int, default=8)
+    parser.add_argument('--bands', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    connector = 'sqlite:///' + path
+
+    variables = ['swe_z', 'swe_vol', 'swi_vol', 'depth', 'density',
+                 'precip_vol']
+    plotorder = ['Basin {}'.format(i) for i in range(0, args.basins)]
+    basins = dict((b, i + 1) for i, b in enumerate(plotorder))
+    edges = [int(e) for e in np.arange(0, args.bands) * 500 + 1000]
+    start = datetime(2018, 10, 1, 23)
+    end = start + timedelta(days=args.days - 1)
+
+    make_results(connector, basins, edges, variables, start, args.days,
+                 args.runs)
+
+    # make the database look like one from before the composite indexes
+    engine = get_engine(connector)
+    for index in Results.__table__.indexes:
+        if index.name in ('ix_Results_run_variable_basin',
+                          'ix_Results_run_date_basin'):
+            index.drop(bind=engine)
+
+    with engine.connect() as conn:
+        conn.execute('ANALYZE')
+
+    configure_result_cache(enabled=False)
+    db = Database(db_type='sqlite', database=connector)
+    db.make_connection()
+
+    args_explain = (connector, 'bench_1', list(basins.values()), start, end,
+                    edges)
+
+    report('Before migrate()',
+           run_queries(connector, db, plotorder, basins, start, end, edges),
+           explain(*args_explain))
+
+    migrate(connector)
+
+    report('After migrate()',
+           run_queries(connector, db, plotorder, basins, start, end, edges),
+           explain(*args_explain))
+
+
+if __name__ == '__main__':
+    main()
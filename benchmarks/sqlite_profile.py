@@ -0,0 +1,110 @@
+"""
+Write and read throughput of the [database] sqlite_profile options on the
+tests/lakes workload: each day writes the Results for the Lakes Basin
+elevation bands with package() and the precip Inputs rows from the gold
+smrf outputs with package_inputs(), as Process does, and then each day is
+read back with collect().
+
+Example:
+    python benchmarks/sqlite_profile.py
+    python benchmarks/sqlite_profile.py --days 365 --dir /path/on/ops/disk
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from snowav.database.database import collect, configure_result_cache, \
+    configure_sqlite, get_engine, package, package_inputs, sqlite_profiles
+from snowav.database.tables import RunMetadata
+from snowav.utils.utilities import input_summary, masks
+
+lakes = os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
+                                     'tests', 'lakes'))
+variables = ['swi_z', 'swi_vol', 'evap_z', 'swe_z', 'swe_vol', 'swe_avail',
+             'swe_unavail', 'depth', 'density', 'coldcont', 'precip_z',
+             'precip_vol', 'rain_z']
+edges = [8000, 9000, 10000, 11000]
+
+
+def run(path, profile, days):
+    """ Write and read days of results with a profile. """
+
+    configure_sqlite(profile)
+    connector = 'sqlite:///' + os.path.join(path, '{}.db'.format(profile))
+    engine = get_engine(connector)
+
+    with engine.begin() as conn:
+        conn.execute(RunMetadata.__table__.insert(),
+                     {'run_id': 1, 'run_name': 'bench'})
+
+    out = masks(os.path.join(lakes, 'topo', 'topo.nc'), False)
+    basin = out['plotorder'][0]
+    basins = {basin: {'basin_id': 1}}
+    vid = dict((v, i + 1) for i, v in enumerate(variables))
+    precip_path = os.path.join(lakes, 'gold', 'data', 'data20190402',
+                               'smrfOutputs', 'precip.nc')
+    inputs = input_summary(precip_path, 'precip', ['nanmean', 'nanpercentile'],
+                           [25, 75], {basin: out['masks'][basin]['mask']},
+                           {basin: 1}, 'bench', 1, unit='mm')
+
+    rng = np.random.RandomState(0)
+    start = datetime(2018, 10, 1, 23)
+    dates = [start + timedelta(days=d) for d in range(0, days)]
+    nrows = 0
+
+    t0 = time.time()
+    for date in dates:
+        results = {}
+        for v in variables:
+            results[v] = pd.DataFrame(rng.rand(len(edges) + 1, 1),
+                                      index=edges + ['total'],
+                                      columns=[basin])
+        package(connector, basins, results, 1, vid, date, 'bench')
+
+        shift = date - datetime(2019, 4, 2)
+        rows = [dict(r, date_time=r['date_time'] + shift) for r in inputs]
+        package_inputs(connector, rows)
+        nrows += len(variables) * (len(edges) + 1) + len(rows)
+    t_write = time.time() - t0
+
+    t0 = time.time()
+    for date in dates:
+        collect(connector, [basin], basins, start, date, 'swe_vol', 'bench',
+                edges + ['total'], 'end')
+    t_read = time.time() - t0
+
+    return nrows / t_write, days / t_read
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark sqlite profiles')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--dir', default=None,
+                        help='directory for the databases, default is a '
+                             'temporary directory')
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(dir=args.dir)
+    configure_result_cache(enabled=False)
+
+    try:
+        for profile in sorted(sqlite_profiles.keys()):
+            write, read = run(path, profile, args.days)
+            print('{:>8}: write {:.0f} rows/s, read {:.0f} collect()/s'.format(
+                profile, write, read))
+
+    finally:
+        configure_sqlite()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Compare the per-basin, per-elevation band utilities.calculate() loop that
+Process used to run against a single ZonalStats pass.
+
+Example:
+    python benchmarks/zonal_stats.py --nrows 1500 --ncols 1500 --basins 8
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from snowav.utils.utilities import calculate
+from snowav.utils.zonal_stats import ZonalStats
+
+
+def synthetic(nrows, ncols, nbasins, step, seed=0):
+    """ Synthetic dem, masks and swe_z image. """
+
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:nrows, 0:ncols]
+    dem = 1500 + 2500 * (x / ncols) + 500 * np.sin(y / 50.0)
+
+    masks = {'Basin': {'mask': np.ones((nrows, ncols)), 'label': 'Basin'}}
+    bounds = np.linspace(0, ncols, nbasins)
+    for i in range(0, nbasins - 1):
+        mask = np.zeros((nrows, ncols))
+        mask[:, int(bounds[i]):int(bounds[i + 1])] = 1
+        masks['Sub {}'.format(i)] = {'mask': mask, 'label': 'Sub {}'.format(i)}
+
+    swe = np.clip(rng.normal(300, 200, (nrows, ncols)), 0, None)
+    cold = rng.normal(-1e6, 1e6, (nrows, ncols))
+
+    edges = np.arange(np.min(dem) - step, np.max(dem), step)
+    ixd = np.digitize(dem, np.arange(np.min(dem), np.max(dem) + step, step))
+
+    return dem, masks, swe, cold, edges, ixd
+
+
+def loop(masks, ixd, edges, swe, cold, pixel, cclimit):
+    """ swe_z values the way Process calculated them before ZonalStats. """
+
+    out = {}
+    snow_mask = swe > 0
+    avail_mask = cold > cclimit
+    unavail_mask = cold <= cclimit
+
+    for name in masks:
+        mask = masks[name]['mask']
+        elevbin = ixd * mask
+
+        for n in np.arange(0, len(edges)):
+            elev_mask = elevbin == n
+            be = [mask, elev_mask]
+            out[(name, n, 'unavail')] = calculate(
+                swe, pixel, [mask, elev_mask, snow_mask, unavail_mask],
+                'sum', 'volume')
+            out[(name, n, 'avail')] = calculate(
+                swe, pixel, [mask, elev_mask, snow_mask, avail_mask],
+                'sum', 'volume')
+            out[(name, n, 'vol')] = calculate(swe, pixel, be, 'sum', 'volume')
+            out[(name, n, 'z')] = calculate(swe, pixel, be, 'mean', 'depth')
+
+    return out
+
+
+def zonal(zs, swe, cold, cclimit):
+    """ swe_z values with ZonalStats. """
+
+    snow_mask = swe > 0
+    avail_mask = cold > cclimit
+    unavail_mask = cold <= cclimit
+
+    out = {'unavail': zs.calculate(swe, 'sum', 'volume',
+                                   where=snow_mask & unavail_mask,
+                                   total_where=unavail_mask),
+           'avail': zs.calculate(swe, 'sum', 'volume',
+                                 where=snow_mask & avail_mask,
+                                 total_where=avail_mask),
+           'vol': zs.calculate(swe, 'sum', 'volume'),
+           'z': zs.calculate(swe, 'mean', 'depth')}
+
+    return out
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark ZonalStats')
+    parser.add_argument('--nrows', type=int, default=1000)
+    parser.add_argument('--ncols', type=int, default=1000)
+    parser.add_argument('--basins', type=int, default=6)
+    parser.add_argument('--step', type=int, default=500)
+    parser.add_argument('--days', type=int, default=3)
+    args = parser.parse_args()
+
+    pixel = 50
+    cclimit = -5 * 1000 * 1000
+    dem, masks, swe, cold, edges, ixd = synthetic(args.nrows, args.ncols,
+                                                  args.basins, args.step)
+
+    print('{} x {}, {} basins, {} elevation bands, {} days'.format(
+        args.nrows, args.ncols, len(masks), len(edges), args.days))
+
+    t0 = time.time()
+    for d in range(0, args.days):
+        old = loop(masks, ixd, edges, swe, cold, pixel, cclimit)
+    t_loop = time.time() - t0
+
+    t0 = time.time()
+    zs = ZonalStats(masks, ixd, edges, pixel)
+    t_index = time.time() - t0
+
+    t0 = time.time()
+    for d in range(0, args.days):
+        new = zonal(zs, swe, cold, cclimit)
+    t_zonal = time.time() - t0
+
+    diff = 0
+    for (name, n, k), value in old.items():
+        if not np.isclose(value, new[k].loc[edges[n], name], equal_nan=True):
+            diff += 1
+
+    print('calculate() loop: {:.2f} s/day'.format(t_loop / args.days))
+    print('ZonalStats:       {:.3f} s/day (+{:.3f} s index)'.format(
+        t_zonal / args.days, t_index))
+    print('speedup:          {:.1f}x'.format(t_loop / t_zonal))
+    print('mismatched values: {}'.format(diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ import os
 from snowav.framework.framework import Snowav
 from snowav.framework.process_day import process
 from snowav.framework.point_values import run_point_values
+from snowav.database.migrate import migrate
+from snowav.framework.consolidate import consolidate
 from snowav.plotting.swe_volume import swe_volume
 from snowav.plotting.image_change import image_change
 from snowav.plotting.plotlims import plotlims as plotlims
@@ -22,6 +24,10 @@ def run():
                         help='End date that will override what is given in the'
                              ' config file, intended for airflow application.')
 
+    parser.add_argument('-n', '--processes', dest='processes', type=int,
+                        help='Number of processes for output statistics, '
+                             'overrides the config [run] processes.')
+
     parser.add_argument('-t', '--topo_path', dest='topo_path', type=str,
                         help='Path to topo.nc file.')
 
@@ -60,19 +66,40 @@ def run():
                         default=False, help='Make a blank example csv file '
                                             'for [basin] locations_csv')
 
+    parser.add_argument('--migrate', dest='migrate_db', type=str,
+                        help='sqlite database path or database connector to '
+                             'add any missing snowav indexes to.')
+
+    parser.add_argument('--consolidate', dest='consolidate', type=str,
+                        help='AWSM runs directory to build or append to a '
+                             'water year cube from, must also include '
+                             '--cube.')
+
+    parser.add_argument('--cube', dest='cube', type=str,
+                        help='Water year cube file for --consolidate.')
+
+    parser.add_argument('--cube_tile', '--cube-tile', dest='cube_tile',
+                        type=int, default=None,
+                        help='Chunk the --consolidate cube in tiles of this '
+                             'many pixels, default is the full grid.')
+
     args = parser.parse_args()
-    snowav_main(config_file=args.snowav_config, topo_path=args.topo_path,
+    snowav_main(config_file=args.snowav_config, processes=args.processes,
+                topo_path=args.topo_path,
                 nc_path=args.nc_path, value=args.value, snow_a=args.snow_a,
                 snow_b=args.snow_b, figs_path=args.figs_path,
                 point_values_config=args.point_values_config,
                 point_values_master=args.point_values_master,
-                blank=args.blank)
+                blank=args.blank, migrate_db=args.migrate_db,
+                consolidate_dir=args.consolidate, cube=args.cube,
+                cube_tile=args.cube_tile)
 
 
 def snowav_main(config_file=None, topo_path=None, nc_path=None, value=None,
                 snow_a=None, snow_b=None, figs_path=None,
                 point_values_config=None, point_values_master=None,
-                blank=None):
+                blank=None, processes=None, migrate_db=None,
+                consolidate_dir=None, cube=None, cube_tile=None):
     """ Command line function for snowav.
 
     Runs the standard snowav processing of AWSM files if config_file is
@@ -80,6 +107,30 @@ def snowav_main(config_file=None, topo_path=None, nc_path=None, value=None,
 
     """
 
+    # add missing indexes to an existing database
+    if migrate_db is not None:
+        if '://' not in migrate_db:
+            if not os.path.isfile(migrate_db):
+                raise Exception('Invalid database {} '.format(migrate_db))
+            migrate_db = 'sqlite:///' + os.path.abspath(migrate_db)
+
+        migrate(migrate_db, create_log())
+
+    # build or append to a water year cube
+    if consolidate_dir is not None:
+        if not os.path.isdir(consolidate_dir):
+            raise Exception('Invalid directory {} '.format(consolidate_dir))
+
+        if cube is None:
+            raise Exception('--consolidate must also include --cube')
+
+        run_dirs = [os.path.join(consolidate_dir, d)
+                    for d in sorted(os.listdir(consolidate_dir))
+                    if os.path.isdir(os.path.join(consolidate_dir, d))]
+
+        consolidate(run_dirs, os.path.abspath(cube), tile=cube_tile,
+                    logger=create_log())
+
     # standard snowav processing
     if config_file is not None:
         if not os.path.isfile(config_file):
@@ -87,7 +138,8 @@ def snowav_main(config_file=None, topo_path=None, nc_path=None, value=None,
         else:
             end_date = None
 
-        Snowav(config_file=config_file, end_date=end_date)
+        Snowav(config_file=config_file, end_date=end_date,
+               processes=processes)
 
     # point values processing
     point_values_args = [point_values_config, blank]
@@ -11,10 +11,12 @@ from inicheck.tools import get_user_config, check_config, cast_all_variables
 from inicheck.output import generate_config, print_config_report
 from inicheck.config import MasterConfig
 import snowav
-from snowav.utils.utilities import masks, get_snowav_path
+from snowav.utils.utilities import crop_window, masks, get_snowav_path, \
+    load_totals, totals_path
 from snowav.utils.get_topo_stats import get_topo_stats
+from snowav.utils.zonal_stats import zonal_stats
 from snowav.framework.outputs import outputs
-from snowav.database.database import connect
+from snowav.database.database import connect, configure_sqlite, last_date
 from snowav.database.models import AwsmInputsOutputs
 from snowav.utils.wyhr import handle_year_stradling, calculate_date_from_wyhr
 
@@ -27,9 +29,11 @@ class UserConfig(object):
     config_file: file path
     awsm: awsm object
     end_date: string
+    processes: int, overrides [run] processes
     """
 
-    def __init__(self, config_file, awsm=None, end_date=None):
+    def __init__(self, config_file, awsm=None, end_date=None,
+                 processes=None):
 
         print('Reading {} and loading files...'.format(config_file))
 
@@ -63,11 +67,52 @@ class UserConfig(object):
         self.plotorder = ucfg.cfg['snowav']['masks']
         self.plotlabels = ucfg.cfg['snowav']['plotlabels']
         self.report_only = ucfg.cfg['snowav']['report_only']
+        self.cache_dir = ucfg.cfg['snowav']['cache_dir']
+
+        if self.cache_dir is None:
+            self.cache_dir = os.path.join(self.save_path, 'cache')
+
+        self.output_cache_size = ucfg.cfg['snowav']['output_cache_size']
+        self.crop = ucfg.cfg['snowav']['crop']
+        self.dtype = np.dtype(ucfg.cfg['snowav']['dtype'])
+        self.mask_and_scale = ucfg.cfg['snowav']['mask_and_scale']
+        self.window = None
+
+        if ucfg.cfg['snowav']['precip_cache']:
+            self.precip_cache_dir = os.path.join(self.cache_dir, 'precip')
+        else:
+            self.precip_cache_dir = None
+
+        self.collect_cache = ucfg.cfg['snowav']['collect_cache']
+
+        if ucfg.cfg['snowav']['collect_disk_cache']:
+            self.collect_cache_dir = os.path.join(self.cache_dir, 'collect')
+        else:
+            self.collect_cache_dir = None
+
+        if ucfg.cfg['snowav']['output_disk_cache']:
+            self.output_cache_dir = os.path.join(self.cache_dir, 'outputs')
+        else:
+            self.output_cache_dir = None
 
         ####################################################
         #           run                                    #
         ####################################################
         self.dplcs = ucfg.cfg['run']['decimals']
+        self.processes = ucfg.cfg['run']['processes']
+
+        if processes is not None:
+            self.processes = int(processes)
+            self.tmp_log.append(' Overriding config processes with '
+                                '{} given with snowav call'.format(processes))
+
+        self.incremental = ucfg.cfg['run']['incremental']
+        self.cube = ucfg.cfg['run']['cube']
+        self.last_date = None
+        self.skip_before = None
+        self.totals_path = None
+        self.totals_names = []
+        self.totals = None
         self.start_date = ucfg.cfg['run']['start_date']
         self.end_date = ucfg.cfg['run']['end_date']
 
@@ -134,6 +179,12 @@ class UserConfig(object):
         self.db_overwrite = ucfg.cfg['database']['overwrite']
         self.properties = ucfg.cfg['database']['properties']
         self.sqlite = ucfg.cfg['database']['sqlite']
+        self.db_pool_size = ucfg.cfg['database']['pool_size']
+        self.db_max_overflow = ucfg.cfg['database']['max_overflow']
+        self.db_pool_recycle = ucfg.cfg['database']['pool_recycle']
+        self.db_pool_pre_ping = ucfg.cfg['database']['pool_pre_ping']
+        self.sqlite_profile = ucfg.cfg['database']['sqlite_profile']
+        self.db_write_queue = ucfg.cfg['database']['write_queue']
 
         base_bands = ['swi_z', 'evap_z', 'swe_z', 'depth', 'density',
                       'coldcont', 'precip_z']
@@ -517,6 +568,7 @@ class UserConfig(object):
                     plotlabels=self.plotlabels)
 
         self.dem = out['dem']
+        self.topo_dem = out['dem']
         self.veg_type = out['veg_type']
         self.masks = out['masks']
         self.nrows = out['nrows']
@@ -527,7 +579,27 @@ class UserConfig(object):
         for log in out['logger']:
             self.tmp_log.append(log)
 
-        # Establish database connection
+        # with [snowav] crop, images are read and kept only over the rows and
+        # columns that contain the masks
+        if self.crop:
+            self.window = crop_window(self.masks)
+            self.dem = self.dem[self.window]
+            self.veg_type = self.veg_type[self.window]
+
+            for name in self.masks:
+                self.masks[name]['mask'] = self.masks[name]['mask'][self.window]
+
+            self.tmp_log.append(' [snowav] crop: True, reading rows {}:{} and '
+                                'columns {}:{} of {} x {}'.format(
+                                    self.window[0].start, self.window[0].stop,
+                                    self.window[1].start, self.window[1].stop,
+                                    self.nrows, self.ncols))
+
+            self.nrows, self.ncols = self.dem.shape
+
+        # Establish database connection, every sqlite connection from here
+        # on uses the [database] sqlite_profile
+        configure_sqlite(self.sqlite_profile)
         self.basins, cnx, out = connect(sqlite=self.sqlite, sql=self.mysql,
                                         plotorder=self.plotorder, user=self.db_user,
                                         password=self.db_password, host=self.db_host,
@@ -538,6 +610,52 @@ class UserConfig(object):
         for log in out:
             self.tmp_log.append(log)
 
+        # with [run] incremental, only days after the last date on the
+        # database for run_name are processed
+        if self.incremental:
+            self.last_date = last_date(self.connector, self.run_name)
+
+            if self.last_date is None:
+                self.tmp_log.append(' [run] incremental: True, no database '
+                                    'records for run_name {}, processing all '
+                                    'days'.format(self.run_name))
+            else:
+                self.tmp_log.append(' [run] incremental: True, processing days '
+                                    'after {} for run_name '
+                                    '{}'.format(self.last_date, self.run_name))
+
+            # the swi and precip_depth figures sum images over the report
+            # period, the totals for the days up to the last run are saved
+            # in cache_dir so that those days don't need to be read again
+            if self.precip_depth_flag:
+                self.totals_names = ['precip', 'rain', 'swi', 'swi_last']
+            elif self.swi_flag:
+                self.totals_names = ['swi', 'swi_last']
+
+            self.totals_path = totals_path(self.cache_dir, self.connector,
+                                           self.run_name, self.start_date,
+                                           self.window)
+
+            if not self.totals_names:
+                self.skip_before = self.last_date
+
+            elif self.last_date is not None:
+                self.totals = load_totals(self.totals_path, self.start_date,
+                                          (self.nrows, self.ncols),
+                                          self.last_date, self.totals_names)
+
+                if (self.totals is not None and self.end_date is not None and
+                        self.totals['date'] > self.end_date):
+                    self.totals = None
+
+                if self.totals is None:
+                    self.tmp_log.append(' [run] incremental: True, no totals '
+                                        'for the swi and precip_depth '
+                                        'figures in {}, reading every '
+                                        'day'.format(self.cache_dir))
+                else:
+                    self.skip_before = self.totals['date']
+
         if self.loglevel == 'DEBUG':
             for basin in self.basins:
                 self.tmp_log.append(' {}: {}'.format(basin, self.basins[basin]))
@@ -549,6 +667,16 @@ class UserConfig(object):
             topo = get_topo_stats(sfile)
             self.snow_x = topo['x']
             self.snow_y = topo['y']
+
+            # with [snowav] crop, stn_validate still locates stations on the
+            # full topo grid
+            self.topo_x = topo['x']
+            self.topo_y = topo['y']
+
+            if self.window is not None:
+                self.snow_x = self.snow_x[self.window[1]]
+                self.snow_y = self.snow_y[self.window[0]]
+
             self.pixel = int(topo['dv'])
 
             ncf = nc.Dataset(sfile)
@@ -586,6 +714,7 @@ class UserConfig(object):
             self.conversion_factor = ((self.pixel ** 2) * 0.000000810713194 * 0.001)
             self.depth_factor = 0.03937
             self.dem = self.dem * 3.28
+            self.topo_dem = self.topo_dem * 3.28
             self.depthlbl = 'in'
             self.vollbl = self.units
             self.elevlbl = 'ft'
@@ -610,11 +739,21 @@ class UserConfig(object):
         self.ixd = np.digitize(self.dem, edges)
         self.xlims = (0, len(edges))
 
+        # basin and elevation band zone index, cached by topo.nc and bins
+        self.zonal = zonal_stats(self.masks, self.ixd, self.edges, self.pixel,
+                                 units=self.units, decimals=self.dplcs,
+                                 dempath=self.dempath, bins=edges,
+                                 cache_dir=self.cache_dir,
+                                 logger=self.tmp_log)
+
         if self.loglevel == 'DEBUG' and self.log_to_file is not True:
             print('Reading files in {}...'.format(self.run_dirs[0].split('runs')[0]))
 
         results = outputs(self.run_dirs, self.wy, self.properties,
-                          self.start_date, self.end_date, None, self.loglevel)
+                          self.start_date, self.end_date, None, self.loglevel,
+                          self.output_cache_size, self.output_cache_dir,
+                          self.window, self.cube, self.dtype,
+                          self.mask_and_scale, self.skip_before)
 
         out = results['outputs']
         all_dirs = results['dirs']
@@ -729,7 +868,10 @@ class UserConfig(object):
                       '...'.format(self.run_dirs[0].split('runs')[0]))
 
             results = outputs(self.all_dirs_flt, self.wy, self.properties,
-                              None, None, flight_dates, self.loglevel)
+                              None, None, flight_dates, self.loglevel,
+                              self.output_cache_size, self.output_cache_dir,
+                              self.window, self.cube, self.dtype,
+                              self.mask_and_scale)
 
             self.flight_outputs = results['outputs']
             self.run_dirs_flt = results['run_dirs']
@@ -738,7 +880,10 @@ class UserConfig(object):
             self.pre_flight_outputs = results['outputs']
 
             results = outputs(self.all_dirs_flt, self.wy, self.properties,
-                              None, None, pre_flight_dates, self.loglevel)
+                              None, None, pre_flight_dates, self.loglevel,
+                              self.output_cache_size, self.output_cache_dir,
+                              self.window, self.cube, self.dtype,
+                              self.mask_and_scale)
 
             self.pre_flight_outputs = results['outputs']
 
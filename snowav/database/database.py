@@ -1,20 +1,23 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 from itertools import count, filterfalse
 import mysql.connector
 import numpy as np
 import os
 import pandas as pd
 import sqlalchemy as sa
-from sqlalchemy import create_engine, and_
+from sqlalchemy import create_engine, and_, or_
 from sqlalchemy.orm import sessionmaker
 from sys import exit
+import time
 import urllib.parse
+import uuid
 import warnings
 
 from snowav.database import tables as ta
 import snowav
 from snowav.database.tables import Base, RunMetadata, Watershed, Basin, \
-    Results, VariableUnits
+    Results, VariableUnits, Inputs, Pixels, PixelsData
 
 # Fix these two by pulling smrf and awsm versions from netcdf
 try:
@@ -46,10 +49,19 @@ class Database(object):
     host {string}: database host, if using db_type='sql'
     port {string}: database port, if using db_type='sql'
     database {string}: sqlite database file path, if using db_type='sqlite'
+    pool_size {int}: connections kept in the pool, if using db_type='sql'
+    max_overflow {int}: connections allowed beyond pool_size, if using
+        db_type='sql'
+    pool_recycle {int}: [s] connection age to replace them at, if using
+        db_type='sql'
+    pool_pre_ping {bool}: check connections when taken from the pool, if
+        using db_type='sql'
     """
 
     def __init__(self, db_type='sql', db_name='snowav', user=None,
-                 password=None, host=None, port=None, database=None):
+                 password=None, host=None, port=None, database=None,
+                 pool_size=5, max_overflow=10, pool_recycle=3600,
+                 pool_pre_ping=True):
 
         db_type_options = ['sql', 'sqlite']
         if db_type not in db_type_options:
@@ -72,6 +84,11 @@ class Database(object):
         self.port = port
         self.db_name = db_name
         self.database = database
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self.pool_pre_ping = pool_pre_ping
+        self.tables = {}
 
     def assign_vars(self, kwargs):
         """ Assign Database attributes.
@@ -88,15 +105,19 @@ class Database(object):
             setattr(self, item, v)
 
     def make_connection(self, logger=None):
-        """ Make and check database connection.
+        """ Make and check database connection. The engine and its
+        connection pool are shared with the other snowav database functions
+        that use the same connector.
 
-        Assigns self.engine
+        Assigns self.engine, self.connector and self.session_maker
 
         Args
         ------
         logger {class}: logger
         """
 
+        options = {}
+
         if self.db_type == 'sql':
             connector = '{}{}:{}@{}:{}/{}'.format('mysql+mysqlconnector://',
                                                   self.user,
@@ -104,6 +125,13 @@ class Database(object):
                                                   self.host,
                                                   self.port,
                                                   self.db_name)
+
+            # sqlite file databases don't use a QueuePool
+            options = {'pool_size': self.pool_size,
+                       'max_overflow': self.max_overflow,
+                       'pool_recycle': self.pool_recycle,
+                       'pool_pre_ping': self.pool_pre_ping}
+
             if logger is not None:
                 logger.info(" Using database connection "
                             "{}@{}:{}".format(self.user, self.host, self.port))
@@ -114,11 +142,21 @@ class Database(object):
                 logger.info(" Using database connector: {}".format(connector))
 
         try:
-            engine = create_engine(connector)
-        except Exception as e:
-            print(e)
+            engine = get_engine(connector, **options)
+        except Exception:
+            if logger is not None:
+                if self.db_type == 'sql':
+                    name = '{}@{}:{}'.format(self.user, self.host, self.port)
+                else:
+                    name = connector
+
+                logger.error(" Failed making database connection "
+                             "{}".format(name))
+            raise
 
-        self.assign_vars({'engine': engine})
+        self.assign_vars({'engine': engine,
+                          'connector': connector,
+                          'session_maker': sessionmaker(bind=engine)})
 
     def check_tables(self, logger=None):
         """ Make database tables.
@@ -137,25 +175,37 @@ class Database(object):
         Base.metadata.create_all(self.engine)
 
     def insert(self, dbtable, kwargs, logger=None):
-        """ Put data on database.
+        """ Put data on database. A list of rows is written with a single
+        executemany in one transaction.
 
         Args
         ------
         dbtable {string}: string format of database table name (i.e., 'Pixels')
-        kwargs {dict}: data to put on the database {field: value}
+        kwargs {dict}: data to put on the database {field: value}, or a list
+            of them with the same fields
         logger {class}: logger
+
+        Returns
+        ------
+        key {list}: primary key of the inserted row, if kwargs is a dict
         """
 
-        if type(kwargs) != dict:
-            raise TypeError("kwargs must be a dict")
+        if isinstance(kwargs, list):
+            rows = kwargs
+        elif type(kwargs) == dict:
+            rows = [kwargs]
+        else:
+            raise TypeError("kwargs must be a dict or list of dicts")
+
+        if not rows:
+            return None
 
-        # get database table
-        tbl = sa.Table(dbtable, sa.MetaData(), autoload_with=self.engine)
+        tbl = self.table(dbtable)
 
         # table columns
         fields = list(tbl.columns.keys())
 
-        for key in kwargs:
+        for key in rows[0]:
             if key not in fields:
                 if logger is not None:
                     logger.warning(" kwargs field '{}' not in table columns "
@@ -164,8 +214,37 @@ class Database(object):
                     print("query() kwargs field '{}' not in table columns "
                           "{}".format(key, fields))
 
-        with self.engine.connect() as dbcon:
-            dbcon.execute(tbl.insert(), kwargs)
+        with self.engine.begin() as dbcon:
+            result = dbcon.execute(tbl.insert(), kwargs)
+
+        if isinstance(kwargs, list):
+            return None
+
+        return list(result.inserted_primary_key)
+
+    def table(self, dbtable):
+        """ Get a reflected database table, reflecting it on first use.
+
+        Args
+        ------
+        dbtable {string}: string format of database table name (i.e., 'Pixels')
+
+        Returns
+        ------
+        tbl {class}: sqlalchemy Table
+        """
+
+        if dbtable not in self.tables:
+            self.tables[dbtable] = sa.Table(dbtable, sa.MetaData(),
+                                            autoload_with=self.engine)
+
+        return self.tables[dbtable]
+
+    @property
+    def stats(self):
+        """ QueryStats for the database connection. """
+
+        return query_stats(self.connector)
 
     def query(self, params):
         """ Query the database.
@@ -205,8 +284,7 @@ class Database(object):
         if ntables < 1 or ntables > 2:
             raise ValueError("params must have <= 2 unique tables")
 
-        dbsession = sessionmaker(bind=self.engine)
-        session = dbsession()
+        session = self.session_maker()
 
         n = 0
         td = {}
@@ -224,9 +302,9 @@ class Database(object):
                     raise Exception('Invalid filter column: %s' % key)
                 if op == 'in':
                     if isinstance(value, list):
-                        filt = column.in_(value)
+                        t = column.in_(value)
                     else:
-                        filt = column.in_(value.split(','))
+                        t = column.in_(value.split(','))
                 else:
                     try:
                         attr = list(filter(
@@ -238,11 +316,14 @@ class Database(object):
                     if value == 'null':
                         value = None
 
-                    if n == 0:
-                        filt = getattr(column, attr)(value)
-                    else:
-                        t = getattr(column, attr)(value)
-                        filt = and_(filt, t)
+                    t = getattr(column, attr)(value)
+
+                # 'in' filters are combined with the others, rather than
+                # replacing them
+                if n == 0:
+                    filt = t
+                else:
+                    filt = and_(filt, t)
 
                 n += 1
 
@@ -264,8 +345,7 @@ class Database(object):
                               }
         """
 
-        dbsession = sessionmaker(bind=self.engine)
-        session = dbsession()
+        session = self.session_maker()
 
         n = 0
         td = {}
@@ -283,9 +363,9 @@ class Database(object):
                     raise Exception('Invalid filter column: %s' % key)
                 if op == 'in':
                     if isinstance(value, list):
-                        filt = column.in_(value)
+                        t = column.in_(value)
                     else:
-                        filt = column.in_(value.split(','))
+                        t = column.in_(value.split(','))
                 else:
                     try:
                         attr = list(filter(
@@ -297,22 +377,358 @@ class Database(object):
                     if value == 'null':
                         value = None
 
-                    if n == 0:
-                        filt = getattr(column, attr)(value)
-                    else:
-                        t = getattr(column, attr)(value)
-                        filt = and_(filt, t)
+                    t = getattr(column, attr)(value)
+
+                # 'in' filters are combined with the others, rather than
+                # replacing them
+                if n == 0:
+                    filt = t
+                else:
+                    filt = and_(filt, t)
 
                 n += 1
 
         session.query(list(params.keys())[0]).filter(filt).delete(synchronize_session=False)
         session.commit()
         session.close()
+        _result_cache.invalidate(self.connector)
+
+    def results_index(self, run_name, start_date=None, end_date=None):
+        """ Get the Results records that exist for a run_name, in a single
+        query.
+
+        Args
+        ------
+        run_name {str}: snowav run_name
+        start_date {datetime}: optional first date_time
+        end_date {datetime}: optional last date_time
+
+        Returns
+        ------
+        records {set}: (date_time, basin_id, variable, run_id) tuples
+        """
+
+        qry = results_index_query(run_name, start_date, end_date)
+
+        with self.engine.connect() as dbcon:
+            rows = dbcon.execute(qry).fetchall()
+
+        records = set((pd.Timestamp(r[0]).to_pydatetime(), int(r[1]), r[2],
+                       int(r[3])) for r in rows)
+
+        return records
+
+    def inputs_index(self, run_name, start_date=None, end_date=None):
+        """ Get the days that have Inputs records for a run_name, in a single
+        query.
+
+        Args
+        ------
+        run_name {str}: snowav run_name
+        start_date {datetime}: optional first date_time
+        end_date {datetime}: optional last date_time
+
+        Returns
+        ------
+        records {set}: (date, basin_id, variable) tuples
+        """
+
+        filt = Inputs.run_name == run_name
+
+        if start_date is not None:
+            filt = and_(filt, Inputs.date_time >= start_date)
+
+        if end_date is not None:
+            filt = and_(filt, Inputs.date_time <= end_date)
+
+        qry = sa.select([Inputs.date_time, Inputs.basin_id,
+                         Inputs.variable]).where(filt)
+        qry = qry.distinct()
+
+        with self.engine.connect() as dbcon:
+            rows = dbcon.execute(qry).fetchall()
+
+        records = set((pd.Timestamp(r[0]).date(), int(r[1]), r[2])
+                      for r in rows)
+
+        return records
+
+    def pixels_index(self, points, start_date, end_date):
+        """ Get the Pixels that have PixelsData records in a date range for
+        point value locations, in a single query.
+
+        Args
+        ------
+        points {list}: (model_row, model_col, location, description, name)
+            tuples
+        start_date {datetime}: first date_time
+        end_date {datetime}: last date_time
+
+        Returns
+        ------
+        records {dict}: Pixels ids by point tuple
+        """
+
+        records = {}
+
+        if not points:
+            return records
+
+        qry = sa.select([Pixels.id, Pixels.model_row, Pixels.model_col,
+                         Pixels.location, Pixels.description,
+                         Pixels.name]).where(and_(
+                             Pixels.id == PixelsData.pixel_id,
+                             PixelsData.date_time >= start_date,
+                             PixelsData.date_time <= end_date,
+                             Pixels.model_row.in_(
+                                 sorted(set(p[0] for p in points))),
+                             Pixels.model_col.in_(
+                                 sorted(set(p[1] for p in points)))))
+
+        with self.engine.connect() as dbcon:
+            rows = dbcon.execute(qry.distinct()).fetchall()
+
+        points = set(points)
+
+        for r in rows:
+            key = (int(r[1]), int(r[2]), r[3], r[4], r[5])
+            if key in points:
+                records.setdefault(key, set()).add(int(r[0]))
+
+        return records
+
+
+def results_index_query(run_name, start_date=None, end_date=None):
+    """ Query for Database.results_index().
+
+    Args
+    ------
+    run_name {str}: snowav run_name
+    start_date {datetime}: optional first date_time
+    end_date {datetime}: optional last date_time
+
+    Returns
+    ------
+    qry {class}: sqlalchemy select
+    """
+
+    filt = and_(Results.run_id == RunMetadata.run_id,
+                RunMetadata.run_name == run_name,
+                Results.run_id >= 0)
+
+    if start_date is not None:
+        filt = and_(filt, Results.date_time >= start_date)
+
+    if end_date is not None:
+        filt = and_(filt, Results.date_time <= end_date)
+
+    qry = sa.select([Results.date_time, Results.basin_id,
+                     Results.variable, Results.run_id]).where(filt)
+
+    return qry.distinct()
+
+
+def last_date(connector, run_name):
+    """ Last date_time with Results records for a run_name.
+
+    Args
+    ------
+    connector {str}: database connector
+    run_name {str}: snowav run_name
+
+    Returns
+    ------
+    date {datetime}: last date_time, or None if there are no records
+    """
+
+    qry = sa.select([sa.func.max(Results.date_time)]).where(and_(
+        Results.run_id == RunMetadata.run_id,
+        RunMetadata.run_name == run_name))
+
+    with get_engine(connector).connect() as conn:
+        date = conn.execute(qry).scalar()
+
+    if date is not None:
+        date = pd.Timestamp(date).to_pydatetime()
+
+    return date
+
+
+# engines by connector, so that each process makes one connection pool and
+# runs Base.metadata.create_all() once per database
+_engines = {}
+_engine_options = {}
+_sessionmakers = {}
+_query_stats = {}
+
+
+class QueryStats(object):
+    """ Count of statements executed on an engine and the time spent in
+    them, from sqlalchemy cursor execute events. An executemany counts as a
+    single statement.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Reset the count and time. """
+
+        self.queries = 0
+        self.time = 0.0
+
+    def listen(self, engine):
+        """ Add cursor execute event listeners to an engine.
+
+        Args
+        ------
+        engine {class}: sqlalchemy engine
+        """
+
+        sa.event.listen(engine, 'before_cursor_execute', self._before)
+        sa.event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context,
+                executemany):
+        conn.info.setdefault('query_start', []).append(time.time())
+
+    def _after(self, conn, cursor, statement, parameters, context,
+               executemany):
+        self.queries += 1
+        self.time += time.time() - conn.info['query_start'].pop()
+
+    def __str__(self):
+        return '{} database queries in {:.2f} s'.format(self.queries,
+                                                         self.time)
+
+
+# sqlite pragmas applied to every new connection, by profile, see
+# configure_sqlite()
+sqlite_profiles = {
+    'default': [],
+    'fast': [('journal_mode', 'WAL'),
+             ('synchronous', 'NORMAL'),
+             ('cache_size', -64000),
+             ('mmap_size', 268435456),
+             ('temp_store', 'MEMORY')]
+}
+_sqlite = {'profile': 'default'}
+
+
+def configure_sqlite(profile='default'):
+    """ Set the sqlite profile for connections that are made from here on.
+
+    'fast' uses write-ahead logging with synchronous=NORMAL, which only
+    syncs at checkpoints, a 64 MB page cache, 256 MB of memory-mapped I/O
+    and in-memory temporary tables. A crash or power loss can lose the
+    most recent transactions but does not corrupt the database. WAL
+    requires that every process using the database is on the same host, so
+    it should not be used for databases on network file systems.
+
+    Args
+    ------
+    profile {str}: options are 'default', 'fast'
+    """
+
+    if profile not in sqlite_profiles:
+        raise Exception('sqlite profile options are '
+                        '{}'.format(list(sqlite_profiles.keys())))
+
+    _sqlite['profile'] = profile
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    """ Apply the sqlite profile pragmas to a new connection. """
+
+    pragmas = sqlite_profiles[_sqlite['profile']]
+
+    if pragmas:
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas:
+            cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+        cursor.close()
+
+
+def get_engine(connector, **options):
+    """ Get the snowav database engine for a connector, creating it and the
+    snowav tables on first use. Engines are cached by connector, and are
+    only made again if different engine options are given.
+
+    Args
+    ------
+    connector {str}: database connector, either path to sqlite database or
+        mysqlconnector string
+    options: optional sqlalchemy create_engine() arguments, i.e.
+        pool_size, max_overflow, pool_recycle, pool_pre_ping
+
+    Returns
+    ------
+    engine {class}: sqlalchemy engine
+    """
+
+    if connector in _engines:
+        if not options or options == _engine_options[connector]:
+            return _engines[connector]
+
+        _engines.pop(connector).dispose()
+        _sessionmakers.pop(connector, None)
+
+    kwargs = dict(options)
+
+    # with the default NullPool every sqlite session opens the file again,
+    # so keep connections for profiles that set up pragmas and mmap
+    if (connector.startswith('sqlite') and sqlite_profiles[_sqlite['profile']]
+            and ':memory:' not in connector and connector != 'sqlite://'):
+        kwargs.setdefault('poolclass', sa.pool.QueuePool)
+        kwargs.setdefault('connect_args', {'check_same_thread': False})
+
+    try:
+        engine = create_engine(connector, **kwargs)
+    except:
+        raise Exception('Failed to make database connection with '
+                        '{}'.format(connector))
+
+    if engine.dialect.name == 'sqlite':
+        sa.event.listen(engine, 'connect', _sqlite_connect)
+
+    try:
+        Base.metadata.create_all(engine)
+    except:
+        raise Exception('Failed establishing Base for sqlalchemy')
+
+    if connector not in _query_stats:
+        _query_stats[connector] = QueryStats()
+
+    _query_stats[connector].listen(engine)
+
+    _engines[connector] = engine
+    _engine_options[connector] = options
+
+    return engine
+
+
+def query_stats(connector):
+    """ Get the QueryStats for a connector.
+
+    Args
+    ------
+    connector {str}: database connector
+
+    Returns
+    ------
+    stats {class}: QueryStats
+    """
+
+    if connector not in _query_stats:
+        _query_stats[connector] = QueryStats()
+
+    return _query_stats[connector]
 
 
 def make_session(connector):
     '''
-    Make snowav database session.
+    Make snowav database session, from the sessionmaker for the connector
+    engine.
 
     Args
     -------
@@ -326,18 +742,12 @@ def make_session(connector):
         snowav database session
     '''
 
-    try:
-        engine = create_engine(connector)
-    except:
-        raise Exception('Failed to make database connection with '
-                        '{}'.format(connector))
-    try:
-        Base.metadata.create_all(engine)
-    except:
-        raise Exception('Failed establishing Base for sqlalchemy')
+    engine = get_engine(connector)
+
+    if connector not in _sessionmakers:
+        _sessionmakers[connector] = sessionmaker(bind=engine)
 
-    DBSession = sessionmaker(bind=engine)
-    session = DBSession()
+    session = _sessionmakers[connector]()
 
     return session
 
@@ -369,12 +779,196 @@ def insert(connector, table, values):
     session.close()
 
 
+class ResultCache(object):
+    """ Memoized collect() results, in memory and optionally saved to
+    cache_dir, so that figures(), report() and write_properties() query the
+    database once for each distinct request.
+
+    Entries are invalidated for a connector and run_name with invalidate(),
+    which package() and delete() call when they write to the database. Saved
+    entries are checked against version files for the connector and
+    run_name in cache_dir, so writes from other snowav runs that use the
+    same cache_dir also invalidate them.
+
+    Args
+    ------
+    enabled {bool}: use the cache
+    cache_dir {str}: optional directory to save results to
+    """
+
+    def __init__(self, enabled=True, cache_dir=None):
+        self.configure(enabled, cache_dir)
+
+    def configure(self, enabled=True, cache_dir=None):
+        """ Set cache options, and clear the in-memory results.
+
+        Args
+        ------
+        enabled {bool}: use the cache
+        cache_dir {str}: optional directory to save results to
+        """
+
+        self.enabled = enabled
+        self.cache_dir = cache_dir
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, connector, run_name, plotorder, start_date, end_date,
+            value, edges, method):
+        """ Cache key for collect() arguments. """
+
+        if type(plotorder) != list:
+            plotorder = [plotorder]
+
+        if isinstance(edges, str):
+            edges = [edges]
+
+        return (connector, run_name, tuple(plotorder), str(start_date),
+                str(end_date), value, tuple(str(e) for e in edges), method)
+
+    def _hash(self, *args):
+        return hashlib.sha1('|'.join(str(a) for a in args).encode()).hexdigest()
+
+    def _version_path(self, connector, run_name):
+        return os.path.join(self.cache_dir, 'version_{}'.format(
+            self._hash(connector, run_name)))
+
+    def _version(self, connector, run_name):
+        """ Saved entry version, from the run_name and connector version
+        files. """
+
+        version = ''
+
+        for name in (run_name, None):
+            path = self._version_path(connector, name)
+
+            if os.path.isfile(path):
+                with open(path) as f:
+                    version += f.read()
+
+        return version
+
+    def get(self, key):
+        """ Get a cached result.
+
+        Args
+        ------
+        key {tuple}: from key()
+
+        Returns
+        ------
+        df {DataFrame}: cached result, or None
+        """
+
+        if not self.enabled:
+            return None
+
+        df = self.results.get(key)
+
+        if df is None and self.cache_dir is not None:
+            path = os.path.join(self.cache_dir,
+                                'collect_{}.pkl'.format(self._hash(*key)))
+
+            if os.path.isfile(path):
+                try:
+                    version, df = pd.read_pickle(path)
+                    if version != self._version(key[0], key[1]):
+                        df = None
+                except Exception:
+                    df = None
+
+            if df is not None:
+                self.results[key] = df
+
+        if df is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return df
+
+    def put(self, key, df):
+        """ Cache a result.
+
+        Args
+        ------
+        key {tuple}: from key()
+        df {DataFrame}: collect() result
+        """
+
+        if not self.enabled:
+            return
+
+        self.results[key] = df.copy()
+
+        if self.cache_dir is not None:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+
+            path = os.path.join(self.cache_dir,
+                                'collect_{}.pkl'.format(self._hash(*key)))
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            pd.to_pickle((self._version(key[0], key[1]), df), tmp)
+            os.replace(tmp, path)
+
+    def invalidate(self, connector, run_name=None):
+        """ Drop cached results for a connector and run_name, or for every
+        run_name if run_name is None.
+
+        Args
+        ------
+        connector {str}: database connector
+        run_name {str}: snowav run_name
+        """
+
+        for key in list(self.results.keys()):
+            if key[0] == connector and run_name in (None, key[1]):
+                del self.results[key]
+
+        if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            with open(self._version_path(connector, run_name), 'w') as f:
+                f.write(uuid.uuid4().hex)
+
+    def __str__(self):
+        return '{} collect() cache hits, {} misses'.format(self.hits,
+                                                           self.misses)
+
+
+_result_cache = ResultCache()
+
+
+def configure_result_cache(enabled=True, cache_dir=None):
+    """ Set the collect() result cache options.
+
+    Args
+    ------
+    enabled {bool}: use the cache
+    cache_dir {str}: optional directory to save results to
+
+    Returns
+    ------
+    cache {class}: ResultCache
+    """
+
+    _result_cache.configure(enabled, cache_dir)
+
+    return _result_cache
+
+
 def collect(connector, plotorder, basins, start_date, end_date, value,
             run_name, edges, method):
     '''
 
     Collect snowav database results into our standard dataframe with elevation
-    rows and subbasin columns.
+    rows and subbasin columns. All basins and elevation bands come from a
+    single query, and the 'end', 'sum' and 'difference' methods are
+    aggregated on the database.
+
+    Results are memoized in the result cache, so repeated calls with the
+    same arguments only query the database once, until package() or
+    delete() write to the database for that run_name. See
+    configure_result_cache().
 
     Args
     ---------
@@ -404,6 +998,22 @@ def collect(connector, plotorder, basins, start_date, end_date, value,
 
     '''
 
+    key = _result_cache.key(connector, run_name, plotorder, start_date,
+                            end_date, value, edges, method)
+    df = _result_cache.get(key)
+
+    if df is None:
+        df = _collect(connector, plotorder, basins, start_date, end_date,
+                      value, run_name, edges, method)
+        _result_cache.put(key, df)
+
+    return df.copy()
+
+
+def _collect(connector, plotorder, basins, start_date, end_date, value,
+             run_name, edges, method):
+    """ collect() from the database. """
+
     value_options = ['swe_z', 'swe_vol', 'density', 'precip', 'precip_z', 'precip_vol',
                      'rain_z', 'rain_vol', 'swe_avail', 'swe_unavail', 'coldcont',
                      'swi_z', 'swi_vol', 'depth', 'snow_line', 'mean_air_temp',
@@ -427,103 +1037,144 @@ def collect(connector, plotorder, basins, start_date, end_date, value,
     if edges == 'total':
         edges = ['total']
 
+    names = dict((int(basins[bid]['basin_id']), bid) for bid in plotorder)
+
+    qry = collect_query(list(names.keys()), start_date, end_date, value,
+                        run_name, edges, method)
+
+    with get_engine(connector).connect() as conn:
+        rows = conn.execute(qry).fetchall()
+
     if method == 'daily':
-        df = pd.DataFrame(index=['date_time'], columns=plotorder)
+        results = pd.DataFrame([tuple(r) for r in rows],
+                               columns=['date_time', 'basin_id', 'value'])
 
-    else:
-        df = pd.DataFrame(np.nan, index=edges, columns=plotorder)
-
-    for bid in plotorder:
-        results = query(connector, start_date, end_date, run_name, basins, bid, value)
-
-        if results.empty:
-            raise Exception('No results on database for '
-                            'run_name: {}, '
-                            'start_date: {}, '
-                            'end_date: {}, '
-                            'value: {} '.format(run_name, start_date,
-                                                end_date, value))
-
-        if method == 'daily':
-            e = results[(results['elevation'] == 'total')
-                        & (results['date_time'] >= start_date)
-                        & (results['date_time'] <= end_date)]
-            if e.empty:
+        for basin_id, bid in names.items():
+            if not (results['basin_id'] == basin_id).any():
                 raise Exception('No results on database for '
-                                'run_name: {} ',
-                                'start_date: {} ,'
+                                'run_name: {}, '
+                                'start_date: {}, '
                                 'end_date: {}, '
-                                'value: {} ,'
-                                'elevation: {}'.format(run_name, start_date,
-                                                       end_date, value, elev))
-            else:
-                e = e.set_index('date_time')
-                e.sort_index(inplace=True)
-
-                if bid == plotorder[0]:
-                    df = e[['value']].copy()
-                    df = df.rename(columns={'value': bid})
+                                'value: {} '.format(run_name, start_date,
+                                                    end_date, value))
+
+        results['date_time'] = pd.to_datetime(results['date_time'])
+        results['value'] = results['value'].astype(float)
+        df = results.pivot(index='date_time', columns='basin_id',
+                           values='value')
+        df.columns = [names[c] for c in df.columns]
+        df.sort_index(inplace=True)
+
+        return df[plotorder]
+
+    results = dict(((int(r[0]), r[1]), r[2:]) for r in rows)
+    df = pd.DataFrame(np.nan, index=edges, columns=plotorder)
+
+    for basin_id, bid in names.items():
+        for elev in edges:
+            key = (basin_id, str(elev))
+
+            if key not in results or (method == 'difference' and
+                                      not all(results[key][3:5])):
+                raise Exception('Empty results for database query in '
+                                'database.collect(), for run_name={}, '
+                                'elev={}, {} to {}'.format(run_name, elev,
+                                                           start_date,
+                                                           end_date))
+
+            n, nvalid, total, nstart, nend, diff = results[key]
+
+            if method == 'end':
+                if nvalid == 0:
+                    df.loc[elev, bid] = np.nan
+
+                # The database can occasionally get multiple values
+                # for the same record if it doesn't exit cleanly
+                elif n > 1:
+                    raise Exception('Multiple database entries for a '
+                                    'single field, consider running with '
+                                    '[database] overwrite: True')
 
                 else:
-                    df[bid] = e['value']
-
-            df.sort_index(inplace=True)
-
-        if method == 'end':
-            for elev in edges:
-                e = results[(results['elevation'] == str(elev))
-                            & (results['date_time'] == end_date)]
-                if e.empty:
-                    raise Exception('Empty results for database query in '
-                                    'database.collect(), for run_name={}, '
-                                    'elev={}, {} to {}'.format(run_name, elev,
-                                                               start_date, end_date))
-                else:
-                    if e['value'].values[0] is None:
-                        df.loc[elev, bid] = np.nan
-                    else:
+                    df.loc[elev, bid] = total
 
-                        # The database can occasionally get multiple values
-                        # for the same record if it doesn't exit cleanly
-                        if len(e['value'].values) == 1:
-                            df.loc[elev, bid] = e['value'].values
-                        else:
-                            raise Exception('Multiple database entries for a '
-                                            'single field, consider running with '
-                                            '[database] overwrite: True')
-
-        if method == 'difference':
-            for elev in edges:
-                s = results[(results['elevation'] == str(elev))
-                            & (results['date_time'] == start_date)]
-                e = results[(results['elevation'] == str(elev))
-                            & (results['date_time'] == end_date)]
-                if e.empty or s.empty:
-                    raise Exception('Empty results for database query in '
-                                    'database.collect(), for run_name={}, '
-                                    'elev={}, {} to {}'.format(run_name, elev,
-                                                               start_date, end_date))
-                else:
-                    df.loc[elev, bid] = np.nansum(e['value'].values - s['value'].values)
-
-        if method == 'sum':
-            for elev in edges:
-                e = results[(results['elevation'] == str(elev))
-                            & (results['date_time'] >= start_date)
-                            & (results['date_time'] <= end_date)]
-                if e.empty:
-                    raise Exception('Empty results for database query in '
-                                    'database.collect(), for run_name={}, '
-                                    'elev={}, {} to {}'.format(run_name, elev,
-                                                               start_date, end_date))
+            if method == 'difference':
+                df.loc[elev, bid] = 0.0 if diff is None else diff
+
+            if method == 'sum':
+                if nvalid < n:
+                    df.loc[elev, bid] = np.nan
                 else:
-                    df.loc[elev, bid] = e['value'].sum(skipna=False)
+                    df.loc[elev, bid] = total
 
     df = df[plotorder]
 
     return df
 
 
+def collect_query(basin_ids, start_date, end_date, value, run_name, edges,
+                  method):
+    """ Query for collect(). For the 'end', 'sum' and 'difference' methods
+    every basin and elevation band is aggregated on the database, with the
+    counts that collect() needs to check for missing and duplicate records.
+
+    Args
+    ------
+    basin_ids {list}: basin ids
+    start_date {datetime}: start date
+    end_date {datetime}: end date
+    value {str}: database value identifier
+    run_name {str}: database run name identifier
+    edges {list}: elevation bands, can include 'total'
+    method {str}: options [end sum difference daily]
+
+    Returns
+    ------
+    qry {class}: sqlalchemy select
+    """
+
+    filt = and_(Results.run_id == RunMetadata.run_id,
+                RunMetadata.run_name == run_name,
+                Results.variable == value,
+                Results.basin_id.in_(basin_ids))
+
+    if method == 'daily':
+        qry = sa.select([Results.date_time, Results.basin_id, Results.value])
+        qry = qry.where(and_(filt,
+                             Results.elevation == 'total',
+                             Results.date_time >= start_date,
+                             Results.date_time <= end_date))
+
+        return qry
+
+    is_start = sa.case([(Results.date_time == start_date, 1)])
+    is_end = sa.case([(Results.date_time == end_date, 1)])
+    start_value = sa.case([(Results.date_time == start_date, Results.value)])
+    end_value = sa.case([(Results.date_time == end_date, Results.value)])
+
+    if method == 'end':
+        dates = Results.date_time == end_date
+    elif method == 'difference':
+        dates = Results.date_time.in_([start_date, end_date])
+    else:
+        dates = and_(Results.date_time >= start_date,
+                     Results.date_time <= end_date)
+
+    qry = sa.select([Results.basin_id,
+                     Results.elevation,
+                     sa.func.count(),
+                     sa.func.count(Results.value),
+                     sa.func.sum(Results.value),
+                     sa.func.count(is_start),
+                     sa.func.count(is_end),
+                     sa.func.sum(end_value) - sa.func.sum(start_value)])
+    qry = qry.where(and_(filt, dates,
+                         Results.elevation.in_([str(e) for e in edges])))
+    qry = qry.group_by(Results.basin_id, Results.elevation)
+
+    return qry
+
+
 def query(connector, start_date, end_date, run_name, basins, bid=None,
           value=None, rid=None):
     '''
@@ -585,9 +1236,7 @@ def delete(connector, basins, start_date, end_date, bid, run_name):
     Delete results from the database. This deletes values with basin_id == bid
     and run_name = run_name within the date range. If there are no more
     remaining records for that run_id (the entire run was deleted), then the
-    RunMetadata and VariableUnits data are also removed.
-
-    Note: deletion order matters because of table relationships.
+    RunMetadata and VariableUnits data are also removed. See delete_range().
 
     Args
     --------
@@ -606,47 +1255,120 @@ def delete(connector, basins, start_date, end_date, bid, run_name):
 
     logger = []
     basin_id = int(basins[bid]['basin_id'])
-    session = make_session(connector)
 
     logger.append(' Deleting existing records for {}, {}, {} '.format(
         bid, run_name, start_date.date()))
 
-    # Get the run_id
-    qry = session.query(Results).join(RunMetadata).filter(and_(
-        (Results.date_time >= start_date),
-        (Results.date_time <= end_date),
-        (RunMetadata.run_name == run_name),
-        (Results.basin_id == basin_id)))
+    out = delete_range(connector, run_name, start_date, end_date, [basin_id])
 
-    df = pd.read_sql(qry.statement, qry.session.connection())
-    unique_runs = df.run_id.unique()
+    for r in out['run_ids']:
+        logger.append(' Deleting RunMetadata run_name={}, run_id={}, from {} '
+                      'to {}'.format(run_name, str(r), start_date.date(),
+                                     end_date.date()))
 
-    if not df.empty:
-        for r in unique_runs:
-            session.query(Results).filter(and_((Results.date_time >= start_date),
-                                               (Results.date_time <= end_date),
-                                               (Results.run_id == int(r)),
-                                               (Results.basin_id == basin_id))).delete()
+    return logger
 
-            session.commit()
 
-        # Query again, if no results from those run_id exist still, also remove
-        # the metadata and variableUnits
-        qrym = session.query(Results).filter(Results.run_id == int(r))
-        dfm = pd.read_sql(qrym.statement, qrym.session.connection())
+def delete_range(connector, run_name, start_date, end_date, basin_ids,
+                 input_basin_ids=None, input_variables=None,
+                 keep_run_ids=None, dates=None):
+    '''
+    Delete the Results for a run_name and basins over a date range, and
+    optionally the Inputs for the days in the range, in one transaction.
+    With dates, only the Results with those date_times and the Inputs on
+    those days are deleted, so days in the range that are not in dates are
+    kept.
+    Afterwards any RunMetadata for the run_name that has no Results left is
+    removed with its VariableUnits, except keep_run_ids.
 
-        if dfm.empty:
-            logger.append(' Deleting RunMetadata run_name={}, run_id={}, from {} '
-                          'to {}'.format(run_name, str(r), start_date.date(),
-                                         end_date.date()))
+    Note: deletion order matters because of table relationships.
 
-            session.query(VariableUnits).filter(VariableUnits.run_id == int(r)).delete()
-            session.query(RunMetadata).filter(RunMetadata.run_id == int(r)).delete()
-            session.commit()
+    Args
+    --------
+    connector {str}: database connector
+    run_name {str}: identifier for run, specified in config file
+    start_date {datetime}: first Results date_time
+    end_date {datetime}: last Results date_time
+    basin_ids {list}: Results basin ids
+    input_basin_ids {list}: Inputs basin ids, default deletes no Inputs
+    input_variables {list}: Inputs variables, default is all variables
+    keep_run_ids {list}: run ids to keep even if they have no Results, such
+        as the run_id of the current run
+    dates {list}: Results date_times to delete, default is every date_time
+        in the range
 
-    session.close()
+    Returns
+    --------
+    out {dict}: number of 'results' and 'inputs' rows deleted, and the
+        'run_ids' that were removed
+    '''
 
-    return logger
+    keep_run_ids = set(int(r) for r in (keep_run_ids or []))
+    out = {'results': 0, 'inputs': 0, 'run_ids': []}
+
+    # Inputs are deleted by day, over contiguous runs of days
+    day = datetime(start_date.year, start_date.month, start_date.day)
+    days = [(day, datetime(end_date.year, end_date.month, end_date.day) +
+             timedelta(days=1))]
+
+    if dates is not None:
+        days = []
+        for d in sorted(set(datetime(d.year, d.month, d.day) for d in dates)):
+            if days and days[-1][1] == d:
+                days[-1] = (days[-1][0], d + timedelta(days=1))
+            else:
+                days.append((d, d + timedelta(days=1)))
+
+    engine = get_engine(connector)
+
+    with engine.begin() as conn:
+        run_ids = [int(r[0]) for r in conn.execute(
+            sa.select([RunMetadata.run_id]).where(
+                RunMetadata.run_name == run_name))]
+
+        if run_ids and basin_ids:
+            filt = and_(Results.run_id.in_(run_ids),
+                        Results.basin_id.in_([int(b) for b in basin_ids]),
+                        Results.date_time >= start_date,
+                        Results.date_time <= end_date)
+
+            if dates is not None:
+                filt = and_(filt, Results.date_time.in_(list(dates)))
+
+            res = conn.execute(Results.__table__.delete().where(filt))
+            out['results'] = res.rowcount
+
+        if input_basin_ids and days:
+            filt = and_(Inputs.run_name == run_name,
+                        Inputs.basin_id.in_([int(b) for b in input_basin_ids]),
+                        or_(*[and_(Inputs.date_time >= s, Inputs.date_time < e)
+                              for s, e in days]))
+
+            if input_variables:
+                filt = and_(filt, Inputs.variable.in_(list(input_variables)))
+
+            res = conn.execute(Inputs.__table__.delete().where(filt))
+            out['inputs'] = res.rowcount
+
+        # run_ids for the run_name with no Results left
+        candidates = [r for r in run_ids if r not in keep_run_ids]
+
+        if candidates:
+            remaining = set(int(r[0]) for r in conn.execute(
+                sa.select([Results.run_id]).where(
+                    Results.run_id.in_(candidates)).distinct()))
+            orphans = sorted(set(candidates) - remaining)
+
+            if orphans:
+                conn.execute(VariableUnits.__table__.delete().where(
+                    VariableUnits.run_id.in_(orphans)))
+                conn.execute(RunMetadata.__table__.delete().where(
+                    RunMetadata.run_id.in_(orphans)))
+                out['run_ids'] = orphans
+
+    _result_cache.invalidate(connector, run_name)
+
+    return out
 
 
 def create_tables(database, plotorder):
@@ -669,10 +1391,7 @@ def create_tables(database, plotorder):
 
     logger = []
 
-    engine = create_engine(database)
-    Base.metadata.create_all(engine)
-    DBSession = sessionmaker(bind=engine)
-    session = DBSession()
+    session = make_session(database)
 
     logger.append(' Adding watershed {} to database'.format(plotorder[0]))
 
@@ -701,7 +1420,8 @@ def create_tables(database, plotorder):
 
 def run_metadata(cfg):
     '''
-    Create database RunMetadata for each snowav run.
+    Create database RunMetadata for each snowav run, and the VariableUnits
+    for its variables, in one transaction. Assigns cfg.run_id and cfg.vid.
 
     Args
     ------
@@ -711,42 +1431,18 @@ def run_metadata(cfg):
     '''
 
     watershed_id = int(cfg.basins[cfg.plotorder[0]]['watershed_id'])
-
-    session = make_session(cfg.connector)
-    qry = session.query(RunMetadata)
-    df = pd.read_sql(qry.statement, qry.session.connection())
-    session.close()
-
-    # Increase each runid by 1
-    if not df.run_id.values.size:
-        cfg.run_id = 1
-    else:
-        r = df['run_id'].values
-        cfg.run_id = next(filterfalse(set(r).__contains__, count(1)))
+    engine = get_engine(cfg.connector)
 
     # in most cases it's not practical to save all run_dirs
     trdir = ','.join(cfg.run_dirs)
     if len(trdir) > 1200:
         trdir = cfg.run_dirs[0]
 
-    values = {'run_id': int(cfg.run_id),
-              'run_name': cfg.run_name,
-              'watershed_id': int(watershed_id),
-              'pixel': int(cfg.pixel),
-              'description': '',
-              'smrf_version': 'smrf' + smrf_version,
-              'awsm_version': 'aswm' + awsm_version,
-              'snowav_version': 'snowav' + cfg.snowav_version,
-              'data_type': '',
-              'data_location': trdir,
-              'file_type': '',
-              'config_file': cfg.config_file,
-              'proc_time': datetime.now()}
-
-    insert(cfg.connector, 'RunMetadata', values)
-
-    cfg.vid = {}
+    units = []
     for v in [*cfg.variables.variables.keys()]:
+        if v == 'snow_line':
+            continue
+
         u = cfg.variables.variables[v]['units']
         if 'vol' in v or 'avail' in v:
             u = cfg.vollbl
@@ -759,34 +1455,50 @@ def run_metadata(cfg):
         if v == 'coldcont':
             u = 'MJ'
 
-        variables = {'run_id': cfg.run_id,
-                     'variable': v,
-                     'unit': u,
-                     'name': cfg.variables.variables[v]['description']}
+        units.append({'variable': v,
+                      'unit': u,
+                      'name': cfg.variables.variables[v]['description']})
 
-        insert(cfg.connector, 'VariableUnits', variables)
+    units.append({'variable': 'snow_line',
+                  'unit': cfg.elevlbl,
+                  'name': 'snow_line'})
 
-        # After inserting into VariableUnits, get the existing id
-        session = make_session(cfg.connector)
-        qry = session.query(VariableUnits).filter(
-            VariableUnits.run_id == cfg.run_id)
-        session.close()
-        df = pd.read_sql(qry.statement, qry.session.connection())
-        cfg.vid[v] = df[df['variable'] == v]['id'].values[0]
-
-    # snow_line
-    variables = {'run_id': cfg.run_id,
-                 'variable': 'snow_line',
-                 'unit': cfg.elevlbl,
-                 'name': 'snow_line'}
-
-    insert(cfg.connector, 'VariableUnits', variables)
-    session = make_session(cfg.connector)
-    qry = session.query(VariableUnits).filter(
-        VariableUnits.run_id == cfg.run_id)
-    session.close()
-    df = pd.read_sql(qry.statement, qry.session.connection())
-    cfg.vid['snow_line'] = df['id'].values[0]
+    # register the run and all of its VariableUnits in one transaction, and
+    # get the VariableUnits ids back with a single query on the new run_id
+    with engine.begin() as conn:
+        r = [row[0] for row in
+             conn.execute(sa.select([RunMetadata.run_id])).fetchall()]
+
+        # Increase each runid by 1
+        if not r:
+            cfg.run_id = 1
+        else:
+            cfg.run_id = next(filterfalse(set(r).__contains__, count(1)))
+
+        values = {'run_id': int(cfg.run_id),
+                  'run_name': cfg.run_name,
+                  'watershed_id': int(watershed_id),
+                  'pixel': int(cfg.pixel),
+                  'description': '',
+                  'smrf_version': 'smrf' + smrf_version,
+                  'awsm_version': 'aswm' + awsm_version,
+                  'snowav_version': 'snowav' + cfg.snowav_version,
+                  'data_type': '',
+                  'data_location': trdir,
+                  'file_type': '',
+                  'config_file': cfg.config_file,
+                  'proc_time': datetime.now()}
+
+        conn.execute(RunMetadata.__table__.insert(), values)
+
+        for row in units:
+            row['run_id'] = int(cfg.run_id)
+
+        conn.execute(VariableUnits.__table__.insert(), units)
+
+        qry = sa.select([VariableUnits.variable, VariableUnits.id]).where(
+            VariableUnits.run_id == int(cfg.run_id))
+        cfg.vid = dict((v, int(i)) for v, i in conn.execute(qry).fetchall())
 
 
 def connect(sqlite=None, sql=None, plotorder=None, user=None,
@@ -836,13 +1548,7 @@ def connect(sqlite=None, sql=None, plotorder=None, user=None,
             for out in log:
                 logger.append(out)
 
-            engine = create_engine(sqlite)
-
-        else:
-            engine = create_engine(sqlite)
-
-        DBSession = sessionmaker(bind=engine)
-        session = DBSession()
+        session = make_session(sqlite)
         logger.append(' Using {} for results'.format(sqlite))
         connector = sqlite
 
@@ -884,11 +1590,7 @@ def connect(sqlite=None, sql=None, plotorder=None, user=None,
             query = ("CREATE DATABASE {};".format(sql))
             cursor.execute(query)
             log = create_tables(db_engine, plotorder)
-
-            engine = create_engine(db_engine)
-            Base.metadata.create_all(engine)
-            DBSession = sessionmaker(bind=engine)
-            session = DBSession()
+            session = make_session(db_engine)
 
             for out in log:
                 logger.append(out)
@@ -912,10 +1614,7 @@ def connect(sqlite=None, sql=None, plotorder=None, user=None,
             try:
                 logger.append(' Using database connection {}@{}:{} "{}" for '
                               'results'.format(user, host, port, sql))
-                engine = create_engine(db_engine)
-                Base.metadata.create_all(engine)
-                DBSession = sessionmaker(bind=engine)
-                session = DBSession()
+                session = make_session(db_engine)
 
             except:
                 logger.append(' Failed trying to make database connection '
@@ -1032,34 +1731,68 @@ def convert_watershed_names(name):
     return watershed
 
 
-def package(connector, basins, df, run_id, vid, output, dtime):
-    """ Put process() results on the database.
+def package(connector, basins, results, run_id, vid, dtime, run_name=None):
+    """ Put process() results on the database. All values for the day are
+    written with a single executemany in one transaction.
 
     Args
     ------
     connector {str}: database connector
     basins {dict}: snowav basins identifier
+    results {dict}: results dataframes by output variable, i.e.
+        {'swe_z': df}, with elevation band index and basin columns
     run_id {int}: run_id for database
-    vid {int}: variable id
-    df {DataFrame}: results dataframe
-    output {str}: output variable (i.e. 'swe_z')
+    vid {dict}: variable ids
     dtime {datetime}: datetime
+    run_name {str}: run_name for run_id, used to invalidate cached collect()
+        results, default invalidates every run_name
     """
 
-    for basin in df:
+    rows = []
 
-        for iters, val in enumerate(df[basin].values):
-            if np.isnan(val):
-                val = None
-            else:
-                val = float(val)
+    for output, df in results.items():
+        for basin in df:
+            basin_id = int(basins[basin]['basin_id'])
+
+            for elevation, val in zip(df.index, df[basin].values):
+                if np.isnan(val):
+                    val = None
+                else:
+                    val = float(val)
+
+                rows.append({'basin_id': basin_id,
+                             'run_id': int(run_id),
+                             'date_time': dtime,
+                             'variable': output,
+                             'variable_id': int(vid[output]),
+                             'value': val,
+                             'elevation': str(elevation)})
+
+    if not rows:
+        return
+
+    engine = get_engine(connector)
+
+    with engine.begin() as conn:
+        conn.execute(Results.__table__.insert(), rows)
+
+    _result_cache.invalidate(connector, run_name)
+
+
+def package_inputs(connector, rows):
+    """ Put input_summary() rows on the Inputs table, with a single
+    executemany in one transaction.
+
+    Args
+    ------
+    connector {str}: database connector
+    rows {list}: list of Inputs row dictionaries
+    """
+
+    if not rows:
+        return
 
-            values = {'basin_id': int(basins[basin]['basin_id']),
-                      'run_id': int(run_id),
-                      'date_time': dtime,
-                      'variable': output,
-                      'variable_id': int(vid[output]),
-                      'value': val,
-                      'elevation': str(df[basin].index[iters])}
+    engine = get_engine(connector)
 
-            insert(connector, 'Results', values)
+    with engine.begin() as conn:
+        conn.execute(Inputs.__table__.insert(), rows)
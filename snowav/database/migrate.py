@@ -0,0 +1,133 @@
+import sqlalchemy as sa
+
+from snowav.database.database import get_engine, collect_query, \
+    results_index_query
+from snowav.database.tables import Results, Inputs
+
+
+def migrate(connector, logger=None):
+    """ Add any indexes that are defined in snowav.database.tables but are
+    missing from an existing database, such as the Results and Inputs
+    composite indexes, and update the table statistics. Only indexes are
+    created, tables and records are not changed.
+
+    Args
+    ------
+    connector {str}: database connector, either path to sqlite database or
+        mysqlconnector string
+    logger {class}: logger
+
+    Returns
+    ------
+    created {list}: names of the indexes that were created
+    """
+
+    engine = get_engine(connector)
+    inspector = sa.inspect(engine)
+    created = []
+
+    for table in (Results.__table__, Inputs.__table__):
+        existing = set(ix['name'] for ix in inspector.get_indexes(table.name))
+
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+
+            if logger is not None:
+                logger.info(' Creating index {} on {}'.format(index.name,
+                                                              table.name))
+
+            index.create(bind=engine)
+            created.append(index.name)
+
+    if created:
+        # update the planner statistics so that the new indexes are used
+        with engine.connect() as conn:
+            if engine.dialect.name == 'sqlite':
+                conn.execute('ANALYZE')
+            else:
+                for table in (Results.__table__, Inputs.__table__):
+                    conn.execute('ANALYZE TABLE {}'.format(table.name))
+
+    elif logger is not None:
+        logger.info(' All snowav indexes exist on {}'.format(
+            engine.url.database))
+
+    return created
+
+
+def explain_query(engine, qry):
+    """ Query plan for a select, from EXPLAIN QUERY PLAN on sqlite and
+    EXPLAIN on mysql.
+
+    Args
+    ------
+    engine {class}: sqlalchemy engine
+    qry {class}: sqlalchemy select
+
+    Returns
+    ------
+    plan {list}: plan rows as strings
+    """
+
+    compiled = qry.compile(dialect=engine.dialect)
+    params = compiled.construct_params()
+    processors = compiled._bind_processors
+
+    for key, value in params.items():
+        if key in processors:
+            params[key] = processors[key](value)
+
+    if compiled.positional:
+        params = tuple(params[key] for key in compiled.positiontup)
+
+    if engine.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+
+    raw = engine.raw_connection()
+
+    try:
+        cursor = raw.cursor()
+        cursor.execute(prefix + str(compiled), params)
+        plan = [' | '.join(str(v) for v in row) for row in cursor.fetchall()]
+        cursor.close()
+
+    finally:
+        raw.close()
+
+    return plan
+
+
+def explain(connector, run_name, basin_ids, start_date, end_date, edges,
+            value='swe_vol'):
+    """ Query plans for the collect() and Process existing record queries.
+
+    Args
+    ------
+    connector {str}: database connector
+    run_name {str}: snowav run_name
+    basin_ids {list}: basin ids
+    start_date {datetime}: start date
+    end_date {datetime}: end date
+    edges {list}: elevation bands, can include 'total'
+    value {str}: database value identifier
+
+    Returns
+    ------
+    plans {dict}: query plans by query name
+    """
+
+    engine = get_engine(connector)
+    plans = {}
+
+    for method in ['end', 'sum', 'difference', 'daily']:
+        qry = collect_query(basin_ids, start_date, end_date, value, run_name,
+                            edges, method)
+        plans['collect {}'.format(method)] = explain_query(engine, qry)
+
+    qry = results_index_query(run_name, start_date, end_date)
+    plans['results_index'] = explain_query(engine, qry)
+
+    return plans
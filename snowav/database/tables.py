@@ -1,5 +1,6 @@
 
-from sqlalchemy import types, Column, ForeignKey, Integer, String, Float, DateTime
+from sqlalchemy import types, Column, ForeignKey, Integer, String, Float, DateTime, \
+    Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import backref, relationship
 
@@ -81,6 +82,17 @@ class Results(Base):
     basinid = relationship('Basin',
                            backref=backref('Results', lazy='dynamic'))
 
+    # collect() filters on run, variable, basin, elevation and date and only
+    # needs value, and the Process checks and deletes filter on run, date and
+    # basin, so these cover both without reading the table. Existing
+    # databases get them with snowav --migrate.
+    __table_args__ = (
+        Index('ix_Results_run_variable_basin', 'run_id', 'variable',
+              'basin_id', 'elevation', 'date_time', 'value'),
+        Index('ix_Results_run_date_basin', 'run_id', 'date_time', 'basin_id',
+              'variable'),
+    )
+
 
 class VariableUnits(Base):
     __tablename__ = 'VariableUnits'
@@ -110,6 +122,11 @@ class Inputs(Base):
     value = Column(Float, nullable=True)
     unit = Column(String(250), nullable=True)
 
+    __table_args__ = (
+        Index('ix_Inputs_run_date_basin', 'run_name', 'date_time', 'basin_id',
+              'variable'),
+    )
+
 
 class Pixels(Base):
     __tablename__ = 'Pixels'
@@ -0,0 +1,126 @@
+import logging
+import queue
+import threading
+
+
+class DatabaseWriter(object):
+    """ Database writes in a background thread, so that the next day can be
+    calculated while the previous day is put on the database.
+
+    Writes are functions, such as package() or Database.delete(), that are
+    run in the order they are put, by a single thread. The queue is bounded,
+    so put() blocks when the writer falls behind rather than holding every
+    day of results in memory. The first error raised by a write is raised
+    again in the calling thread by the next put(), flush() or close(), and
+    the writes after it are dropped.
+
+    With maxsize=0 writes are made immediately in the calling thread.
+
+    Args
+    ------
+    maxsize {int}: number of writes that can be waiting in the queue
+    name {str}: thread name, for logging
+
+    Example:
+        with DatabaseWriter(4) as writer:
+            writer.put(package, connector, basins, results, run_id, vid, dt)
+    """
+
+    _stop = object()
+
+    def __init__(self, maxsize=4, name='snowav-writer'):
+
+        self.maxsize = maxsize
+        self.error = None
+        self.writes = 0
+        self._thread = None
+
+        if self.maxsize > 0:
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            self._thread = threading.Thread(target=self._run, name=name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        # don't replace an error that is already being raised
+        if exc_type is None:
+            self.close()
+        else:
+            self.close(raise_error=False)
+
+    def _run(self):
+        """ Writer thread, runs writes until close(). """
+
+        while True:
+            item = self._queue.get()
+
+            try:
+                if item is self._stop:
+                    return
+
+                # after an error, drop writes so that put() doesn't block
+                if self.error is None:
+                    func, args, kwargs = item
+                    func(*args, **kwargs)
+                    self.writes += 1
+
+            except Exception as e:
+                logging.error(' Database write {} failed: {}'.format(
+                    getattr(item[0], '__name__', item[0]), e))
+                self.error = e
+
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+
+        if self.error is not None:
+            raise self.error
+
+    def put(self, func, *args, **kwargs):
+        """ Queue a write, blocking while the queue is full.
+
+        Args
+        ------
+        func {function}: function that writes to the database
+        args, kwargs: arguments for func
+        """
+
+        self._raise()
+
+        if self._thread is None:
+            func(*args, **kwargs)
+            self.writes += 1
+
+        else:
+            if not self._thread.is_alive():
+                raise Exception('DatabaseWriter is closed')
+
+            self._queue.put((func, args, kwargs))
+
+    def flush(self):
+        """ Wait for the queued writes to finish. """
+
+        if self._thread is not None:
+            self._queue.join()
+
+        self._raise()
+
+    def close(self, raise_error=True):
+        """ Finish the queued writes and stop the writer thread.
+
+        Args
+        ------
+        raise_error {bool}: raise the first write error, if there was one
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(self._stop)
+            self._thread.join()
+
+        if raise_error:
+            self._raise()
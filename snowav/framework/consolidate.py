@@ -0,0 +1,383 @@
+import os
+
+import netCDF4 as nc
+import numpy as np
+
+from snowav.utils.wyhr import handle_year_stradling
+
+# maximum run directory path length in a cube
+nchars = 1024
+
+
+def consolidate(run_dirs, path, variables=None, time_chunk=8, tile=None,
+                complevel=4, logger=None):
+    """ Build or append to a water year cube, one compressed netcdf file with
+    the snow.nc and em.nc variables of every run directory on a single time
+    dimension.
+
+    Run directories that are already in the cube are skipped, unless their
+    snow.nc or em.nc has changed since, in which case their times are written
+    again. This makes the cube appendable as each day is run. The run
+    directory and file modification time of each cube time are saved in the
+    'run_dir' and 'mtime' variables, and are used by cube_index() and
+    cube_entry() to decide when the cube can be read in place of the files.
+
+    Variables are chunked over time_chunk times, and optionally over tile x
+    tile pixels, so that time series at points and single dates can both be
+    read without reading the whole cube.
+
+    Args
+    ------
+    run_dirs {list}: run directories with snow.nc and em.nc
+    path {str}: cube file path
+    variables {list}: snow.nc and em.nc variable names, default all
+    time_chunk {int}: times in each chunk
+    tile {int}: pixels on each side of a chunk, default the full grid
+    complevel {int}: zlib compression level
+    logger {class}: logger
+
+    Returns
+    ------
+    counts {dict}: run directories 'added', 'updated' and 'skipped'
+    """
+
+    run_dirs = sorted(os.path.abspath(p) for p in run_dirs)
+    counts = {'added': 0, 'updated': 0, 'skipped': 0}
+    index = {}
+    ncf = None
+
+    if os.path.isfile(path):
+        ncf = nc.Dataset(path, 'a')
+        index = _read_index(ncf)
+
+    try:
+        for run_dir in run_dirs:
+            snowfile = os.path.join(run_dir, 'snow.nc')
+            emfile = os.path.join(run_dir, 'em.nc')
+
+            if not (os.path.isfile(snowfile) and os.path.isfile(emfile)):
+                if logger is not None:
+                    logger.info(' No snow.nc and em.nc in {}, '
+                                'skipping'.format(run_dir))
+                continue
+
+            mtime = _mtime(run_dir)
+
+            if len(run_dir.encode('utf-8')) > nchars:
+                raise Exception('{} is longer than {} characters'.format(
+                    run_dir, nchars))
+
+            if run_dir in index and index[run_dir]['mtime'] == mtime:
+                counts['skipped'] += 1
+                continue
+
+            snow = nc.Dataset(snowfile, 'r')
+            em = nc.Dataset(emfile, 'r')
+
+            try:
+                # values, fill values and packing are copied as they are
+                snow.set_auto_maskandscale(False)
+                em.set_auto_maskandscale(False)
+
+                if ncf is None:
+                    ncf = _create(path, snow, em, variables, time_chunk, tile,
+                                  complevel)
+
+                ncf.set_auto_maskandscale(False)
+
+                ftime = snow.variables['time']
+                dates = nc.num2date(ftime[:], ftime.units,
+                                    getattr(ftime, 'calendar', 'standard'))
+
+                for t in dates:
+                    if handle_year_stradling(t) + 1 != ncf.wy:
+                        raise Exception('{} in {} is not in water year {} of '
+                                        '{}'.format(t, run_dir, ncf.wy, path))
+
+                if run_dir in index:
+                    tindex = index[run_dir]['tindex']
+
+                    if len(tindex) != len(dates):
+                        raise Exception('{} has {} times, but {} in {}, '
+                                        'consolidate a new cube'.format(
+                                            run_dir, len(dates),
+                                            len(tindex), path))
+
+                    start = tindex[0]
+                    counts['updated'] += 1
+
+                else:
+                    start = len(ncf.dimensions['time'])
+                    counts['added'] += 1
+
+                stop = start + len(dates)
+                time = ncf.variables['time']
+                time[start:stop] = nc.date2num(dates, time.units,
+                                               time.calendar)
+
+                for name in ncf.cube_variables.split():
+                    if name in snow.variables:
+                        src = snow.variables[name]
+                    elif name in em.variables:
+                        src = em.variables[name]
+                    else:
+                        raise Exception('{} not in {}'.format(name, run_dir))
+
+                    ncf.variables[name][start:stop] = src[:]
+
+                # written last, so that times are only indexed once their
+                # images are complete
+                ncf.variables['mtime'][start:stop] = mtime
+
+                ncf.variables['run_dir'][start:stop] = np.array(
+                    [run_dir] * len(dates), dtype='U{}'.format(nchars))
+
+                if logger is not None:
+                    logger.debug(' Consolidated {} times from {}'.format(
+                        len(dates), run_dir))
+
+            finally:
+                snow.close()
+                em.close()
+
+    finally:
+        if ncf is not None:
+            ncf.close()
+
+    if logger is not None:
+        logger.info(' {}: {} run directories added, {} updated, {} '
+                    'unchanged'.format(path, counts['added'],
+                                       counts['updated'], counts['skipped']))
+
+    return counts
+
+
+def _create(path, snow, em, variables, time_chunk, tile, complevel):
+    """ New cube with the dimensions, coordinates and variables of an open
+    snow.nc and em.nc. """
+
+    ny = len(snow.dimensions['y'])
+    nx = len(snow.dimensions['x'])
+
+    if tile is None:
+        chunks = (time_chunk, ny, nx)
+    else:
+        chunks = (time_chunk, min(tile, ny), min(tile, nx))
+
+    names = []
+    for ds in (snow, em):
+        for name, var in ds.variables.items():
+            if var.dimensions != ('time', 'y', 'x'):
+                continue
+            if variables is not None and name not in variables:
+                continue
+            names.append(name)
+
+    if variables is not None:
+        missing = [v for v in variables if v not in names]
+        if missing:
+            raise Exception('{} not in snow.nc or em.nc'.format(missing))
+
+    ftime = snow.variables['time']
+    t = nc.num2date(ftime[0], ftime.units,
+                    getattr(ftime, 'calendar', 'standard'))
+
+    ncf = nc.Dataset(path, 'w', format='NETCDF4')
+    ncf.set_auto_maskandscale(False)
+    ncf.wy = handle_year_stradling(t) + 1
+    ncf.cube_variables = ' '.join(names)
+    ncf.description = ('snowav consolidate water year cube of AWSM snow.nc '
+                       'and em.nc outputs')
+
+    ncf.createDimension('time', None)
+    ncf.createDimension('y', ny)
+    ncf.createDimension('x', nx)
+    ncf.createDimension('nchars', nchars)
+
+    time = ncf.createVariable('time', 'f8', ('time',), chunksizes=(1024,))
+    time.units = ftime.units
+    time.calendar = getattr(ftime, 'calendar', 'standard')
+
+    for name in ('y', 'x'):
+        src = snow.variables[name]
+        var = ncf.createVariable(name, src.dtype, (name,))
+        var.setncatts(dict((a, src.getncattr(a)) for a in src.ncattrs()
+                           if a != '_FillValue'))
+        var[:] = src[:]
+
+    # fixed length rather than variable length strings, which can't be read
+    # while the cube is open elsewhere in the same process
+    var = ncf.createVariable('run_dir', 'S1', ('time', 'nchars'), zlib=True,
+                             chunksizes=(64, nchars))
+    var._Encoding = 'utf-8'
+    ncf.createVariable('mtime', 'f8', ('time',), chunksizes=(1024,))
+
+    for name in names:
+        if name in snow.variables:
+            src = snow.variables[name]
+        else:
+            src = em.variables[name]
+
+        fill = getattr(src, '_FillValue', None)
+        var = ncf.createVariable(name, src.dtype, ('time', 'y', 'x'),
+                                 zlib=True, complevel=complevel, shuffle=True,
+                                 chunksizes=chunks, fill_value=fill)
+        var.setncatts(dict((a, src.getncattr(a)) for a in src.ncattrs()
+                           if a != '_FillValue'))
+
+    return ncf
+
+
+def _mtime(run_dir):
+    """ Latest snow.nc or em.nc modification time in a run directory. """
+
+    times = [os.path.getmtime(os.path.join(run_dir, f))
+             for f in ('snow.nc', 'em.nc')
+             if os.path.isfile(os.path.join(run_dir, f))]
+
+    if not times:
+        return None
+
+    return max(times)
+
+
+def _read_index(ncf):
+    """ cube_index() for an open cube. """
+
+    time = ncf.variables['time']
+    n = len(ncf.dimensions['time'])
+    index = {}
+
+    if n == 0:
+        return index
+
+    dates = nc.num2date(time[:], time.units, time.calendar)
+    mtimes = np.asarray(ncf.variables['mtime'][:], dtype=float)
+    run_dirs = ncf.variables['run_dir'][:]
+
+    for i in range(0, n):
+        run_dir = str(run_dirs[i])
+
+        # times from an append that did not finish
+        if not run_dir:
+            continue
+
+        entry = index.setdefault(run_dir, {'mtime': mtimes[i],
+                                           'tindex': [],
+                                           'dates': []})
+        entry['tindex'].append(i)
+        entry['dates'].append(dates[i])
+
+    return index
+
+
+def cube_index(path):
+    """ Times in a water year cube by run directory.
+
+    Args
+    ------
+    path {str}: cube file path, from consolidate()
+
+    Returns
+    ------
+    index {dict}: by run directory absolute path, 'mtime' of the files when
+        they were consolidated, and 'tindex' and 'dates' of their times in
+        the cube, in file order
+    """
+
+    if not os.path.isfile(path):
+        raise Exception('{} not a valid snowav cube'.format(path))
+
+    ncf = nc.Dataset(path, 'r')
+
+    try:
+        index = _read_index(ncf)
+
+    finally:
+        ncf.close()
+
+    return index
+
+
+def cube_entry(index, run_dir):
+    """ Cube times for a run directory, if the cube is current for it. A run
+    directory whose snow.nc or em.nc changed after it was consolidated is
+    read from the files. If the files have been removed, the cube is used.
+
+    Args
+    ------
+    index {dict}: from cube_index()
+    run_dir {str}: run directory
+
+    Returns
+    ------
+    entry {dict}: cube_index() entry, or None
+    """
+
+    run_dir = os.path.abspath(run_dir)
+
+    if run_dir not in index:
+        return None
+
+    mtime = _mtime(run_dir)
+
+    if mtime is not None and mtime != index[run_dir]['mtime']:
+        return None
+
+    return index[run_dir]
+
+
+def cube_points(var, tindex, rows, cols):
+    """ Values at pixels for a list of cube times. The cube is read a time
+    chunk at a time, over the rows and columns that contain the pixels, so
+    each chunk is only read once.
+
+    Args
+    ------
+    var {class}: netcdf cube variable
+    tindex {list}: cube time indices
+    rows {arr}: pixel rows
+    cols {arr}: pixel columns
+
+    Returns
+    ------
+    values {arr}: float64, shaped (len(tindex), len(rows)), with masked
+        values as nan
+    """
+
+    tindex = np.asarray(tindex, dtype=int)
+    rows = np.asarray(rows, dtype=int)
+    cols = np.asarray(cols, dtype=int)
+    values = np.full((len(tindex), len(rows)), np.nan)
+
+    if len(tindex) == 0 or len(rows) == 0:
+        return values
+
+    r0, r1 = rows.min(), rows.max() + 1
+    c0, c1 = cols.min(), cols.max() + 1
+
+    chunking = var.chunking()
+    if chunking == 'contiguous':
+        step = 1
+    else:
+        step = chunking[0]
+
+    order = np.argsort(tindex, kind='stable')
+    start = 0
+
+    while start < len(order):
+        t0 = tindex[order[start]]
+        end = (t0 // step + 1) * step
+        stop = start
+
+        while stop < len(order) and tindex[order[stop]] < end:
+            stop += 1
+
+        t1 = tindex[order[stop - 1]] + 1
+        image = var[t0:t1, r0:r1, c0:c1]
+        image = np.ma.filled(np.ma.asarray(image, dtype=float), np.nan)
+        idx = order[start:stop]
+        values[idx] = image[tindex[idx] - t0][:, rows - r0, cols - c0]
+        start = stop
+
+    return values
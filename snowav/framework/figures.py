@@ -92,7 +92,7 @@ def figures(cfg, process, db):
                                      cfg.run_name, cfg.figsize, cfg.depthlbl,
                                      cfg.elevlbl, cfg.vollbl, cfg.dplcs,
                                      cfg.figs_path, dpi=cfg.dpi,
-                                     logger=cfg._logger)
+                                     logger=cfg._logger, window=cfg.window)
 
         if len(names) == 0:
             cfg.flt_flag = False
@@ -101,9 +101,7 @@ def figures(cfg, process, db):
             cfg.assign_vars({'flight_delta_vol_df': df})
 
     if cfg.swi_flag:
-        image = np.zeros_like(cfg.outputs['swi_z'][0])
-        for n in range(cfg.ixs, cfg.ixe):
-            image = image + cfg.outputs['swi_z'][n] * cfg.depth_factor
+        image = process.swi_total * cfg.depth_factor
 
         params = {Results: [
             ('date_time', 'ge', cfg.start_date),
@@ -210,9 +208,7 @@ def figures(cfg, process, db):
                     flight_flag=cfg.flt_flag)
 
     if cfg.precip_depth_flag:
-        swi_image = np.zeros_like(cfg.outputs['swi_z'][0])
-        for n in range(cfg.ixs, cfg.ixe):
-            swi_image = swi_image + cfg.outputs['swi_z'][n] * cfg.depth_factor
+        swi_image = process.swi_total * cfg.depth_factor
 
         swi_df = collect(connector, args['plotorder'], args['basins'],
                          args['start_date'], args['end_date'], 'swi_z',
@@ -324,11 +320,14 @@ def figures(cfg, process, db):
                  'port': cfg.wxdb_port}
 
         flag = stn_validate(cfg.all_dirs, cfg.val_lbls, cfg.val_client,
-                            args['end_date'], args['wy'], cfg.snow_x,
-                            cfg.snow_y, cfg.val_stns, px, py, login,
+                            args['end_date'], args['wy'], cfg.topo_x,
+                            cfg.topo_y, cfg.val_stns, px, py, login,
                             args['figs_path'], cfg.stn_validate_fig_name,
-                            cfg.dem, logger=cfg._logger, elevlbl=cfg.elevlbl,
-                            nash_sut_flag=cfg.nash_sut_flag)
+                            cfg.topo_dem, logger=cfg._logger,
+                            elevlbl=cfg.elevlbl,
+                            nash_sut_flag=cfg.nash_sut_flag,
+                            window=cfg.window, cube=cfg.cube,
+                            cache_dir=cfg.cache_dir)
 
         if not flag:
             cfg.stn_validate_flag = False
@@ -7,13 +7,15 @@ from snowav.config.config import UserConfig
 from snowav.framework.process import Process
 from snowav.framework.figures import figures
 from snowav.report.report import report
-from snowav.database.database import Database, run_metadata
+from snowav.database.database import Database, run_metadata, \
+    configure_result_cache
 from snowav.inflow.inflow import excel_to_csv
 
 
 class Snowav(object):
 
-    def __init__(self, config_file=None, awsm=None, end_date=None):
+    def __init__(self, config_file=None, awsm=None, end_date=None,
+                 processes=None):
         """ Read config file, parse config options, process results, put
         results on database, make figures, and make pdf report.
 
@@ -22,38 +24,49 @@ class Snowav(object):
         config_file {str}: config file
         awsm {class}: awsm class
         end_date {str}: overwrite of config end_date
+        processes {int}: overwrite of config [run] processes
         """
 
         if end_date is not None:
             end_date = pd.to_datetime(end_date)
 
         # get and parse config options
-        cfg = UserConfig(config_file, awsm=awsm, end_date=end_date)
+        cfg = UserConfig(config_file, awsm=awsm, end_date=end_date,
+                         processes=processes)
         cfg.parse()
         cfg.figure_names()
+        result_cache = configure_result_cache(cfg.collect_cache,
+                                              cfg.collect_cache_dir)
 
         if cfg.report_only:
             report(cfg)
+            cfg._logger.info(' {}'.format(result_cache))
             elapsed = str(datetime.now() - cfg.proc_time_start)
             cfg._logger.info(' Completed snowav processing, '
                              'elapsed time: {}'.format(elapsed))
             exit()
 
-        if cfg.query_flag:
-            query(cfg)
-
-        run_metadata(cfg)
         if cfg.db_type == 'sql':
             dbp = cfg.mysql
         else:
             dbp = cfg.sqlite
 
+        # make the connection pool first, so that it is used for everything
+        # that follows
         db = Database(user=cfg.db_user, password=cfg.db_password,
                       host=cfg.db_host, port=cfg.db_port, db_type=cfg.db_type,
-                      database=dbp)
+                      database=dbp, pool_size=cfg.db_pool_size,
+                      max_overflow=cfg.db_max_overflow,
+                      pool_recycle=cfg.db_pool_recycle,
+                      pool_pre_ping=cfg.db_pool_pre_ping)
         db.make_connection(logger=cfg._logger)
         db.check_tables(logger=cfg._logger)
 
+        if cfg.query_flag:
+            query(cfg)
+
+        run_metadata(cfg)
+
         process = Process(cfg, db)
 
         if cfg.inflow_flag and cfg.inflow_data is not None:
@@ -76,6 +89,8 @@ class Snowav(object):
         if cfg.report_flag:
             report(cfg)
 
+        cfg._logger.info(' {}, {}'.format(db.stats, result_cache))
+
         elapsed = str(datetime.now() - cfg.proc_time_start)
 
         cfg._logger.info(' Completed snowav processing, '
@@ -1,14 +1,320 @@
 
+from collections import OrderedDict
 from copy import deepcopy
+import hashlib
 import os
 import numpy as np
 from datetime import datetime, timedelta
 from snowav.utils.wyhr import calculate_wyhr_from_date
 from snowav.utils.OutputReader import iSnobalReader
+from snowav.framework.consolidate import cube_entry, cube_index
 import netCDF4 as nc
 
+bands_map = {'snow':{'depth': 0,
+                     'density': 1,
+                     'swe_z': 2,
+                     'lwc': 3,
+                     'temp_surface': 4,
+                     'temp_lower': 5,
+                     'temp_bulk': 6,
+                     'depth_lower_layer': 7,
+                     'h20_sat': 8},
+             'em':{'R_n': 0,
+                   'H': 1,
+                   'L_v_E': 2,
+                   'G': 3,
+                   'M': 4,
+                   'delta_Q': 5,
+                   'evap_z': 6,
+                   'melt': 7,
+                   'swi_z': 8,
+                   'coldcont': 9}}
+
+
+class OutputBand(object):
+    """ Sequence of daily images for one band in an OutputStore, read when
+    indexed.
+
+    Args
+    ------
+    store {class}: OutputStore
+    band {str}: snowav band name, i.e. 'swe_z'
+    """
+
+    def __init__(self, store, band):
+        self.store = store
+        self.band = band
+
+    def __len__(self):
+        return len(self.store.entries)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+
+        if idx < 0:
+            idx += len(self)
+
+        if idx < 0 or idx >= len(self):
+            raise IndexError('{} index {} out of range'.format(self.band, idx))
+
+        return self.store.read(self.band, idx)
+
+    def __iter__(self):
+        for idx in range(0, len(self)):
+            yield self[idx]
+
+
+class OutputStore(object):
+    """ Index of snow.nc and em.nc images by date, used in place of lists of
+    arrays for the outputs dictionary. outputs['dates'] and outputs['time']
+    are lists, and outputs[band][i] reads the image for date i when it is
+    used.
+
+    The last cache_size images that were read are kept in memory. If
+    cache_dir is given each image is also saved there as .npy the first time
+    it is read, and later runs load it memory-mapped instead of reading the
+    netcdf files again.
+
+    Images are dtype, float64 by default, and read-only. With
+    mask_and_scale=False they are read as plain arrays, with fill values as
+    nan, rather than through netCDF4 masked arrays.
+
+    Args
+    ------
+    bands {list}: snowav band names, i.e. ['swe_z', 'depth']
+    wy {int}: water year
+    cache_size {int}: number of images to keep in memory
+    cache_dir {str}: optional directory for .npy image cache
+    window {tuple}: optional (row slice, column slice) to read, from
+        snowav.utils.utilities.crop_window()
+    dtype {dtype}: image dtype, np.float64 or np.float32
+    mask_and_scale {bool}: netCDF4 auto mask and scale
+    """
+
+    def __init__(self, bands, wy, cache_size=8, cache_dir=None, window=None,
+                 dtype=np.float64, mask_and_scale=True):
+        self.bands = [b for b in bands if b in bands_map['snow'] or
+                      b in bands_map['em']]
+        self.wy = wy
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self.window = window
+        self.dtype = np.dtype(dtype)
+        self.mask_and_scale = mask_and_scale
+        self.entries = []
+        self.dates = []
+        self.time = []
+        self._cache = OrderedDict()
+        self._readers = OrderedDict()
+        self.max_open = 4
+
+        if self.cache_dir is not None and not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def append(self, path, tindex, date, time):
+        """ Add an image date.
+
+        Args
+        ------
+        path {str}: run directory with snow.nc and em.nc, or water year cube
+        tindex {int}: time index in the files
+        date {datetime}: image date
+        time {int}: water year hour
+        """
+
+        self.entries.append((path, tindex))
+        self.dates.append(date)
+        self.time.append(time)
+
+    def __getstate__(self):
+        """ Open files and cached images are not pickled. """
+
+        state = self.__dict__.copy()
+        state['_cache'] = OrderedDict()
+        state['_readers'] = OrderedDict()
+
+        return state
+
+    def keys(self):
+        return ['dates', 'time'] + self.bands
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        if key == 'dates':
+            return self.dates
+
+        if key == 'time':
+            return self.time
+
+        if key not in self.bands:
+            raise KeyError(key)
+
+        return OutputBand(self, key)
+
+    def read(self, band, idx):
+        """ Image for a band and date index.
+
+        Args
+        ------
+        band {str}: snowav band name
+        idx {int}: date index
+
+        Returns
+        ------
+        image {arr}: read-only image
+        """
+
+        key = (band, idx)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        path, tindex = self.entries[idx]
+        npy = None
+
+        if self.cache_dir is not None:
+            npy = self._npy_path(path, band, tindex)
+
+        if npy is not None and os.path.isfile(npy):
+            image = np.load(npy, mmap_mode='r')
+
+        else:
+            image = self._read_netcdf(band, idx)
+            image.setflags(write=False)
+
+            if npy is not None:
+                tmp = '{}.{}.tmp.npy'.format(os.path.splitext(npy)[0],
+                                             os.getpid())
+                np.save(tmp, image)
+                os.replace(tmp, npy)
+
+        self._cache[key] = image
+
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return image
+
+    def _read_netcdf(self, band, idx):
+        """ Read one image from snow.nc or em.nc. """
+
+        path, tindex = self.entries[idx]
+        reader = self._reader(path)
+
+        if band in bands_map['snow']:
+            image = reader.snow(bands_map['snow'][band], tindex)
+        else:
+            image = reader.em(bands_map['em'][band], tindex)
+
+        return image
+
+    def _reader(self, path):
+        """ Open iSnobalReader for a run directory. The most recently used
+        readers are kept open, so multi-day files are only opened once. """
+
+        if path in self._readers:
+            self._readers.move_to_end(path)
+            return self._readers[path]
+
+        reader = iSnobalReader(path, snowbands=[], embands=[], wy=self.wy,
+                               lazy=True, window=self.window,
+                               dtype=self.dtype,
+                               mask_and_scale=self.mask_and_scale)
+        self._readers[path] = reader
+
+        while len(self._readers) > self.max_open:
+            old_path, old_reader = self._readers.popitem(last=False)
+            old_reader.close()
+
+        return reader
+
+    def close(self):
+        """ Close open snow.nc and em.nc files. """
+
+        for reader in self._readers.values():
+            reader.close()
+
+        self._readers = OrderedDict()
+
+    def _npy_path(self, path, band, tindex):
+        """ Cache file name, keyed on the file path, modification time, read
+        window, dtype and mask_and_scale. """
+
+        if os.path.isfile(path):
+            f = path
+        elif band in bands_map['snow']:
+            f = os.path.join(path, 'snow.nc')
+        else:
+            f = os.path.join(path, 'em.nc')
+
+        key = '{}|{}|{}|{}|{}|{}|{}'.format(os.path.abspath(f),
+                                            os.path.getmtime(f), band, tindex,
+                                            self.window, self.dtype.name,
+                                            self.mask_and_scale)
+        name = hashlib.sha1(key.encode()).hexdigest()
+
+        return os.path.join(self.cache_dir, '{}.npy'.format(name))
+
+
+def skipped_dirs(run_dirs, start_date, skip_before):
+    '''
+    Run directories that only have dates on or before skip_before, from
+    their awsm_daily runYYYYMMDD names, so that their snow.nc is not opened.
+    A run directory's dates are assumed to be before the next run
+    directory's date. The run directory with start_date, or the first one if
+    start_date is None, and any without a runYYYYMMDD name are kept.
+
+    Args
+    -----
+    run_dirs : list
+        list of run directories
+    start_date : datetime
+        report period start date, or None
+    skip_before : datetime
+        last date that can be skipped
+
+    Returns
+    ------
+    skip : list
+        run directories that can be skipped
+    '''
+
+    runs = []
+    for path in run_dirs:
+        name = os.path.basename(os.path.normpath(path))
+
+        try:
+            runs.append((datetime.strptime(name[-8:], '%Y%m%d').date(), path))
+        except ValueError:
+            continue
+
+    runs.sort()
+    skip = []
+    first = None
+
+    for i, (day, path) in enumerate(runs[:-1]):
+        next_day = runs[i + 1][0]
+
+        # the run directory with the first date in the report period
+        if first is None and (start_date is None or
+                              next_day > start_date.date()):
+            first = path
+            continue
+
+        if next_day <= skip_before.date() + timedelta(days=1):
+            skip.append(path)
+
+    return skip
+
+
 def outputs(run_dirs, wy, properties, start_date = None,
-            end_date = None, flight_dates = None, loglevel = None):
+            end_date = None, flight_dates = None, loglevel = None,
+            cache_size = 8, cache_dir = None, window = None, cube = None,
+            dtype = np.float64, mask_and_scale = True, skip_before = None):
     '''
     This uses start_date and end_date to load the snow.nc and em.nc of interest
     within a report period to the outputs format that will be used in process().
@@ -31,6 +337,24 @@ def outputs(run_dirs, wy, properties, start_date = None,
         water year
     flight_dates : array
         (optional)
+    cache_size : int
+        number of images OutputStore keeps in memory
+    cache_dir : str
+        OutputStore .npy image cache directory (optional)
+    window : tuple
+        (row slice, column slice) to read, from crop_window() (optional)
+    cube : str
+        water year cube from snowav consolidate (optional). Run directories
+        that are current in the cube are read from it rather than from their
+        snow.nc and em.nc
+    dtype : dtype
+        image dtype, np.float64 or np.float32
+    mask_and_scale : bool
+        netCDF4 auto mask and scale, False reads plain arrays with fill
+        values as nan
+    skip_before : datetime
+        [run] incremental date, run directories with only dates on or
+        before it are not read, see skipped_dirs() (optional)
 
     Returns
     ------
@@ -39,54 +363,56 @@ def outputs(run_dirs, wy, properties, start_date = None,
     '''
 
     dirs = deepcopy(run_dirs)
-    snowbands = []
-    embands = []
     log = []
     rdict = {}
-    outputs = {'dates': [], 'time': []}
-
-    bands_map = {'snow':{'depth': 0,
-                         'density': 1,
-                         'swe_z': 2,
-                         'lwc': 3,
-                         'temp_surface': 4,
-                         'temp_lower': 5,
-                         'temp_bulk': 6,
-                         'depth_lower_layer': 7,
-                         'h20_sat': 8},
-                 'em':{'R_n': 0,
-                       'H': 1,
-                       'L_v_E': 2,
-                       'G': 3,
-                       'M': 4,
-                       'delta_Q': 5,
-                       'evap_z': 6,
-                       'melt': 7,
-                       'swi_z': 8,
-                       'coldcont': 9}}
-
-    for band in properties:
-        if band in [*bands_map['snow'].keys()]:
-            snowbands.append(bands_map['snow'][band])
-        if band in [*bands_map['em'].keys()]:
-            embands.append(bands_map['em'][band])
-        outputs[band] = []
+
+    # images are read from the files when they are used
+    if flight_dates is None:
+        bands = properties
+    else:
+        bands = ['swe_z', 'depth', 'density']
+
+    outputs = OutputStore(bands, wy, cache_size=cache_size,
+                          cache_dir=cache_dir, window=window, dtype=dtype,
+                          mask_and_scale=mask_and_scale)
 
     start = deepcopy(start_date)
     end = deepcopy(end_date)
 
+    if cube is not None:
+        index = cube_index(cube)
+    else:
+        index = {}
+
     # Run this with standard processing, and forecast processing
     if flight_dates is None:
 
+        skip = []
+        if skip_before is not None:
+            skip = skipped_dirs(dirs, start_date, skip_before)
+            log.append(' Skipping {} run directories with dates on or before '
+                       '{}'.format(len(skip), skip_before))
+
         for path in dirs:
+            if path in skip:
+                run_dirs.remove(path)
+                continue
+
             snowfile = os.path.join(path, 'snow.nc')
+            entry = cube_entry(index, path)
 
             if loglevel == 'DEBUG':
                 log.append(' Reading date: {}'.format(snowfile))
 
+            # run directories that are current in the cube are read from it
+            if entry is not None:
+                ta = np.array(entry['dates'])
+                source = cube
+                tindex = entry['tindex']
+
             # Consider making this a warning, with an else: .remove(path)
             # to catch other files that are in these directories
-            if not os.path.isfile(snowfile):
+            elif not os.path.isfile(snowfile):
                 log.append(' {} not a valid file'.format(snowfile))
                 print(' {} not a valid file, snowav may '
                     'error...'.format(snowfile))
@@ -98,56 +424,46 @@ def outputs(run_dirs, wy, properties, start_date = None,
                            'log': log}
                 return results
 
-            ncf = nc.Dataset(snowfile)
-
-            # Catch 'empty' snow.nc and em.nc file from certain awsm crash
-            # scenarios in awsm<=0.10.0
-            if 'specific_mass' not in ncf.variables:
-                log.append(' No "specific_mass" variable in {}, this may be the result '
-                    'of awsm crashing without writing variables to file, '
-                    'consider deleting and re-running awsm'.format(snowfile))
-                raise Exception(' No "specific_mass" variable in {}'.format(snowfile))
+            else:
+                ncf = nc.Dataset(snowfile)
 
-            ta = nc.num2date(ncf.variables['time'][:],ncf.variables['time'].units)
-            ncf.close()
+                # Catch 'empty' snow.nc and em.nc file from certain awsm crash
+                # scenarios in awsm<=0.10.0
+                if 'specific_mass' not in ncf.variables:
+                    log.append(' No "specific_mass" variable in {}, this may be the result '
+                        'of awsm crashing without writing variables to file, '
+                        'consider deleting and re-running awsm'.format(snowfile))
+                    raise Exception(' No "specific_mass" variable in {}'.format(snowfile))
 
-            ta = np.sort(ta)
+                ta = nc.num2date(ncf.variables['time'][:],ncf.variables['time'].units)
+                ncf.close()
+                source = path
+                tindex = range(0, len(ta))
 
             if start_date is None:
-                start = deepcopy(ta[0])
+                start = deepcopy(min(ta))
 
             if end_date is None:
-                end = deepcopy(ta[-1])
+                end = deepcopy(max(ta))
 
-            for idx,t in enumerate(ta):
+            st_hr = calculate_wyhr_from_date(start)
+            en_hr = calculate_wyhr_from_date(end)
+
+            for idx in np.argsort(ta):
+                t = ta[idx]
 
                 # Only load the rundirs that we need
                 if (t.date() >= start.date()) and (t.date() <= end.date()):
 
                     log.append(' Loading: {}'.format(snowfile))
 
-                    st_hr = calculate_wyhr_from_date(start)
-                    en_hr = calculate_wyhr_from_date(end)
-
-                    output = iSnobalReader(path, snowbands = snowbands,
-                                           embands = embands, wy = wy,
-                                           time_start = st_hr, time_end = en_hr)
+                    wyhr = calculate_wyhr_from_date(t)
 
                     # Make a dict for wyhr-rundir lookup
-                    for ot in output.time:
-                        rdict[int(ot)] = path
-
-                    # Apply snow bands to outputs
-                    for band in properties:
-                        if band in [*bands_map['snow'].keys()]:
-                            s = bands_map['snow'][band]
-                            outputs[band].append(output.snow_data[s][idx,:,:])
-                        if band in [*bands_map['em'].keys()]:
-                            e = bands_map['em'][band]
-                            outputs[band].append(output.em_data[e][idx,:,:])
+                    if wyhr >= st_hr and wyhr <= en_hr:
+                        rdict[int(wyhr)] = path
 
-                    outputs['dates'].append(output.dates[idx])
-                    outputs['time'].append(output.time[idx])
+                    outputs.append(source, int(tindex[idx]), t, wyhr)
 
                 else:
                     run_dirs.remove(path)
@@ -157,28 +473,32 @@ def outputs(run_dirs, wy, properties, start_date = None,
 
         for path in dirs:
             snowfile = os.path.join(path, 'snow.nc')
+            entry = cube_entry(index, path)
+
+            if entry is not None:
+                ta = np.array(entry['dates'])
+                source = cube
+                tindex = entry['tindex']
 
             # If the run_dirs isn't empty use it, otherwise remove
-            if not os.path.isfile(snowfile):
+            elif not os.path.isfile(snowfile):
                 raise Exception('{} not a valid file'.format(snowfile))
 
-            ncf = nc.Dataset(snowfile)
-            ta = nc.num2date(ncf.variables['time'][:],ncf.variables['time'].units)
-            ncf.close()
+            else:
+                ncf = nc.Dataset(snowfile)
+                ta = nc.num2date(ncf.variables['time'][:],ncf.variables['time'].units)
+                ncf.close()
+                source = path
+                tindex = range(0, len(ta))
 
             for idx,t in enumerate(ta):
                 if (t.date() in [x.date() for x in flight_dates]):
+                    wyhr = calculate_wyhr_from_date(t)
 
-                    output = iSnobalReader(path, snowbands=[0,1,2], wy=wy)
-
-                    for ot in output.time:
-                        rdict[int(ot)] = path
+                    for ot in ta:
+                        rdict[int(calculate_wyhr_from_date(ot))] = path
 
-                    outputs['swe_z'].append(output.snow_data[2][idx,:,:])
-                    outputs['depth'].append(output.snow_data[0][idx,:,:])
-                    outputs['density'].append(output.snow_data[1][idx,:,:])
-                    outputs['dates'].append(output.dates[idx])
-                    outputs['time'].append(output.time[idx])
+                    outputs.append(source, int(tindex[idx]), t, wyhr)
 
     results = {'outputs': outputs,
                'dirs': dirs,
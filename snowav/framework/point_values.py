@@ -15,6 +15,8 @@ import snowav
 from snowav.database.models import AwsmInputsOutputs
 from snowav.database.database import Database
 from snowav.database.tables import Pixels, PixelsData
+from snowav.database.writer import DatabaseWriter
+from snowav.framework.consolidate import cube_entry, cube_index, cube_points
 
 
 class PointValues(object):
@@ -495,6 +497,11 @@ def save_csv(pv):
 def load_data(pv):
     """ Load smrf and iSnobal outputs from pv.run_dirs and pv.data_dirs.
 
+    Each variable is read once per file, over the rows and columns that
+    contain the locations, and the values for every location are taken from
+    it with a single index. Run directories that are current in the [basin]
+    cube are read from the cube, once for each cube time chunk.
+
     Assigns:
     pv.var_dict {dict}: {(x, y): 'data': df,
                                  'name': name,
@@ -513,251 +520,270 @@ def load_data(pv):
     pv.var_dict = {}
     for index, row in pv.data.iterrows():
         loc = (int(row[pv.model_xind]), int(row[pv.model_yind]))
-        pv.var_dict[loc] = {'data': pv.tvar.copy(),
+        pv.var_dict[loc] = {'data': None,
                             'name': row[pv.name_col],
                             'description': row[pv.description_col],
                             'location': base_location}
 
+    locs = list(pv.var_dict.keys())
+    xs = np.array([loc[0] for loc in locs])
+    ys = np.array([loc[1] for loc in locs])
+    x0, x1 = xs.min(), xs.max() + 1
+    y0, y1 = ys.min(), ys.max() + 1
+
+    # time series for all locations by column, as lists of
+    # (date_time, values) arrays with values shaped (time, location)
+    series = {}
+
+    if pv.cube is not None:
+        index = cube_index(pv.cube)
+    else:
+        index = {}
+
+    cube_entries = []
+
     # each runs/ and data/ directory
     for n, d in enumerate(pv.run_dirs + pv.data_dirs):
         pv.logger.debug(" Working in {}".format(d))
 
+        entry = cube_entry(index, d)
+
+        if entry is not None:
+            cube_entries.append(entry)
+            continue
+
         # each file, i.e. snow.nc
         for file in os.listdir(d):
             filepath = os.path.join(d, file)
 
             # if it's a valid file and one we need
-            if os.path.isfile(filepath) and \
-                    file in list(pv.properties_lookup.keys()):
-
-                try:
-                    data = nc.Dataset(filepath)
-                    date_time = nc.num2date(data.variables['time'][:],
-                                            data.variables['time'].units)
-                except Exception as e:
-                    print(e)
-
-                pv.logger.debug(" Opened {}".format(file))
-
-                # ensure that outputs are hourly
-                for i, dt in enumerate(date_time):
-                    date_time[i] = date_time[i].replace(minute=0,
-                                                        second=0,
-                                                        microsecond=0)
-
-                # for each band
-                for v, b in pv.properties_lookup[file]['bands'].items():
-
-                    # for each location
-                    for item, row in pv.data.iterrows():
-                        loc = (int(row[pv.model_xind]), int(row[pv.model_yind]))
-
-                        # snowav --> .nc
-                        if v in pv.bandsmap.keys() and b is not None:
-                            v = pv.bandsmap[v]
-
-                        try:
-                            # nans in some of the netcdf files give runtime
-                            # warnings when being loaded. As far as I can tell
-                            # the only fix is fill_value when creating.
-                            img = data.variables[v][:]
-                        except KeyError as e:
-                            print('{} not a variable in {}'.format(e, file))
-
-                        # check dimensions of the first image opened
-                        if n == 0 and (pv.basin_y, pv.basin_x) != img[0].shape:
-                            pv.logger.error(" output dimensions {} "
-                                            "do not match topo "
-                                            "({}, {})".format(img[0].shape,
-                                                              pv.basin_y,
-                                                              pv.basin_x))
-
-                        for ih in range(0, len(date_time)):
-                            if v == 'snow_density' and file == 'snow.nc':
-                                vt = 'density'
-                            else:
-                                vt = v
-
-                            if ih < 24:
-                                dth = date_time[ih]
-                                pv.var_dict[loc]['data'].loc[dth, vt] = \
-                                    img[ih, loc[1], loc[0]]
-
-                                pv.logger.debug(" Write to df: {}, {}, "
-                                                "{}".format(v, loc, dth))
-
-                data.close()
-
-    pv.var_dict[loc]['data'].sort_index(inplace=True)
+            if not (os.path.isfile(filepath) and
+                    file in list(pv.properties_lookup.keys())):
+                continue
+
+            try:
+                data = nc.Dataset(filepath)
+                date_time = nc.num2date(data.variables['time'][:],
+                                        data.variables['time'].units)
+            except Exception as e:
+                print(e)
+
+            pv.logger.debug(" Opened {}".format(file))
+
+            # ensure that outputs are hourly, and use the first 24 hours
+            nt = min(len(date_time), 24)
+            date_time = pd.DatetimeIndex([datetime(t.year, t.month, t.day,
+                                                   t.hour)
+                                          for t in date_time[:nt]])
+
+            # for each band
+            for v, b in pv.properties_lookup[file]['bands'].items():
+
+                # snowav --> .nc
+                if v in pv.bandsmap.keys() and b is not None:
+                    v = pv.bandsmap[v]
+
+                if v not in data.variables:
+                    print('{} not a variable in {}'.format(v, file))
+                    continue
+
+                # check dimensions of the first image opened
+                shape = data.variables[v].shape[1:]
+                if n == 0 and (pv.basin_y, pv.basin_x) != shape:
+                    pv.logger.error(" output dimensions {} "
+                                    "do not match topo "
+                                    "({}, {})".format(shape,
+                                                      pv.basin_y,
+                                                      pv.basin_x))
+
+                # nans in some of the netcdf files give runtime warnings
+                # when being loaded, masked values are nan
+                img = data.variables[v][:nt, y0:y1, x0:x1]
+                img = np.ma.filled(np.ma.asarray(img, dtype=float), np.nan)
+
+                if v == 'snow_density' and file == 'snow.nc':
+                    vt = 'density'
+                else:
+                    vt = v
+
+                series.setdefault(vt, []).append(
+                    (date_time, img[:, ys - y0, xs - x0]))
+
+                pv.logger.debug(" Read {} for {} locations".format(
+                    v, len(locs)))
+
+            data.close()
+
+    # the first 24 hours of each run directory in the cube
+    if cube_entries:
+        tindex = []
+        dates = []
+
+        for entry in cube_entries:
+            nt = min(len(entry['tindex']), 24)
+            tindex += entry['tindex'][:nt]
+            dates += [datetime(t.year, t.month, t.day, t.hour)
+                      for t in entry['dates'][:nt]]
+
+        date_time = pd.DatetimeIndex(dates)
+        data = nc.Dataset(pv.cube)
+
+        for file in ['snow.nc', 'em.nc']:
+            if file not in pv.properties_lookup.keys():
+                continue
+
+            for v, b in pv.properties_lookup[file]['bands'].items():
+
+                # snowav --> .nc
+                if v in pv.bandsmap.keys() and b is not None:
+                    v = pv.bandsmap[v]
+
+                if v not in data.variables:
+                    print('{} not a variable in {}'.format(v, pv.cube))
+                    continue
+
+                if v == 'snow_density' and file == 'snow.nc':
+                    vt = 'density'
+                else:
+                    vt = v
+
+                series.setdefault(vt, []).append(
+                    (date_time, cube_points(data.variables[v], tindex,
+                                            ys, xs)))
+
+                pv.logger.debug(" Read {} for {} locations from {}".format(
+                    v, len(locs), pv.cube))
+
+        data.close()
+
+    # one DataFrame for each column, with a column for each location,
+    # where later files replace earlier values for the same date_time
+    frames = {}
+    for vt, parts in series.items():
+        df = pd.DataFrame(np.concatenate([p[1] for p in parts]),
+                          index=np.concatenate([p[0] for p in parts]))
+        frames[vt] = df[~df.index.duplicated(keep='last')]
+
+    columns = list(pv.tvar.columns)
+    columns += [c for c in frames if c not in columns]
+
+    for i, loc in enumerate(locs):
+        df = pd.DataFrame({vt: frames[vt][i] for vt in frames},
+                          columns=columns)
+        df.index = pd.DatetimeIndex(df.index)
+        pv.var_dict[loc]['data'] = df.sort_index()
+
+
+def insert_pixel(db, metadata, rows, logger):
+    """ Insert Pixels metadata for a location, and its PixelsData time
+    series with the new Pixels.id.
+
+    Args
+    ------
+    db {class}: Database class
+    metadata {dict}: Pixels record
+    rows {list}: PixelsData records, without pixel_id
+    logger {class}: logger
+    """
+
+    pixel_id = int(db.insert('Pixels', metadata, logger=logger)[0])
+    logger.debug(" Metadata to database for point: "
+                 "({},{})".format(metadata['model_row'],
+                                  metadata['model_col']))
+
+    for row in rows:
+        row['pixel_id'] = pixel_id
+
+    db.insert('PixelsData', rows, logger=logger)
+    logger.debug(" Data to database for point: "
+                 "({},{})".format(metadata['model_row'],
+                                  metadata['model_col']))
 
 
 def put_on_database(db, pv):
     """ Database stream for checking for existing results, metdata, and
     results.
 
+    Existing records for every location are found with a single query, and
+    the Pixels metadata and PixelsData time series for each location are
+    written in the background while the next location is prepared, with a
+    single executemany for the time series.
+
     Args
     ------
     db {class}: Database class
     pv {class}: PointValues class
     """
 
-    # for each location
+    points = {}
     for pt in pv.var_dict:
+        points[pt] = (int(pt[0]), int(pt[1]),
+                      str(pv.var_dict[pt]['location']),
+                      str(pv.var_dict[pt]['description']),
+                      str(pv.var_dict[pt]['name']))
 
-        df = pv.var_dict[pt]['data']
-        start_date = min(df.index)
-        end_date = max(df.index)
-
-        metadata = {
-            'location': str(pv.var_dict[pt]['location']),
-            'model_row': int(pt[0]),
-            'model_col': int(pt[1]),
-            'description': str(pv.var_dict[pt]['description']),
-            'name': str(pv.var_dict[pt]['name']),
-            'utm_x': float(pv.utm_x[pt[0]]),
-            'utm_y': float(pv.utm_y[pt[1]]),
-            'elevation': float(pv.dem[pt[1], pt[0]])
-        }
-
-        pixelsparams = {
-            Pixels:
-                [
-                    ('id', 'ge', 0),
-                    ('model_row', 'eq', int(pt[0])),
-                    ('model_col', 'eq', int(pt[1])),
-                    ('name', 'eq', str(pv.var_dict[pt]['name'])),
-                    ('location', 'eq', str(pv.var_dict[pt]['location'])),
-                    ('description', 'eq', str(pv.var_dict[pt]['description']))
-                ]
-        }
-
-        params = {
-            Pixels:
-                [
-                    ('id', 'ge', 0),
-                    ('model_row', 'eq', int(pt[0])),
-                    ('model_col', 'eq', int(pt[1])),
-                    ('location', 'eq', str(pv.var_dict[pt]['location'])),
-                    ('description', 'eq', str(pv.var_dict[pt]['description'])),
-                    ('name', 'eq', str(pv.var_dict[pt]['name']))
-                ],
-            PixelsData:
-                [
-                    ('date_time', 'ge', start_date.to_pydatetime()),
-                    ('date_time', 'le', end_date.to_pydatetime()),
-                    ('pixel_id', 'ge', 0)
-                ]
-        }
-
-        # first, see if records already exist with the same values
-        results = db.query(params)
-
-        # if no existing records, put on database
-        if results.empty:
-
-            # insert metadata
-            db.insert('Pixels', metadata, logger=pv.logger)
-            pv.logger.debug(" Metadata to database for point: "
-                            "({},{})".format(metadata['model_row'],
-                                             metadata['model_col']))
-
-            # get associated Pixels.id metadata for PixelsData
-            results = db.query(pixelsparams)
-
-            max_record_id = int(max(pd.unique(results['id'])))
-
-            for idx, row in df.iterrows():
-                row = row.astype('float')
-                p = {'pixel_id': max_record_id,
-                     'date_time': idx}
-                res = row.to_dict()
-                res = {k: res[k] for k in res if not np.isnan(res[k])}
-                pixeldata = {**p, **res}
-
-                # insert data
-                db.insert('PixelsData', pixeldata, logger=pv.logger)
-
-            # log just one
-            pv.logger.debug(" Data to database for point: "
-                            "({},{})".format(metadata['model_row'],
-                                             metadata['model_col']))
-
-        # if there are existing record, check overwrite
-        else:
-            existing_record_id = pd.unique(results['id'])
-
-            if pv.overwrite:
-                # first, delete the existing metadata and records based on the
-                # existing Pixels.id
-
-                pixels_params_del = {
-                    Pixels:
-                        [
-                            ('id', 'in', [int(x) for x in results['id'].values]),
-                            ('model_row', 'eq', int(pt[0])),
-                            ('model_col', 'eq', int(pt[1])),
-                            ('location', 'eq', str(pv.var_dict[pt]['location'])),
-                            ('description', 'eq', str(pv.var_dict[pt]['description'])),
-                            ('name', 'eq', str(pv.var_dict[pt]['name']))
-                        ]
-                }
-
-                pixelsdata_params_del = {
-                    PixelsData:
-                        [
-                            ('pixel_id', 'in', [int(x) for x in results['pixel_id'].values]),
-                            ('date_time', 'ge', start_date.to_pydatetime()),
-                            ('date_time', 'le', end_date.to_pydatetime())
-                        ]
-                }
-
-                db.delete(pixelsdata_params_del)
-                db.delete(pixels_params_del)
-
-                # results = db.query(params, logger=pv.logger)
-                # # if that removed everything, also delete the metadata
-                # if results.empty:
-                #     db.delete('Pixels',
-                #               {'id': int(rec)},
-                #               logger=pv.logger)
-
-                # insert metadata
-                db.insert('Pixels', metadata, logger=pv.logger)
-                pv.logger.debug(" Metadata to database for point: "
-                                "({},{})".format(metadata['model_row'],
-                                                 metadata['model_col']))
+    if not points:
+        return
 
-                # get associated Pixels.id metadata for PixelsData with the
-                # same query params
-                results = db.query(pixelsparams)
-                record_id = int(max(pd.unique(results['id'])))
+    start_date = min(min(pv.var_dict[pt]['data'].index) for pt in points)
+    end_date = max(max(pv.var_dict[pt]['data'].index) for pt in points)
+    start_date = pd.Timestamp(start_date).to_pydatetime()
+    end_date = pd.Timestamp(end_date).to_pydatetime()
 
-                # prepare data to put on database
-                df = pv.var_dict[pt]['data']
+    # first, see if records already exist with the same values
+    existing = db.pixels_index(list(points.values()), start_date, end_date)
 
-                for idx, row in df.iterrows():
-                    row = row.astype('float')
-                    p = {'pixel_id': int(record_id),
-                         'date_time': idx}
-                    res = row.to_dict()
-                    res = {k: res[k] for k in res if not np.isnan(res[k])}
-                    pixeldata = {**p, **res}
+    if existing and pv.overwrite:
+        # delete the existing metadata and records for every location at once
+        pixel_ids = sorted(set.union(*existing.values()))
 
-                    # insert data
-                    db.insert('PixelsData', pixeldata, logger=pv.logger)
+        db.delete({PixelsData: [('pixel_id', 'in', pixel_ids),
+                                ('date_time', 'ge', start_date),
+                                ('date_time', 'le', end_date)]})
+        db.delete({Pixels: [('id', 'in', pixel_ids)]})
 
-                # log just one
-                pv.logger.debug(" Data to database for point: "
-                                "({},{})".format(metadata['model_row'],
-                                                 metadata['model_col']))
+    writer = DatabaseWriter()
 
-            else:
+    try:
+        for pt, key in points.items():
+
+            metadata = {
+                'location': key[2],
+                'model_row': key[0],
+                'model_col': key[1],
+                'description': key[3],
+                'name': key[4],
+                'utm_x': float(pv.utm_x[pt[0]]),
+                'utm_y': float(pv.utm_y[pt[1]]),
+                'elevation': float(pv.dem[pt[1], pt[0]])
+            }
+
+            if key in existing and not pv.overwrite:
                 pv.logger.info(" Database records exist for {}, ({},{}) "
                                "and [point_values] overwrite: False, "
                                "values not put on "
                                "database".format(metadata['location'],
                                                  metadata['model_row'],
                                                  metadata['model_col']))
+                continue
+
+            # nan values are put on the database as null
+            df = pv.var_dict[pt]['data'].astype('float')
+            values = df.values.astype(object)
+            values[np.isnan(df.values)] = None
+
+            rows = [{'date_time': pd.Timestamp(idx).to_pydatetime(),
+                     **dict(zip(df.columns, row))}
+                    for idx, row in zip(df.index, values)]
+
+            # the Pixels and PixelsData inserts are both made by the writer
+            # thread, so that there is only one database writer
+            writer.put(insert_pixel, db, metadata, rows, pv.logger)
+
+        writer.close()
+
+    finally:
+        writer.close(raise_error=False)
 
 
 def run_point_values(point_values_config, master_config, blank):
@@ -1,16 +1,18 @@
 from copy import deepcopy
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
+import multiprocessing
 import numpy as np
 import os
 import pandas as pd
 from sys import exit
 import warnings
 
-from snowav.database.database import package
-from snowav.database.tables import Results, RunMetadata, Inputs
-from snowav.utils.utilities import calculate, sum_precip, snow_line, \
-    input_summary
+from snowav.database.database import delete_range, package, \
+    package_inputs
+from snowav.database.writer import DatabaseWriter
+from snowav.utils.utilities import sum_precip, snow_line, input_summary, \
+    save_totals
 
 
 class Process(object):
@@ -30,14 +32,29 @@ class Process(object):
         elapsed_hours = 0
         variables = cfg.variables.variables
 
-        if os.path.splitext(cfg.connector)[1] == '.db':
-            dbs = 'sqlite'
-        else:
-            dbs = 'sql'
+        # images for figures, in [snowav] dtype. With [run] incremental these
+        # start from the totals through cfg.totals['date'], and only later
+        # days are added
+        precip_total = np.zeros((cfg.nrows, cfg.ncols), dtype=cfg.dtype)
+        rain_total = np.zeros((cfg.nrows, cfg.ncols), dtype=cfg.dtype)
+        totals_date = None
+
+        # swi_total is the sum of swi_z for every day but the last, which is
+        # swi_last
+        swi_total = None
+        swi_last = None
+
+        if cfg.swi_flag or cfg.precip_depth_flag:
+            swi_total = np.zeros((cfg.nrows, cfg.ncols), dtype=cfg.dtype)
 
-        # images for figures
-        precip_total = np.zeros((cfg.nrows, cfg.ncols))
-        rain_total = np.zeros((cfg.nrows, cfg.ncols))
+        if cfg.totals is not None:
+            totals_date = cfg.totals['date']
+            swi_total = cfg.totals['swi'].astype(cfg.dtype)
+            swi_last = cfg.totals['swi_last'].astype(cfg.dtype)
+
+            if 'precip' in cfg.totals:
+                precip_total = cfg.totals['precip'].astype(cfg.dtype)
+                rain_total = cfg.totals['rain'].astype(cfg.dtype)
 
         # Check that topo and outputs are the same dimensions
         if cfg.outputs['swe_z'][0].shape != cfg.dem.shape:
@@ -47,31 +64,97 @@ class Process(object):
                                       cfg.outputs['swe_z'][0].shape))
             exit()
 
-        # process each date
-        for iters, out_date in enumerate(cfg.outputs['dates']):
-            wy_hour = int(cfg.outputs['time'][iters])
-            dir_str = cfg.rundirs_dict[wy_hour].split('/')[-1]
-            odate_str = out_date.strftime("%Y-%-m-%-d %H:00")
-
-            # assume to start that we are processing everything
-            proc_list = deepcopy(cfg.variables.snowav_results_variables)
-            pass_flag = False
-
-            # delete anything on the database with the same run_name and date
-            for bid in cfg.plotorder:
-                params = {Results: [('date_time', 'eq', out_date),
-                                    ('basin_id', 'eq', cfg.basins[bid]['basin_id']),
-                                    ('run_id', 'ge', 0)
-                                    ],
-                          RunMetadata: [('run_name', 'eq', cfg.run_name)]}
-                results = db.query(params)
-
-                if len(results['run_id'].unique()) > 1:
-                    cfg._logger.warn(" Multiple database 'run_id' values "
-                                     "returned for single query")
-
-                if not results.empty:
-                    if not cfg.db_overwrite:
+        # with [run] incremental, days up to cfg.last_date were processed by
+        # an earlier run, and are only used for the precip_depth and density
+        # figures
+        dates = cfg.outputs['dates']
+        first = 0
+
+        if cfg.last_date is not None:
+            first = len([d for d in dates if d <= cfg.last_date])
+            logging.info(' Incremental processing, {} of {} days are after '
+                         '{}'.format(len(dates) - first, len(dates),
+                                     cfg.last_date))
+
+        # Results records that already exist for this run_name, from a single
+        # query, indexed by date and basin for the checks below
+        existing = {}
+        records = []
+
+        if first < len(dates):
+            records = db.results_index(cfg.run_name, dates[first], dates[-1])
+
+        for date_time, basin_id, variable, run_id in records:
+            existing.setdefault((date_time, basin_id), set()).add(run_id)
+
+        # likewise the days that have Inputs records
+        existing_inputs = set()
+        if cfg.inputs_flag and first < len(dates):
+            existing_inputs = db.inputs_index(
+                cfg.run_name, datetime.combine(dates[first].date(),
+                                               datetime.min.time()),
+                dates[-1] + timedelta(days=1))
+
+        # database writes are made in order by a background thread, so the
+        # next day is read and calculated while the last one is written
+        writer = DatabaseWriter(cfg.db_write_queue)
+        pool = None
+
+        try:
+            # with db_overwrite, every existing record for the days being
+            # processed is deleted at once, before anything is written. Days
+            # between them that are not in the outputs are kept
+            if cfg.db_overwrite and (existing or existing_inputs):
+                days = list(dates[first:])
+                input_basin_ids = None
+
+                if cfg.inputs_flag:
+                    input_basin_ids = [int(cfg.basins[b]['basin_id'])
+                                       for b in cfg.inputs_basins]
+
+                logging.info(' Deleting database records for {} from {} to '
+                             '{}'.format(cfg.run_name, min(days), max(days)))
+
+                writer.put(delete_range, cfg.connector, cfg.run_name,
+                           min(days), max(days),
+                           [int(cfg.basins[b]['basin_id'])
+                            for b in cfg.plotorder],
+                           input_basin_ids=input_basin_ids,
+                           input_variables=(
+                               cfg.variables.snowav_inputs_variables),
+                           keep_run_ids=[cfg.run_id], dates=days)
+
+            # check the database and process inputs for each date, and make
+            # a list of the days that need output statistics
+            tasks = []
+
+            for iters, out_date in enumerate(cfg.outputs['dates']):
+                wy_hour = int(cfg.outputs['time'][iters])
+                dir_str = cfg.rundirs_dict[wy_hour].split('/')[-1]
+                odate_str = out_date.strftime("%Y-%-m-%-d %H:00")
+
+                # assume to start that we are processing everything
+                proc_list = deepcopy(cfg.variables.snowav_results_variables)
+                pass_flag = False
+
+                if iters < first:
+                    pass_flag = True
+
+                    if out_date == dates[-1] and cfg.density_flag:
+                        proc_list = ['density']
+                    else:
+                        proc_list = []
+
+                # skip days that have database records, unless overwriting
+                for bid in cfg.plotorder:
+                    basin_id = int(cfg.basins[bid]['basin_id'])
+                    run_ids = existing.get((out_date, basin_id), set())
+
+                    if len(run_ids) > 1:
+                        cfg._logger.warn(" Multiple database 'run_id' values "
+                                         "returned for single query")
+
+                    if run_ids and not cfg.db_overwrite:
                         # If database records exist we can skip all outputs
                         # but density on the last day, if making the figure
                         pass_flag = True
@@ -91,290 +174,356 @@ class Process(object):
                         else:
                             proc_list = []
 
+                # if database records don't exist, or we are making the
+                # precip_depth figure we need to process precip
+                precip_paths = None
+                new = totals_date is None or out_date > totals_date
+
+                if not pass_flag or (cfg.precip_depth_flag and new):
+                    run_dir = cfg.rundirs_dict[cfg.outputs['time'][iters]]
+                    precip_path = os.path.join(
+                        run_dir.replace('/runs/run', '/data/data'),
+                        'smrfOutputs/precip.nc')
+
+                    percent_snow_path = precip_path.replace('precip.nc',
+                                                            'percent_snow.nc')
+
+                    if (os.path.isfile(precip_path) and
+                            os.path.isfile(percent_snow_path)):
+                        precip_paths = (precip_path, percent_snow_path)
                     else:
-                        del_params = {
-                            Results: [
-                                ('date_time', 'eq', out_date),
-                                ('basin_id', 'eq', cfg.basins[bid]['basin_id']),
-                                ('run_id', 'in', [int(x) for x in results['run_id'].unique()])
-                            ]
-                        }
-
-                        db.delete(del_params)
-                        logging.debug(' Deleting database records for '
-                                      '{}, {}'.format(bid, odate_str))
-
-                        # query again, and if we have deleted everything from
-                        # that run, also delete the metadata
-                        results = db.query(params)
-                        del_params = {
-                            RunMetadata: [
-                                ('run_id', 'in', [int(x) for x in results['run_id'].unique()])
-                            ]
-                        }
-
-                        if results.empty:
-                            db.delete(del_params)
+                        logging.warning(' One or both of precip.nc, '
+                                        'percent_snow.nc does not exist')
 
-            density = {}
-            for name in cfg.masks:
-                density[name] = {}
+                if cfg.inputs_flag and iters >= first:
+                    sf = cfg.rundirs_dict[wy_hour].replace('runs', 'data')
+                    sf = sf.replace('run', 'data') + '/smrfOutputs/'
+                    day = out_date.date()
+                    input_rows = []
+
+                    for input in cfg.variables.snowav_inputs_variables:
+                        basins = []
+
+                        for basin in cfg.inputs_basins:
+                            basin_id = int(cfg.basins[basin]['basin_id'])
+
+                            if ((day, basin_id, input) not in existing_inputs
+                                    or cfg.db_overwrite):
+                                basins.append(basin)
 
-            # if database records don't exist, or we are making the
-            # precip_depth figure we need to process precip
-            if not pass_flag or cfg.precip_depth_flag:
-                logging.info(' Processing precip {}'.format(
-                    dir_str))
-                run_dir = cfg.rundirs_dict[cfg.outputs['time'][iters]]
-                precip_path = os.path.join(
-                    run_dir.replace('/runs/run', '/data/data'),
-                    'smrfOutputs/precip.nc')
-
-                percent_snow_path = precip_path.replace('precip.nc',
-                                                        'percent_snow.nc')
-
-                if (os.path.isfile(precip_path) and
-                        os.path.isfile(percent_snow_path)):
-                    precip, rain = sum_precip(precip_path,
-                                              percent_snow_path)
-                    precip_total = precip_total + precip
-                    rain_total = rain_total + rain
-                else:
-                    logging.warning(' One or both of precip.nc, '
-                                    'percent_snow.nc does not exist')
-
-            if cfg.inputs_flag:
-                mask_list = []
-                for name in cfg.masks:
-                    mask_list.append(deepcopy(cfg.masks[name]['mask']))
-
-                sf = cfg.rundirs_dict[wy_hour].replace('runs', 'data')
-                sf = sf.replace('run', 'data') + '/smrfOutputs/'
-
-                params = {Inputs: [
-                    ('date_time', 'eq', out_date),
-                    ('basin_id', 'eq', cfg.basins[bid]['basin_id']),
-                    ('run_name', 'eq', cfg.run_name),
-                    ('variable', 'in', cfg.variables.snowav_inputs_variables)
-                ],
-                }
-
-                df = db.query(params)
-                idx = df.index
-
-                for i, input in enumerate(cfg.variables.snowav_inputs_variables):
-                    input_path = os.path.join(sf, input + '.nc')
-
-                    for basin in cfg.inputs_basins:
-                        basin_id = int(cfg.basins[basin]['basin_id'])
-
-                        if (not idx.contains(out_date) or
-                                (idx.contains(out_date) and cfg.db_overwrite)):
-                            if basin == cfg.inputs_basins[0] and i == 0:
-                                logging.info(' Processing {} inputs, '
-                                             '{} '.format(basin, odate_str))
-                            else:
-                                logging.debug(' Processing {}, {}, '
-                                              '{}'.format(input, basin,
-                                                          odate_str))
-
-                            mask = cfg.masks[basin]['mask']
-
-                            input_summary(input_path,
-                                          input,
-                                          cfg.inputs_methods,
-                                          cfg.inputs_percentiles,
-                                          dbs,
-                                          cfg.connector,
-                                          cfg.run_name,
-                                          basin_id,
-                                          cfg.run_id,
-                                          mask)
-
-                        if idx.contains(out_date) and not cfg.db_overwrite:
-                            if ((basin == cfg.inputs_basins[0]) and
-                                    (input == cfg.inputs_variables[0])):
-                                logging.info(' Skipping inputs for {}, {}, {},'
-                                             ' database records exist...'
-                                             ''.format(input,
-                                                       basin,
-                                                       odate_str))
                             else:
                                 logging.debug(' Skipping inputs for {}, {}, '
                                               '{}, database records exist...'
-                                              ''.format(input,
-                                                        basin,
+                                              ''.format(input, basin,
                                                         odate_str))
 
-            swe = deepcopy(cfg.outputs['swe_z'][iters])
-            cold = deepcopy(cfg.outputs['coldcont'][iters])
+                        if not basins:
+                            continue
+
+                        input_rows += input_summary(
+                            os.path.join(sf, input + '.nc'),
+                            input,
+                            cfg.inputs_methods,
+                            cfg.inputs_percentiles,
+                            {b: cfg.masks[b]['mask'] for b in basins},
+                            {b: cfg.basins[b]['basin_id'] for b in basins},
+                            cfg.run_name,
+                            cfg.run_id,
+                            unit=cfg.variables.vars[input]['units'],
+                            window=cfg.window, dtype=cfg.dtype,
+                            mask_and_scale=cfg.mask_and_scale)
+
+                    if input_rows:
+                        logging.info(' Processing inputs, '
+                                     '{}'.format(odate_str))
+                        writer.put(package_inputs, cfg.connector,
+                                   input_rows)
+                    else:
+                        logging.info(' Skipping inputs for {}, database '
+                                     'records exist...'.format(odate_str))
+
+                tasks.append({'iters': iters,
+                              'date': out_date,
+                              'new': new,
+                              'dir_str': dir_str,
+                              'proc_list': proc_list,
+                              'pass_flag': pass_flag,
+                              'precip_paths': precip_paths,
+                              'last': out_date == cfg.outputs['dates'][-1]})
+
+            # Statistics for each day are independent, so they can be made in
+            # a process pool. Results come back in date order, and only this
+            # process writes to the database and sums precip.
+            state = process_state(cfg)
+
+            if cfg.processes > 1 and len(tasks) > 1:
+                nproc = min(cfg.processes, len(tasks))
+                logging.info(' Processing {} days with {} '
+                             'processes'.format(len(tasks), nproc))
+
+                # workers open their own files
+                cfg.outputs.close()
+
+                # workers are spawned rather than forked, so that they don't
+                # inherit the writer thread or a lock that it holds
+                ctx = multiprocessing.get_context('spawn')
+                pool = ctx.Pool(nproc, initializer=init_worker,
+                                initargs=(state,))
+                days = pool.imap(process_worker, tasks)
+
+            else:
+                days = (process_day(state, task) for task in tasks)
 
-            # Loop over outputs (depths are copied, volumes are calculated)
-            for k in proc_list:
+            density = {}
+            for name in cfg.masks:
+                density[name] = {}
 
-                # Mask by subbasin
-                for name in cfg.masks:
-                    if name == cfg.plotorder[0] and k == proc_list[0]:
-                        logging.info(' Processing {}, {}'.format(name,
-                                                                 dir_str))
-                    else:
-                        logging.debug(' Processing {}, {}, {}'.format(k, name,
-                                                                      dir_str))
+            for task, day in zip(tasks, days):
+                wy_hour = int(cfg.outputs['time'][task['iters']])
 
-                    mask = deepcopy(cfg.masks[name]['mask'])
-                    elevbin = cfg.ixd * mask
+                if day['precip'] is not None and task['new']:
+                    precip_total += day['precip']
+                    rain_total += day['rain']
 
-                    snow_mask = swe > 0
-                    avail_mask = cold > cfg.cclimit
-                    unavail_mask = cold <= cfg.cclimit
+                if swi_total is not None and task['new']:
+                    if swi_last is not None:
+                        swi_total += swi_last
+                    swi_last = cfg.outputs['swi_z'][task['iters']]
 
-                    if k in cfg.variables.awsm_variables:
-                        o = deepcopy(cfg.outputs[k][iters])
+                if day['density'] is not None:
+                    density = day['density']
 
-                    # elevation band
-                    for n in np.arange(0, len(cfg.edges)):
-                        b = cfg.edges[n]
-                        elev_mask = elevbin == n
+                if not task['pass_flag']:
+                    writer.put(package, cfg.connector, cfg.basins,
+                               day['results'], cfg.run_id, cfg.vid,
+                               task['date'], cfg.run_name)
 
-                        # list of masks
-                        be = [mask, elev_mask]
-                        ba = [mask, avail_mask]
-                        bu = [mask, unavail_mask]
-                        bes = [mask, elev_mask, snow_mask]
-                        besa = [mask, elev_mask, snow_mask, avail_mask]
-                        besu = [mask, elev_mask, snow_mask, unavail_mask]
-
-                        if k == 'swe_z':
-                            variables['swe_unavail']['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, besu, 'sum', 'volume',
-                                          cfg.units, cfg.dplcs)
-                            variables['swe_avail']['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, besa, 'sum', 'volume',
-                                          cfg.units, cfg.dplcs)
-                            variables['swe_vol']['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, be, 'sum', 'volume',
-                                          cfg.units, cfg.dplcs)
-                            variables[k]['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, be, 'mean', 'depth',
-                                          cfg.units, cfg.dplcs)
-
-                        if k == 'swi_z':
-                            variables[k]['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, be, 'mean', 'depth',
-                                          cfg.units, cfg.dplcs)
-                            variables['swi_vol']['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, be, 'sum', 'volume',
-                                          cfg.units, cfg.dplcs)
-
-                        if k in cfg.variables.process_depth_units:
-
-                            # iSnobal depth units are m
-                            if k == 'depth':
-                                type = 'snow_depth'
-                            else:
-                                type = variables[k]['unit_type']
-
-                            variables[k]['df'].loc[b, name] = \
-                                calculate(o, cfg.pixel, bes,
-                                          variables[k]['calculate'], type,
-                                          cfg.units, cfg.dplcs)
-
-                            if (out_date == cfg.outputs['dates'][-1] and
-                                    k == 'density'):
-                                od = deepcopy(o)
-                                ml = [mask, elev_mask, snow_mask]
-                                for m in ml:
-                                    m = m.astype('float')
-                                    m[m < 1] = np.nan
-                                    od = od * m
-
-                                density[name][cfg.edges[n]] = deepcopy(od)
-
-                        if k == 'precip_z':
-                            variables['precip_z']['df'].loc[b, name] = \
-                                calculate(precip, cfg.pixel, be,
-                                          variables[k]['calculate'],
-                                          variables[k]['unit_type'], cfg.units,
-                                          cfg.dplcs)
-                            variables['rain_z']['df'].loc[b, name] = \
-                                calculate(rain, cfg.pixel, be,
-                                          variables[k]['calculate'],
-                                          variables[k]['unit_type'], cfg.units,
-                                          cfg.dplcs)
-                            variables['precip_vol']['df'].loc[b, name] = \
-                                calculate(precip, cfg.pixel, be, 'sum',
-                                          'volume', cfg.units, cfg.dplcs)
-
-                    if k in cfg.variables.process_depth_units:
-
-                        if k == 'depth':
-                            type = 'snow_depth'
-                        else:
-                            type = variables[k]['unit_type']
-                        variables[k]['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, [mask, snow_mask],
-                                      variables[k]['calculate'], type,
-                                      cfg.units, cfg.dplcs)
-
-                    if k == 'swe_z':
-                        variables['swe_vol']['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, mask, 'sum', 'volume',
-                                      cfg.units, cfg.dplcs)
-                        variables['swe_avail']['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, ba, 'sum', 'volume',
-                                      cfg.units, cfg.dplcs)
-                        variables['swe_unavail']['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, bu, 'sum', 'volume',
-                                      cfg.units, cfg.dplcs)
-                        variables[k]['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, mask, 'mean', 'depth',
-                                      cfg.units, cfg.dplcs)
-
-                        if 'snow_line' in proc_list:
-                            variables['snow_line']['df'].loc['total', name] = \
-                                snow_line(o, cfg.dem, mask,
-                                          cfg.diagnostics_flag)
-
-                    if k == 'swi_z':
-                        variables[k]['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, mask, 'mean', 'depth',
-                                      cfg.units, cfg.dplcs)
-                        variables['swi_vol']['df'].loc['total', name] = \
-                            calculate(o, cfg.pixel, mask, 'sum', 'volume',
-                                      cfg.units, cfg.dplcs)
-
-                    if k == 'precip_z':
-                        variables['precip_z']['df'].loc['total', name] = \
-                            calculate(precip, cfg.pixel, mask, 'mean', 'depth',
-                                      cfg.units, cfg.dplcs)
-                        variables['precip_vol']['df'].loc['total', name] = \
-                            calculate(precip, cfg.pixel, mask, 'sum', 'volume',
-                                      cfg.units, cfg.dplcs)
-                        variables['rain_z']['df'].loc['total', name] = \
-                            calculate(rain, cfg.pixel, mask, 'mean', 'depth',
-                                      cfg.units, cfg.dplcs)
-
-                df = deepcopy(variables[k]['df'])
-                df = df.round(decimals=cfg.dplcs)
-
-                if k == 'snow_line':
-                    df = df[df.index == 'total']
-
-                if not pass_flag:
-                    package(cfg.connector, cfg.basins, df, cfg.run_id, cfg.vid,
-                            k, out_date)
-
-            stamp = datetime.now().strftime("%Y-%-m-%-d %H:%M:%S")
-            if not pass_flag:
-                logging.info(' Completed {} at {} UTC'.format(dir_str, stamp))
-
-                if iters != 0 and int(wy_hour - elapsed_hours) != 24:
-                    logging.warning(' Elapsed hours: {}, there may be a '
-                                    'missing output '
-                                    'day'.format(str(wy_hour - elapsed_hours)))
-
-            elapsed_hours = int(wy_hour)
+                stamp = datetime.now().strftime("%Y-%-m-%-d %H:%M:%S")
+                if not task['pass_flag']:
+                    logging.info(' Completed {} at {} UTC'.format(
+                        task['dir_str'], stamp))
+
+                    if (task['iters'] != 0 and
+                            int(wy_hour - elapsed_hours) != 24):
+                        logging.warning(' Elapsed hours: {}, there may be a '
+                                        'missing output day'.format(
+                                            str(wy_hour - elapsed_hours)))
+
+                elapsed_hours = int(wy_hour)
+
+            # everything is on the database before figures query it
+            writer.close()
+
+            if cfg.totals_path is not None and cfg.totals_names:
+                images = {'precip': precip_total, 'rain': rain_total,
+                          'swi': swi_total, 'swi_last': swi_last}
+                save_totals(cfg.totals_path, dates[0], dates[-1],
+                            **dict((k, images[k]) for k in cfg.totals_names))
+
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+            writer.close(raise_error=False)
 
         self.density = density
         self.precip_total = precip_total
         self.rain_total = rain_total
+        self.swi_total = swi_total
+
+
+# state for process pool workers, set once per worker by init_worker()
+_worker_state = None
+
+
+def process_state(cfg):
+    """ Config values that process_day() needs. This is sent once to each
+    process pool worker, rather than with every day.
+
+    Args
+    ------
+    cfg: config class
+
+    Returns
+    ------
+    state {dict}: process_day() state
+    """
+
+    state = {'outputs': cfg.outputs,
+             'zonal': cfg.zonal,
+             'masks': cfg.masks,
+             'dem': cfg.dem,
+             'ixd': cfg.ixd,
+             'edges': cfg.edges,
+             'cclimit': cfg.cclimit,
+             'dplcs': cfg.dplcs,
+             'diagnostics_flag': cfg.diagnostics_flag,
+             'plotorder': cfg.plotorder,
+             'precip_cache_dir': cfg.precip_cache_dir,
+             'window': cfg.window,
+             'mask_and_scale': cfg.mask_and_scale,
+             'dtype': cfg.dtype,
+             'variables': cfg.variables.variables,
+             'awsm_variables': cfg.variables.awsm_variables,
+             'process_depth_units': cfg.variables.process_depth_units}
+
+    return state
+
+
+def init_worker(state):
+    """ Process pool initializer.
+
+    Args
+    ------
+    state {dict}: from process_state()
+    """
+
+    global _worker_state
+    _worker_state = state
+    warnings.filterwarnings('ignore')
+
+
+def process_worker(task):
+    """ Process pool function, process_day() with the worker state. """
+
+    return process_day(_worker_state, task)
+
+
+def process_day(state, task):
+    """ Calculate basin and elevation band results for a single output day.
+
+    Args
+    ------
+    state {dict}: from process_state()
+    task {dict}: day from Process, with 'iters', 'dir_str', 'proc_list',
+        'precip_paths', and 'last'
+
+    Returns
+    ------
+    day {dict}: 'results' dataframes by variable, daily 'precip' and 'rain'
+        images or None, and 'density' images on the last day or None
+    """
+
+    iters = task['iters']
+    dir_str = task['dir_str']
+    proc_list = task['proc_list']
+    outputs = state['outputs']
+    variables = state['variables']
+    masks = state['masks']
+    edges = state['edges']
+    zonal = state['zonal']
+
+    precip = None
+    rain = None
+    density = None
+
+    if task['precip_paths'] is not None:
+        logging.info(' Processing precip {}'.format(dir_str))
+        precip, rain = sum_precip(*task['precip_paths'],
+                                  cache_dir=state['precip_cache_dir'],
+                                  window=state['window'],
+                                  mask_and_scale=state['mask_and_scale'],
+                                  dtype=state['dtype'])
+
+    # dataframes calculated for the day, by variable
+    dfs = {}
+
+    # results for the day, written to the database together
+    results = {}
+
+    if proc_list:
+        swe = outputs['swe_z'][iters]
+        cold = outputs['coldcont'][iters]
+
+        snow_mask = swe > 0
+        avail_mask = cold > state['cclimit']
+        unavail_mask = cold <= state['cclimit']
+
+    # Loop over outputs (depths are copied, volumes are calculated),
+    # each ZonalStats call returns all basins and elevation bands
+    for k in proc_list:
+        if k == proc_list[0]:
+            logging.info(' Processing {}, {}'.format(state['plotorder'][0],
+                                                     dir_str))
+        else:
+            logging.debug(' Processing {}, {}'.format(k, dir_str))
+
+        if k in state['awsm_variables']:
+            o = outputs[k][iters]
+
+        if k == 'swe_z':
+            dfs['swe_unavail'] = zonal.calculate(
+                o, 'sum', 'volume', where=snow_mask & unavail_mask,
+                total_where=unavail_mask)
+            dfs['swe_avail'] = zonal.calculate(
+                o, 'sum', 'volume', where=snow_mask & avail_mask,
+                total_where=avail_mask)
+            dfs['swe_vol'] = zonal.calculate(o, 'sum', 'volume')
+            dfs[k] = zonal.calculate(o, 'mean', 'depth')
+
+            if 'snow_line' in proc_list:
+                dfs['snow_line'] = deepcopy(variables['snow_line']['df'])
+                for name in masks:
+                    dfs['snow_line'].loc['total', name] = \
+                        snow_line(o, state['dem'], masks[name]['mask'],
+                                  state['diagnostics_flag'])
+
+        if k == 'swi_z':
+            dfs[k] = zonal.calculate(o, 'mean', 'depth')
+            dfs['swi_vol'] = zonal.calculate(o, 'sum', 'volume')
+
+        if k in state['process_depth_units']:
+
+            # iSnobal depth units are m
+            if k == 'depth':
+                type = 'snow_depth'
+            else:
+                type = variables[k]['unit_type']
+
+            dfs[k] = zonal.calculate(o, variables[k]['calculate'], type,
+                                     where=snow_mask)
+
+            if task['last'] and k == 'density':
+                density = {}
+                for name in masks:
+                    density[name] = {}
+                    mask = masks[name]['mask']
+                    elevbin = state['ixd'] * mask
+
+                    for n in np.arange(0, len(edges)):
+                        elev_mask = elevbin == n
+                        od = deepcopy(o)
+                        ml = [mask, elev_mask, snow_mask]
+                        for m in ml:
+                            m = m.astype(o.dtype)
+                            m[m < 1] = np.nan
+                            od = od * m
+
+                        density[name][edges[n]] = od
+
+        if k == 'precip_z' and precip is not None:
+            dfs['precip_z'] = zonal.calculate(
+                precip, variables[k]['calculate'], variables[k]['unit_type'])
+            dfs['rain_z'] = zonal.calculate(
+                rain, variables[k]['calculate'], variables[k]['unit_type'])
+            dfs['precip_vol'] = zonal.calculate(precip, 'sum', 'volume')
+
+        if k in dfs:
+            df = dfs[k]
+        else:
+            df = deepcopy(variables[k]['df'])
+
+        df = df.round(decimals=state['dplcs'])
+
+        if k == 'snow_line':
+            df = df[df.index == 'total']
+
+        results[k] = df
+
+    day = {'results': results,
+           'precip': precip,
+           'rain': rain,
+           'density': density}
+
+    return day
@@ -19,7 +19,7 @@ def flt_image_change(file, update_numbers, end_date, flight_outputs,
                      pre_flight_outputs, masks, lims, barcolors, edges,
                      connector, plotorder, wy, depth_factor, basins,
                      run_name, figsize, depthlbl, elevlbl, vollbl, dplcs,
-                     figspath, dpi=200, logger=None):
+                     figspath, dpi=200, logger=None, window=None):
     """ Difference in SWE from one day prior to flight updates to the day of
     flight updates.
 
@@ -53,6 +53,10 @@ def flt_image_change(file, update_numbers, end_date, flight_outputs,
     dplcs {int}: decimal places
     figspath {str}: base path for figures
     dpi {int}: figure dpi
+    logger {class}: snowav logger
+    window {tuple}: (row slice, column slice) from crop_window() that the
+        flight_outputs images are cropped to, the flight depths are read over
+        the same window
     """
 
     e = False
@@ -86,11 +90,16 @@ def flt_image_change(file, update_numbers, end_date, flight_outputs,
     if update_numbers is not None:
         update_numbers = [int(x) for x in update_numbers]
 
+    if window is None:
+        rows, cols = slice(None), slice(None)
+    else:
+        rows, cols = window
+
     for i, time in enumerate(times):
         if update_numbers is not None:
-            depth = p.variables['depth'][update_numbers[ix[i]], :, :]
+            depth = p.variables['depth'][update_numbers[ix[i]], rows, cols]
         else:
-            depth = p.variables['depth'][ix[i], :, :]
+            depth = p.variables['depth'][ix[i], rows, cols]
 
         delta_swe = flight_outputs['swe_z'][i][:] - pre_flight_outputs['swe_z'][i][:]
         delta_swe = delta_swe * depth_factor
@@ -1,4 +1,5 @@
 from datetime import datetime
+import hashlib
 from matplotlib import pyplot as plt
 import matplotlib.dates as mdates
 import mysql.connector
@@ -9,6 +10,8 @@ import pandas as pd
 import seaborn as sns
 import utm
 
+from snowav.framework.consolidate import cube_entry, cube_index, \
+    cube_points
 from snowav.utils.stats import nashsutcliffe
 import snowav.framework.figures
 
@@ -17,7 +20,8 @@ def stn_validate(rundirs, lbls, client, end_date, wy, snow_x, snow_y, stns, px,
                  py, login, figs_path, fig_name, dem, logger=None, factor=25.4,
                  nash_sut_flag=False, ncfile='snow.nc', nc_var='specific_mass',
                  index_col='date_time', elevlbl='ft', tbl='tbl_level1',
-                 var='snow_water_equiv', dpi=200):
+                 var='snow_water_equiv', dpi=200, window=None, cube=None,
+                 cache_dir=None):
     """ SWE validation at snow pillow sites.
 
     Args
@@ -27,15 +31,15 @@ def stn_validate(rundirs, lbls, client, end_date, wy, snow_x, snow_y, stns, px,
     client {str}: weather db client
     end_date {datetime}: period end date
     wy {int}: water year
-    snow_x {}: netcdf x vector
-    snow_y {}: netcdf y vector
+    snow_x {}: netcdf x vector, of the full topo grid
+    snow_y {}: netcdf y vector, of the full topo grid
     stns {list}: list of stations
     px {arr}: +- 1 array
     py {arr}: +- 1 array
     login {dict}: database login info
     figs_path {str}: base path for fig saving
     fig_name {str}: base str for fig name
-    dem {arr}: dem
+    dem {arr}: dem, of the full topo grid
     logger {class}: snowav logger
     nash_sut_flag {bool}: include nash sutcliffe
     ncfile {str}: name of snow.nc
@@ -46,6 +50,11 @@ def stn_validate(rundirs, lbls, client, end_date, wy, snow_x, snow_y, stns, px,
     tbl {str}: weather db table
     factor {float}: conversion from mm
     logger {class}: snowav logger
+    window {tuple}: (row slice, column slice) that images are cropped to,
+        from crop_window(). Stations outside of it are still read from the
+        files
+    cube {str}: water year cube from snowav consolidate
+    cache_dir {str}: cache directory for the station index
 
     Returns
     ------
@@ -91,6 +100,18 @@ def stn_validate(rundirs, lbls, client, end_date, wy, snow_x, snow_y, stns, px,
     metadata.index = metadata['primary_id']
     metadata = metadata[~metadata.index.duplicated(keep='first')]
 
+    # model pixels for each station, checked before anything else is done
+    index = station_index(stns, metadata, snow_x, snow_y, px, py, dem,
+                          window=window, cache_dir=cache_dir, logger=logger)
+
+    for stn in stns:
+        if not index[stn]['inside']:
+            logger.info(' Station {} in [validate] stations is '
+                        'outside of domain, exiting stn_validate() '
+                        'and not generating figure'.format(stn))
+            flag = False
+            return flag
+
     # station results
     for iters, stn in enumerate(stns):
         cnx = mysql.connector.connect(user=login['user'],
@@ -148,64 +169,27 @@ def stn_validate(rundirs, lbls, client, end_date, wy, snow_x, snow_y, stns, px,
     if len(stns) == 11:
         fig.delaxes(axs[11])
 
-    for rname in rundirs:
-        logger.debug(' Loading pixel values in '
-                     '{}...'.format(rname.split('runs')[-1]))
+    # model values at the +- 1 pixels for every station, one read per file
+    model = station_pixels(rundirs, index, end_date, model, ncfile=ncfile,
+                           nc_var=nc_var, logger=logger, window=window,
+                           cube=cube)
 
-        snowfile = os.path.join(rname, ncfile)
-
-        if not os.path.isfile(snowfile):
-            raise Exception('invalid file --> {}'.format(snowfile))
-
-        ncf = nc.Dataset(snowfile, 'r')
-        t = nc.num2date(ncf.variables['time'][0], ncf.variables['time'].units)
-
-        # Only load the rundirs that we need
-        if t.date() <= end_date.date():
+    for iters, stn in enumerate(stns):
+        for ix in range(0, len(index[stn]['rows'])):
+            land_stn = stn + '_{}'.format(str(ix))
 
-            for iters, stn in enumerate(stns):
-                ll = utm.from_latlon(metadata.ix[stn, 'latitude'],
-                                     metadata.ix[stn, 'longitude'])
-                xind = np.where(abs(snow_x - ll[0]) ==
-                                min(abs(snow_x - ll[0])))[0]
-                yind = np.where(abs(snow_y - ll[1]) ==
-                                min(abs(snow_y - ll[1])))[0]
-                elev = dem[yind, xind]
-
-                if ((xind == 0) or (xind >= len(snow_x) - 1) or
-                        (yind == 0) or (yind >= len(snow_y) - 1)):
-                    logger.info(' Station {} in [validate] stations is '
-                                'outside of domain, exiting stn_validate() '
-                                'and not generating figure'.format(stn))
-                    flag = False
-                    return flag
-
-                for ix, (n, m) in enumerate(zip(px, py)):
-                    land_stn = stn + '_{}'.format(str(ix))
-                    swe = ncf.variables[nc_var][:, yind + m, xind + n][0][0][0]
-                    model.loc[t.date(), land_stn] = swe
-
-                    if (n == 0 and m == 0) and (rname == rundirs[-1]):
-                        lbl = 'measured'
-                        lblm = 'modeled'
-                    else:
-                        lbl = '__nolabel__'
-                        lblm = 'modeled'
-
-                    axs[iters].plot(measure[stn] / factor, 'k', label=lbl)
-                    axs[iters].plot(model[land_stn] / factor,
-                                    'b',
-                                    linewidth=0.75,
-                                    label=lblm)
-                    axs[iters].set_title('{} [{} {}]'.format(lbls[iters],
-                                                             str(int(elev)),
-                                                             elevlbl))
-                    axs[iters].set_xlim((datetime(wy - 1, 10, 1), end_date))
+            if ix == 0:
+                axs[iters].plot(measure[stn] / factor, 'k', label='measured')
 
-            ncf.close()
+            axs[iters].plot(model[land_stn] / factor,
+                            'b',
+                            linewidth=0.75,
+                            label='modeled')
 
-        else:
-            ncf.close()
+        axs[iters].set_title('{} [{} {}]'.format(lbls[iters],
+                                                 str(int(index[stn]['elev'])),
+                                                 elevlbl))
+        axs[iters].set_xlim((datetime(wy - 1, 10, 1), end_date))
 
     # Nash-Sutcliffe on pixel 0,0
     if nash_sut_flag:
@@ -301,3 +285,256 @@ def stn_validate(rundirs, lbls, client, end_date, wy, snow_x, snow_y, stns, px,
         logger.info(' Saved: {}'.format(fig_name))
 
     return flag
+
+
+def station_index(stns, metadata, snow_x, snow_y, px, py, dem, window=None,
+                  cache_dir=None, logger=None):
+    """ Model pixel row and column for each station, and for the +- 1 pixel
+    neighbourhood given by px and py. If cache_dir is given the index is
+    loaded from cache_dir when it exists, and is otherwise computed and
+    saved there. Cache files are keyed on a hash of the topo grid and dem,
+    the pixel offsets, the window and the station locations.
+
+    Stations are located on the full topo grid, and their rows and columns
+    are then offset by the window, so stations outside of the window are
+    still in the domain.
+
+    Args
+    ----------
+    stns {list}: list of stations
+    metadata {DataFrame}: weather db tbl_metadata, indexed by station, with
+        latitude and longitude
+    snow_x {arr}: netcdf x vector, of the full topo grid
+    snow_y {arr}: netcdf y vector, of the full topo grid
+    px {arr}: +- 1 array
+    py {arr}: +- 1 array
+    dem {arr}: dem, of the full topo grid
+    window {tuple}: (row slice, column slice) from crop_window() that the
+        rows and columns are relative to
+    cache_dir {str}: cache directory
+    logger {class}: snowav logger
+
+    Returns
+    ------
+    index {dict}: by station, 'row' and 'col' of the station pixel, 'rows'
+        and 'cols' arrays of the neighbourhood, 'elev', and 'inside' False if
+        the neighbourhood is not in the domain
+    """
+
+    snow_x = np.asarray(snow_x, dtype=float)
+    snow_y = np.asarray(snow_y, dtype=float)
+    locations = tuple((stn, float(metadata.loc[stn, 'latitude']),
+                       float(metadata.loc[stn, 'longitude'])) for stn in stns)
+
+    if window is None:
+        oy, ox = 0, 0
+    else:
+        oy, ox = window[0].start or 0, window[1].start or 0
+
+    path = None
+
+    if cache_dir is not None:
+        key = hashlib.sha1()
+        key.update(snow_x.tobytes())
+        key.update(snow_y.tobytes())
+        key.update(np.ascontiguousarray(dem, dtype=float).tobytes())
+        key.update(str((tuple(px), tuple(py), oy, ox, locations)).encode())
+        path = os.path.join(cache_dir,
+                            'stations_{}.npz'.format(key.hexdigest()))
+
+        if os.path.isfile(path):
+            try:
+                index = load_station_index(path)
+                if logger is not None:
+                    logger.debug(' Loaded station index {}'.format(path))
+                return index
+
+            except Exception as e:
+                if logger is not None:
+                    logger.debug(' Failed loading station index {}, {}, '
+                                 'rebuilding'.format(path, e))
+
+    index = {}
+
+    for stn, lat, lon in locations:
+        ll = utm.from_latlon(lat, lon)
+        col = int(np.argmin(abs(snow_x - ll[0])))
+        row = int(np.argmin(abs(snow_y - ll[1])))
+
+        inside = not ((col == 0) or (col >= len(snow_x) - 1) or
+                      (row == 0) or (row >= len(snow_y) - 1))
+
+        index[stn] = {'row': row - oy,
+                      'col': col - ox,
+                      'rows': row - oy + np.asarray(py, dtype=int),
+                      'cols': col - ox + np.asarray(px, dtype=int),
+                      'elev': dem[row, col],
+                      'inside': inside}
+
+    if path is not None:
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+
+            # write and rename so that other runs never load a partial file
+            tmp = '{}.{}.tmp.npz'.format(os.path.splitext(path)[0],
+                                         os.getpid())
+            save_station_index(tmp, index)
+            os.replace(tmp, path)
+
+            if logger is not None:
+                logger.debug(' Saved station index {}'.format(path))
+
+        except OSError as e:
+            if logger is not None:
+                logger.debug(' Failed saving station index {}, '
+                             '{}'.format(path, e))
+
+    return index
+
+
+def save_station_index(path, index):
+    """ Save a station index from station_index() to a .npz file.
+
+    Args
+    ----------
+    path {str}: .npz file path
+    index {dict}: from station_index()
+    """
+
+    stns = list(index.keys())
+    np.savez(path,
+             stns=np.array(stns),
+             row=np.array([index[s]['row'] for s in stns], dtype=int),
+             col=np.array([index[s]['col'] for s in stns], dtype=int),
+             rows=np.array([index[s]['rows'] for s in stns], dtype=int),
+             cols=np.array([index[s]['cols'] for s in stns], dtype=int),
+             elev=np.array([index[s]['elev'] for s in stns], dtype=float),
+             inside=np.array([index[s]['inside'] for s in stns], dtype=bool))
+
+
+def load_station_index(path):
+    """ Load a station index that was saved with save_station_index().
+
+    Args
+    ----------
+    path {str}: .npz file path
+
+    Returns
+    ------
+    index {dict}: as from station_index()
+    """
+
+    index = {}
+
+    with np.load(path) as npz:
+        for i, stn in enumerate(npz['stns']):
+            index[str(stn)] = {'row': int(npz['row'][i]),
+                               'col': int(npz['col'][i]),
+                               'rows': npz['rows'][i],
+                               'cols': npz['cols'][i],
+                               'elev': float(npz['elev'][i]),
+                               'inside': bool(npz['inside'][i])}
+
+    return index
+
+
+def station_pixels(rundirs, index, end_date, model, ncfile='snow.nc',
+                   nc_var='specific_mass', logger=None, window=None,
+                   cube=None):
+    """ Model values at every station neighbourhood pixel, for the first
+    time step of each run directory up to end_date. Each file is read once,
+    over the rows and columns that contain the stations.
+
+    Args
+    ----------
+    rundirs {list}: list of rundirs
+    index {dict}: from station_index()
+    end_date {datetime}: period end date
+    model {DataFrame}: daily DataFrame with '<station>_<n>' columns
+    ncfile {str}: name of snow.nc
+    nc_var {str}: name of nc variable
+    logger {class}: snowav logger
+    window {tuple}: (row slice, column slice) of the files that the index
+        rows and columns are relative to, from crop_window()
+    cube {str}: water year cube from snowav consolidate. Run directories
+        that are current in the cube are read from it, with one read of the
+        station pixels for each cube time chunk
+
+    Returns
+    ------
+    model {DataFrame}: model with the values filled in
+    """
+
+    columns = []
+    rows = []
+    cols = []
+
+    for stn in index:
+        for ix, (r, c) in enumerate(zip(index[stn]['rows'],
+                                        index[stn]['cols'])):
+            columns.append(stn + '_{}'.format(str(ix)))
+            rows.append(r)
+            cols.append(c)
+
+    rows = np.array(rows)
+    cols = np.array(cols)
+    r0, r1 = rows.min(), rows.max() + 1
+    c0, c1 = cols.min(), cols.max() + 1
+
+    # offset of the index rows and columns in the files
+    if window is None:
+        oy, ox = 0, 0
+    else:
+        oy, ox = window[0].start or 0, window[1].start or 0
+
+    # first time step of each run directory in the cube
+    if cube is not None:
+        entries = cube_index(cube)
+        tindex = []
+        dates = []
+        files = []
+
+        for rname in rundirs:
+            entry = cube_entry(entries, rname)
+
+            if entry is None:
+                files.append(rname)
+
+            elif entry['dates'][0].date() <= end_date.date():
+                tindex.append(entry['tindex'][0])
+                dates.append(pd.Timestamp(entry['dates'][0].date()))
+
+        if tindex:
+            ncf = nc.Dataset(cube, 'r')
+            values = cube_points(ncf.variables[nc_var], tindex, rows + oy,
+                                 cols + ox)
+            ncf.close()
+            model.loc[dates, columns] = values
+
+        rundirs = files
+
+    for rname in rundirs:
+        if logger is not None:
+            logger.debug(' Loading pixel values in '
+                         '{}...'.format(rname.split('runs')[-1]))
+
+        snowfile = os.path.join(rname, ncfile)
+
+        if not os.path.isfile(snowfile):
+            raise Exception('invalid file --> {}'.format(snowfile))
+
+        ncf = nc.Dataset(snowfile, 'r')
+        t = nc.num2date(ncf.variables['time'][0], ncf.variables['time'].units)
+
+        # Only load the rundirs that we need
+        if t.date() <= end_date.date():
+            image = ncf.variables[nc_var][0, oy + r0:oy + r1,
+                                          ox + c0:ox + c1]
+            image = np.ma.filled(np.ma.asarray(image, dtype=float), np.nan)
+            model.loc[pd.Timestamp(t.date()), columns] = \
+                image[rows - r0, cols - c0]
+
+        ncf.close()
+
+    return model
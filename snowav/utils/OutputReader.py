@@ -8,19 +8,90 @@ from netCDF4 import Dataset
 import netCDF4 as nc
 import warnings
 
+
+def nc_array(var, key, dtype=np.float64, nan_values=None):
+    """
+    Read a netcdf variable as a plain array, without netCDF4 auto masking
+    and scaling. Packed values are unpacked, and the fill value,
+    missing_value and nan_values are set to nan in place in one step, so
+    that no masked array is made.
+
+    Inputs:
+    var - netCDF4 variable, its auto mask and scale is turned off for the
+          read and then restored
+    key - index or tuple of slices to read
+    dtype - floating point dtype of the returned array
+    nan_values - optional list of values, such as the -75.0 snow.nc
+                 temperature, that are also set to nan
+
+    Returns:
+    array - dtype array
+    """
+
+    mask, scale = var.mask, var.scale
+    var.set_auto_maskandscale(False)
+
+    try:
+        raw = var[key]
+    finally:
+        var.set_auto_mask(mask)
+        var.set_auto_scale(scale)
+
+    attrs = var.ncattrs()
+
+    fills = []
+    for attr in ('_FillValue', 'missing_value'):
+        if attr in attrs:
+            fills += list(np.atleast_1d(var.getncattr(attr)))
+
+    if '_FillValue' not in attrs and raw.dtype.str[1:] in nc.default_fillvals:
+        fills.append(nc.default_fillvals[raw.dtype.str[1:]])
+
+    # fill values are compared before the cast, so that they match exactly
+    bad = None
+    if fills:
+        bad = np.isin(raw, np.asarray(fills, dtype=raw.dtype))
+
+    array = np.asarray(raw, dtype=dtype)
+
+    if 'scale_factor' in attrs:
+        array *= var.getncattr('scale_factor')
+    if 'add_offset' in attrs:
+        array += var.getncattr('add_offset')
+
+    if nan_values:
+        values = np.isin(array, nan_values)
+        bad = values if bad is None else bad | values
+
+    if bad is not None and bad.any():
+        array[bad] = np.nan
+
+    return array
+
+
 class iSnobalReader():
     def __init__(self, outputdir, timesteps=None, embands=None,
                 snowbands=None, mask=None, time_start=None, time_end=None,
-                wy=None):
+                wy=None, lazy=False, window=None, dtype=np.float64,
+                mask_and_scale=True):
         """
         Inputs:
-        outputdir - abosulte path to location of outputs
+        outputdir - abosulte path to location of outputs, or to a snowav
+                    consolidate water year cube
         timestep - list of time steps to return, default all
         embands - list of bands numbers to grab, default all
         snowbands - list of bands numbers to grab, default all
         time_start - water year hour to start grabbing files
         time_end - water year hour to end grabbing files
         wy - water year for finding dates from ipw file wyhrs
+        lazy - if True, open snow.nc and em.nc and read dates and times, but
+               no bands. Bands are then read with snow() and em(), and the
+               files stay open until close()
+        window - (row slice, column slice) to read, default the full grid
+        dtype - image dtype, np.float64 or np.float32
+        mask_and_scale - if False, read plain arrays with nc_array() rather
+                         than netCDF4 masked arrays, with fill values and
+                         the -75.0 snow.nc temperatures as nan
         """
 
         # parse innputs
@@ -30,6 +101,9 @@ class iSnobalReader():
         self.time_start = time_start
         self.time_end = time_end
         self.wy = wy
+        self.window = window
+        self.dtype = np.dtype(dtype)
+        self.mask_and_scale = mask_and_scale
 
         # list of band numbers possible
         emnums = range(10)
@@ -58,8 +132,185 @@ class iSnobalReader():
         for idn, nm in enumerate(snownames):
             self.snowdict[snownums[idn]] = nm
 
-        # read in and store the data
-        self.snow_data, self.em_data = self.read_isnobal_outputs()
+        self.lazy = lazy
+        self.ds_snow = None
+        self.ds_em = None
+
+        if self.lazy:
+            self.open()
+            self.snow_data = LazyBands(self.snow, self.snowbands)
+            self.em_data = LazyBands(self.em, self.embands)
+
+        else:
+            # read in and store the data
+            self.snow_data, self.em_data = self.read_isnobal_outputs()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        """
+        Open snow.nc and em.nc and set dates, water year hours, and the time
+        indices given by timesteps or time_start and time_end in self.itd
+        """
+
+        warnings.simplefilter("ignore")
+
+        if self.ds_snow is not None:
+            return
+
+        # a water year cube has the snow.nc and em.nc variables in one file
+        if os.path.isfile(self.outputdir):
+            self.ds_snow = Dataset(self.outputdir, 'r')
+            self.ds_em = self.ds_snow
+
+        else:
+            pathsnow = os.path.join(self.outputdir, 'snow.nc')
+            pathem = os.path.join(self.outputdir, 'em.nc')
+            self.ds_snow = Dataset(pathsnow, 'r')
+            self.ds_em = Dataset(pathem, 'r')
+
+        # hack for different swi names
+        if 'runoff' in self.ds_em.variables:
+            self.emdict[8] = 'runoff'
+
+        self.ny = len(self.ds_snow.dimensions['y'])
+        self.nx = len(self.ds_snow.dimensions['x'])
+
+        if self.window is not None:
+            self.ny = len(range(self.ny)[self.window[0]])
+            self.nx = len(range(self.nx)[self.window[1]])
+
+        # find dates the right way
+        nc_time = self.ds_snow.variables['time'][:]
+        t_units = self.ds_snow.variables['time'].units
+        nc_calendar = self.ds_snow.variables['time'].calendar
+        nc_dates = nc.num2date(nc_time, t_units, nc_calendar)
+        self.dates = nc_dates
+
+        # calculate water year hours
+        self.wyhr = np.array([calculate_wyhr_from_date(t) for t in nc_dates],
+                             dtype=float)
+        time = self.wyhr
+
+        if self.timesteps is not None:
+            timesteps = np.array(self.timesteps)
+            itd = np.flatnonzero(np.isin(time, timesteps))
+            if len(itd) == 0:
+                raise ValueError('No matching timesteps to those given')
+            self.time = timesteps
+
+        elif self.time_start is not None and self.time_end is not None:
+            itd = np.flatnonzero((time >= self.time_start) &
+                                 (time <= self.time_end))
+            self.time = time[itd]
+
+        else:
+            itd = np.arange(0, len(time))
+            self.time = time
+
+        self.itd = itd
+
+    def close(self):
+        """ Close snow.nc and em.nc """
+
+        if self.ds_snow is not None:
+            self.ds_snow.close()
+            if self.ds_em is not self.ds_snow:
+                self.ds_em.close()
+            self.ds_snow = None
+            self.ds_em = None
+
+    def snow(self, band, idx=None):
+        """
+        Read a snow.nc band
+
+        Inputs:
+        band - snow band number
+        idx - file time index or list of indices, default is all selected
+              time indices
+
+        Returns:
+        array - dtype array, 2D for a single index and 3D otherwise
+        """
+
+        nan_values = None
+        if band in [4, 5, 6]:
+            nan_values = [-75.0]
+
+        return self._read('snow', self.snowdict[band], idx, nan_values)
+
+    def em(self, band, idx=None):
+        """
+        Read an em.nc band
+
+        Inputs:
+        band - em band number
+        idx - file time index or list of indices, default is all selected
+              time indices
+
+        Returns:
+        array - dtype array, 2D for a single index and 3D otherwise
+        """
+
+        return self._read('em', self.emdict[band], idx)
+
+    def _read(self, file, name, idx, nan_values=None):
+        """
+        Read time indices from a variable, as one contiguous slice when the
+        indices are consecutive, with nan_values set to nan
+        """
+
+        self.open()
+
+        if file == 'snow':
+            ds = self.ds_snow
+        else:
+            ds = self.ds_em
+
+        if idx is None:
+            idx = self.itd
+
+        var = ds.variables[name]
+
+        if self.window is None:
+            rows, cols = slice(None), slice(None)
+        else:
+            rows, cols = self.window
+
+        key = None
+
+        if np.ndim(idx) == 0:
+            key = (int(idx), rows, cols)
+
+        else:
+            idx = np.asarray(idx, dtype=int)
+            if len(idx) == 0:
+                array = np.zeros((0, self.ny, self.nx), dtype=self.dtype)
+            elif np.all(np.diff(idx) == 1):
+                key = (slice(idx[0], idx[-1] + 1), rows, cols)
+            else:
+                key = (idx, rows, cols)
+
+        if key is not None:
+            if self.mask_and_scale:
+                array = np.array(var[key], dtype=self.dtype)
+            else:
+                array = nc_array(var, key, self.dtype, nan_values)
+
+        # nan_values are set before the mask in both paths, so that they
+        # stay nan outside of the mask
+        if self.mask_and_scale and nan_values:
+            array[np.isin(array, nan_values)] = np.nan
+
+        # in place, so that the mask doesn't change the dtype
+        if self.mask is not None:
+            array *= np.asarray(self.mask, dtype=self.dtype)
+
+        return array
 
     def read_isnobal_outputs(self):
         """
@@ -88,6 +339,7 @@ class iSnobalReader():
     def read_isnobal_netcdf(self):
         """
         Read in specific timesteps and bands from ipw files output from isnobal.
+        Each band is read with a single slice over the requested times.
 
         Input:
         self
@@ -99,132 +351,64 @@ class iSnobalReader():
                     time series array
         """
 
-        warnings.simplefilter("ignore")
+        self.open()
 
-        name_snow_fp = 'snow'
-        name_em_fp = 'em'
-        # path to snow and em files
-        pathsnow = os.path.join(self.outputdir, name_snow_fp+'.nc')
-        pathem = os.path.join(self.outputdir, name_em_fp+'.nc')
-        # read datasets
-        ds_snow = Dataset(pathsnow, 'r')
-        ds_em = Dataset(pathem, 'r')
+        # empty dictionaries to store numpy arrays of each variable
+        snow_data = {}
+        em_data = {}
 
-        # hack for different swi names
-        if 'runoff' in ds_em.variables:
-            self.emdict[8] = 'runoff'
+        for ebd in self.embands:
+            em_data[ebd] = self.em(ebd)
 
-        # get time array from dataset
-        ny = len(ds_snow.variables['y'][:])
-        nx = len(ds_snow.variables['x'][:])
+        for sbd in self.snowbands:
+            snow_data[sbd] = self.snow(sbd)
 
-        # find dates the right way
-        nc_time = ds_snow.variables['time'][:]
-        t_units = ds_snow.variables['time'].units
-        nc_calendar = ds_snow.variables['time'].calendar
-        nc_dates = nc.num2date(nc_time, t_units, nc_calendar)
-        self.dates = nc_dates
+        # close datasets
+        self.close()
 
-        # calculate water year hours
-        time = np.zeros(len(nc_dates))
-        for ix, t in enumerate(nc_dates):
-            # calculate new date
-            dtt = t
-            # convert to wyhr
-            wyhr = calculate_wyhr_from_date(dtt)
-            # store wyhr in time array
-            time[ix] = wyhr
-
-        # mask is ones if none specified
-        if self.mask is None:
-            mask = np.ones((ny,nx))
-        else:
-            mask = self.mask
+        return snow_data, em_data
 
-        # empty dictionaries to store numpy arrays of each variable
-        snow_data = {}
-        em_data = {}
 
-        # print('Processing datasets')
-        # parse user input timesteps or use all
-        if self.timesteps is None and self.time_start is None and self.time_end is None:
-            timesteps = time
-            itd = len(time)
-            for ebd in self.embands:
-                e_name = self.emdict[ebd]
-                em_data[ebd] = ds_em.variables[e_name][:]*mask
-                #em_data[ebd][em_data[ebd] <= -75.0] = np.nan
-            for sbd in self.snowbands:
-                s_name = self.snowdict[sbd]
-                snow_data[sbd] = ds_snow.variables[s_name][:]*mask
-                #snow_data[sbd][snow_data[sbd] <= -75.0] = np.nan
-
-        # if given a start and stop time
-        elif self.timesteps is None and self.time_start is not None and self.time_end is not None:
-            # only time steps in desired timeframe
-            timesteps = time[(time >= self.time_start) & (time <= self.time_end)]
-            itd = timesteps
-
-            # pull data out at specified times
-            for ebd in self.embands:
-                # find variable name
-                e_name = self.emdict[ebd]
-
-                em_data[ebd] = np.zeros((len(itd), ny, nx))
-                for ide, it in enumerate(itd):
-                    time_samp = np.where(time == it)[0]
-                    tmp_em_data = ds_em.variables[e_name][time_samp,:]
-                    #tmp_em_data[np.isnan(tmp_em_data)] = 0.0
-                    em_data[ebd][ide,:] = tmp_em_data*mask
-
-            for sbd in self.snowbands:
-                # find variable name
-                s_name = self.snowdict[sbd]
-                snow_data[sbd] = np.zeros((len(itd), ny, nx))
-                for ids, it in enumerate(itd):
-                    time_samp = np.where(time == it)[0]
-                    tmp_snow_data = ds_snow.variables[s_name][time_samp,:]
-                    if sbd in [4, 5, 6]:
-                        tmp_snow_data[tmp_snow_data == -75.0] = np.nan
-                    #tmp_snow_data[np.isnan(tmp_snow_data)] = 0.0
-
-                    snow_data[sbd][ids,:] = tmp_snow_data*mask
-
-        # if given a list of timesteps
-        elif self.timesteps is not None:
-            timesteps = np.array(self.timesteps)
-            # find indices that have matching times
-            itd = []
-            for it, t in enumerate(time):
-                if t in timesteps:
-                    itd.append(it)
-            if len(itd) == 0:
-                raise ValueError('No matching timesteps to those given')
+class LazyBands(object):
+    """
+    Dictionary-like access to lazy iSnobalReader bands, so that
+    reader.snow_data[band][idx, :, :] reads only idx from the file
+    """
 
-            itd = np.array(itd)
+    def __init__(self, read, bands):
+        self.read = read
+        self.bands = list(bands)
 
-            # pull data out at specified times
-            for ebd in self.embands:
-                # find variable name
-                e_name = self.emdict[ebd]
+    def keys(self):
+        return self.bands
 
-                em_data[ebd] = np.zeros((len(itd), ny, nx))
-                for ide, it in enumerate(itd):
-                    em_data[ebd][ide,:] = ds_em.variables[e_name][it,:]*mask
-                    #em_data[ebd][ide,:][em_data[ebd][ide,:] <= -75.0] = np.nan
+    def __contains__(self, band):
+        return band in self.bands
 
-            for sbd in self.snowbands:
-                # find variable name
-                s_name = self.snowdict[sbd]
-                snow_data[sbd] = np.zeros((len(itd), ny, nx))
-                for ids, it in enumerate(itd):
-                    snow_data[sbd][ids,:] = ds_snow.variables[s_name][it,:]*mask
-                    #snow_data[sbd][ids,:][snow_data[sbd][ids,:] <= -75.0] = np.nan
+    def __getitem__(self, band):
+        if band not in self.bands:
+            raise KeyError(band)
 
-        # store timesteps
-        self.time = timesteps
-        # close datasets
-        ds_snow.close()
-        ds_em.close()
+        return LazyBand(self.read, band)
 
-        return snow_data, em_data
+
+class LazyBand(object):
+    """ A single lazy band, indexed by time index first """
+
+    def __init__(self, read, band):
+        self.read = read
+        self.band = band
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        array = self.read(self.band, key[0])
+
+        if len(key) > 1:
+            if np.ndim(key[0]) == 0:
+                array = array[key[1:]]
+            else:
+                array = array[(slice(None),) + key[1:]]
+
+        return array
@@ -4,3 +4,4 @@ from . import get_topo_stats
 from . import MidpointNormalize
 from . import wyhr
 from . import stats
+from . import zonal_stats
@@ -1,12 +1,14 @@
-import copy
 from .gitinfo import __gitVersion__, __gitPath__
+from datetime import datetime
+import hashlib
 import os
 import netCDF4 as nc
 import numpy as np
+import warnings
 
 from snowav.database.database import convert_watershed_names
+from snowav.utils.OutputReader import nc_array
 from snowav import __version__
-from tablizer.tablizer import summarize, store
 
 
 def calculate(array, pixel, masks=None, method='sum', convert=None,
@@ -59,6 +61,76 @@ def calculate(array, pixel, masks=None, method='sum', convert=None,
     if method not in method_options:
         raise Exception('method options are {}'.format(method_options))
 
+    factor = conversion_factor(pixel, convert, units)
+
+    if masks is not None:
+        if type(masks) != list:
+            masks = [masks]
+
+        for i, mask in enumerate(masks):
+            if mask.shape != array.shape:
+                raise Exception('mask {}, {} and array {} do not '
+                                'match'.format(i, mask.shape, array.shape))
+
+            # use nan because output zero values have meaning, in the image
+            # dtype so that float32 images stay float32
+            mask = mask.astype(float_dtype(array))
+            mask[mask < 1] = np.nan
+            array = array * mask
+
+    # make calculation and convert, sums are float64 for any image dtype
+    if method == 'sum':
+        if np.sum(np.isnan(array)) == array.size:
+            value = np.nan
+        else:
+            value = np.nansum(array, dtype=np.float64) * factor
+
+    if method == 'mean':
+        value = np.nanmean(array, dtype=np.float64) * factor
+
+    if not np.isnan(value):
+        value = value.round(decimals)
+
+    return value
+
+
+def float_dtype(array, default=np.float64):
+    """ Floating point dtype of an image, or default for integer and
+    boolean images, for buffers and masks that should match the image.
+
+    Args
+    ------
+    array {arr}: image
+    default {dtype}: dtype for images that are not floating point
+
+    Returns
+    ------
+    dtype {dtype}: numpy dtype
+    """
+
+    dtype = np.asarray(array).dtype
+
+    if np.issubdtype(dtype, np.floating):
+        return dtype
+
+    return np.dtype(default)
+
+
+def conversion_factor(pixel, convert=None, units='TAF'):
+    """ Unit conversion factor used by calculate() and ZonalStats.
+
+    Args
+    ------
+    pixel {int}: [m] model pixel size
+    convert {str}: conversion property, options are 'depth', 'snow_depth',
+        'volume', None
+    units {str}: conversion units, options are 'TAF', 'SI', 'AWSM'
+
+    Returns
+    ------
+    factor {float}: conversion factor
+    """
+
     if units == 'TAF':
 
         # mm to inches
@@ -96,34 +168,7 @@ def calculate(array, pixel, masks=None, method='sum', convert=None,
     if units == 'AWSM' or not convert:
         factor = 1
 
-    if masks is not None:
-        if type(masks) != list:
-            masks = [masks]
-
-        for i, mask in enumerate(masks):
-            if mask.shape != array.shape:
-                raise Exception('mask {}, {} and array {} do not '
-                                'match'.format(i, mask.shape, array.shape))
-
-            # use nan because output zero values have meaning
-            mask = mask.astype('float')
-            mask[mask < 1] = np.nan
-            array = array * mask
-
-    # make calculation and convert
-    if method == 'sum':
-        if np.sum(np.isnan(array)) == array.size:
-            value = np.nan
-        else:
-            value = np.nansum(array) * factor
-
-    if method == 'mean':
-        value = np.nanmean(array) * factor
-
-    if not np.isnan(value):
-        value = value.round(decimals)
-
-    return value
+    return factor
 
 
 def snow_line(array, dem, masks=None, limit=0.01):
@@ -150,8 +195,9 @@ def snow_line(array, dem, masks=None, limit=0.01):
                 raise Exception('mask {}, {} and array {} do not '
                                 'match'.format(i, mask.shape, array.shape))
 
-            # use nan because output zero values have meaning
-            mask = mask.astype('float')
+            # use nan because output zero values have meaning, in the image
+            # dtype so that float32 images stay float32
+            mask = mask.astype(float_dtype(array))
             mask[mask < 1] = np.nan
             array = array * mask
 
@@ -282,15 +328,62 @@ def masks(dempath, convert, plotorder=None, plotlabels=None):
     return out
 
 
-def sum_precip(precip_path, percent_snow_path):
-    """ Sum in place for precip and rain images.
+def crop_window(masks, pad=0):
+    """ Rows and columns of the topo grid that contain any of the masks,
+    for reading and keeping grids only over the report basins.
+
+    Args
+    ------
+    masks {dict}: snowav masks dictionary, {name: {'mask': arr, ...}}
+    pad {int}: pixels to add on each side
+
+    Returns
+    ------
+    window {tuple}: (row slice, column slice), so that grid[window] is the
+        cropped grid
+    """
+
+    union = None
+
+    for name in masks:
+        mask = np.ma.filled(masks[name]['mask'], 0) > 0
+        if union is None:
+            union = mask
+        else:
+            union = union | mask
+
+    rows = np.flatnonzero(union.any(axis=1))
+    cols = np.flatnonzero(union.any(axis=0))
+
+    if len(rows) == 0:
+        raise Exception('masks are empty, no crop window')
+
+    window = (slice(int(max(rows[0] - pad, 0)),
+                    int(min(rows[-1] + pad + 1, union.shape[0]))),
+              slice(int(max(cols[0] - pad, 0)),
+                    int(min(cols[-1] + pad + 1, union.shape[1]))))
+
+    return window
+
+
+def sum_precip(precip_path, percent_snow_path, cache_dir=None, window=None,
+               mask_and_scale=True, dtype=np.float64):
+    """ Daily total precip and rain images. The hourly images are read in a
+    single slice from each file and summed in dtype.
+
+    If cache_dir is given the daily totals are saved there, keyed on the
+    file paths and modification times, and later calls for the same files
+    load them from the cache instead.
 
     Args
     ------
     precip_path: path to precip.nc
     percent_snow_path: path to percent_snow.nc
-    precip_total: array of total precip for the run
-    rain_total: array of total rain for the run
+    cache_dir: optional directory for cached daily totals
+    window: optional (row slice, column slice) to read, from crop_window()
+    mask_and_scale: netCDF4 auto mask and scale, False reads plain arrays
+        with fill values as nan
+    dtype: dtype that the hours are read and summed in, [snowav] dtype
 
     Returns
     ------
@@ -298,85 +391,240 @@ def sum_precip(precip_path, percent_snow_path):
     rain: array, daily total rain
     """
 
+    cache = None
+    dtype = np.dtype(dtype)
+
+    if window is None:
+        window = (slice(None), slice(None))
+
+    if cache_dir is not None:
+        key = '{}|{}|{}|{}|{}|{}|{}'.format(os.path.abspath(precip_path),
+                                            os.path.getmtime(precip_path),
+                                            os.path.abspath(percent_snow_path),
+                                            os.path.getmtime(percent_snow_path),
+                                            window, mask_and_scale, dtype.name)
+        name = hashlib.sha1(key.encode()).hexdigest()
+        cache = os.path.join(cache_dir, 'precip_{}.npz'.format(name))
+
+        if os.path.isfile(cache):
+            with np.load(cache) as npz:
+                return npz['precip'], npz['rain']
+
     ppt = nc.Dataset(precip_path, 'r')
     percent_snow = nc.Dataset(percent_snow_path, 'r')
 
     # For the wy2019 daily runs, precip.nc always has an extra hour, but
     # in some WRF forecast runs there are fewer than 24...
-    if len(ppt.variables['precip'][:]) > 24:
-        nb = 24
-    else:
-        nb = len(ppt.variables['precip'][:])
-
-    for nb in range(0, nb):
-        pre = ppt['precip'][nb]
-        ps = percent_snow['percent_snow'][nb]
+    nb = min(ppt.variables['precip'].shape[0], 24)
 
-        if nb == 0:
-            rain = np.multiply(pre, (1 - ps))
-            precip = copy.deepcopy(pre)
-        else:
-            rain = rain + np.multiply(pre, (1 - ps))
-            precip = precip + copy.deepcopy(pre)
+    key = (slice(0, nb),) + window
 
-    # rain_total = rain_total + rain
-    # precip_total = precip_total + precip
+    if mask_and_scale:
+        pre = np.asarray(ppt.variables['precip'][key], dtype=dtype)
+        ps = np.asarray(percent_snow.variables['percent_snow'][key],
+                        dtype=dtype)
+    else:
+        pre = nc_array(ppt.variables['precip'], key, dtype)
+        ps = nc_array(percent_snow.variables['percent_snow'], key, dtype)
 
     ppt.close()
     percent_snow.close()
 
+    precip = pre.sum(axis=0)
+    rain = (pre * (1 - ps)).sum(axis=0)
+
+    if cache is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        tmp = '{}.{}.tmp.npz'.format(os.path.splitext(cache)[0], os.getpid())
+        np.savez_compressed(tmp, precip=precip, rain=rain)
+        os.replace(tmp, cache)
+
     return precip, rain
 
 
-def input_summary(path, variable, methods, percentiles, database, location,
-                  run_name, basin_id, run_id, masks):
-    """ Summarize smrf outputs with tablizer.
+def totals_path(cache_dir, connector, run_name, start_date, window=None):
+    """ File for the [run] incremental precip, rain and swi totals of a
+    run_name and report start date.
+
+    Args
+    ------
+    cache_dir {str}: cache directory
+    connector {str}: database connector
+    run_name {str}: snowav run_name
+    start_date {datetime}: report period start date, or None
+    window {tuple}: optional (row slice, column slice), from crop_window()
+
+    Returns
+    ------
+    path {str}: .npz path
+    """
+
+    key = '{}|{}|{}|{}'.format(connector, run_name, start_date, window)
+    name = hashlib.sha1(key.encode()).hexdigest()
+
+    return os.path.join(cache_dir, 'totals_{}.npz'.format(name))
+
+
+def load_totals(path, start_date, shape, last_date, names):
+    """ Load [run] incremental totals saved by save_totals(). The totals
+    are only used if they start on start_date, have every image in names,
+    and end on or before last_date, so that every later day is still read.
+
+    Args
+    ------
+    path {str}: from totals_path()
+    start_date {datetime}: first date of the report period
+    shape {tuple}: image shape
+    last_date {datetime}: last date on the database for run_name
+    names {list}: images that are needed, i.e. ['precip', 'rain', 'swi']
+
+    Returns
+    ------
+    totals {dict}: 'date' and the images, or None
+    """
+
+    if not os.path.isfile(path) or last_date is None:
+        return None
+
+    try:
+        with np.load(path) as npz:
+            totals = dict((k, npz[k]) for k in npz.files)
+
+    except Exception:
+        return None
+
+    date = datetime.strptime(str(totals.pop('date')), '%Y-%m-%d %H:%M:%S')
+    start = datetime.strptime(str(totals.pop('start')), '%Y-%m-%d %H:%M:%S')
+
+    if start_date is not None and start.date() != start_date.date():
+        return None
+
+    if date > last_date:
+        return None
+
+    if any(n not in totals or totals[n].shape != shape for n in names):
+        return None
+
+    totals['date'] = date
+
+    return totals
+
+
+def save_totals(path, start_date, date, **images):
+    """ Save [run] incremental totals, images summed from start_date
+    through date.
+
+    Args
+    ------
+    path {str}: from totals_path()
+    start_date {datetime}: first date in the totals
+    date {datetime}: last date in the totals
+    images: total images, i.e. precip=arr
+    """
+
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    tmp = '{}.{}.tmp.npz'.format(os.path.splitext(path)[0], os.getpid())
+    np.savez(tmp, start=start_date.strftime('%Y-%m-%d %H:%M:%S'),
+             date=date.strftime('%Y-%m-%d %H:%M:%S'), **images)
+    os.replace(tmp, path)
+
+
+def input_summary(path, variable, methods, percentiles, masks, basin_ids,
+                  run_name, run_id, unit=None, decimals=3, window=None,
+                  dtype=np.float64, mask_and_scale=True):
+    """ Summarize smrf outputs for the Inputs table. The variable is read
+    once, and every method and percentile is calculated for all basins and
+    hours in a single pass over the (hours, pixels) array of each basin.
 
     Args
     ------
     path {str}: nc path
     variable {str}: snowav variable
-    methods {list}: list of summary methods
+    methods {list}: list of summary methods, i.e. ['nanmean', 'nanpercentile']
     percentiles {arr}: if using percentiles
-    database {str}: connector string
-    location {str}: database location
+    masks {dict}: basin masks, {basin: mask}
+    basin_ids {dict}: snowav basin ids, {basin: basin_id}
     run_name {str}: snowav run name
-    basin_id {dict}: snowav basin id
     run_id {int}: snowav run_id
-    masks {list}: masks to filter with
+    unit {str}: variable units
+    decimals {int}: decimals for rounding
+    window {tuple}: optional (row slice, column slice) to read, from
+        crop_window(), with masks cropped to match
+    dtype {dtype}: dtype that the hours are read in, the basin values are
+        summarized in float64
+    mask_and_scale {bool}: netCDF4 auto mask and scale, False reads a plain
+        array with fill values as nan
+
+    Returns
+    ------
+    rows {list}: Inputs row dictionaries
     """
 
     if not os.path.isfile(path):
         raise OSError('invalid file -> {}'.format(path))
 
+    if window is None:
+        window = (slice(None), slice(None))
+
     ncf = nc.Dataset(path, 'r')
-    array = ncf.variables[variable][:]
-    dates = ncf.variables['time'][:]
-    date_units = ncf.variables['time'].units
-    ncf.close()
+    nb = min(ncf.variables[variable].shape[0], 24)
+    key = (slice(0, nb),) + window
 
-    if len(array[:]) > 24:
-        nb = 24
+    if mask_and_scale:
+        array = np.ma.filled(np.ma.asarray(ncf.variables[variable][key],
+                                           dtype=dtype), np.nan)
     else:
-        nb = len(array[:])
+        array = nc_array(ncf.variables[variable], key, dtype)
 
+    dates = nc.num2date(ncf.variables['time'][0:nb],
+                        ncf.variables['time'].units)
+    ncf.close()
+
+    array = array.reshape(nb, -1)
+
+    # zero values have no meaning for these
     if variable in ['snow_density', 'precip_temp']:
-        mask_zero_values = True
-    else:
-        mask_zero_values = False
-
-    for nb in range(0, nb):
-        date = nc.num2date(dates[nb], date_units)
-        img = array[nb, :, :]
-        results = summarize(img,
-                            date,
-                            methods,
-                            percentiles=[percentiles[0], percentiles[1]],
-                            decimals=3,
-                            masks=masks,
-                            mask_zero_values=mask_zero_values)
-        store(results, variable, database, location, run_name, basin_id,
-              run_id, date)
+        array[array == 0] = np.nan
+
+    rows = []
+
+    for basin, mask in masks.items():
+        idx = np.flatnonzero(np.ma.filled(mask, 0) >= 1)
+        values = array[:, idx].astype(np.float64, copy=False)
+        results = []
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+
+            for method in methods:
+                fn = getattr(np, method)
+
+                if 'percentile' in method:
+                    out = fn(values, percentiles, axis=1)
+                    for p, v in zip(percentiles, out):
+                        results.append(('{}_{}'.format(method, p), v))
+                else:
+                    results.append((method, fn(values, axis=1)))
+
+        for i, date in enumerate(dates):
+            for function, v in results:
+                value = None if np.isnan(v[i]) else round(float(v[i]),
+                                                          decimals)
+                rows.append({'run_id': int(run_id),
+                             'run_name': run_name,
+                             'basin_id': int(basin_ids[basin]),
+                             'date_time': date,
+                             'variable': variable,
+                             'function': function,
+                             'value': value,
+                             'unit': unit})
+
+    return rows
 
 
 def getgitinfo():
@@ -0,0 +1,314 @@
+import hashlib
+import numpy as np
+import os
+import pandas as pd
+
+from snowav.utils.utilities import conversion_factor
+
+
+class ZonalStats(object):
+    """ Basin and elevation band statistics in a single pass over an image.
+
+    The pixels of every basin mask are gathered once into a flat index, and
+    each is labeled with an integer zone of basin * (nbands + 1) + band. The
+    extra band per basin holds pixels that are in the basin but outside of
+    the elevation bins, so they count towards the basin 'total' but not any
+    band. Sums and counts for every zone then come from one np.bincount()
+    per image, rather than a full image mask multiplication for every basin
+    and elevation band.
+
+    Values match utilities.calculate() for the same masks: NaN pixels are
+    excluded, and zones without any valid pixels are NaN.
+
+    The index is sorted by zone, with the number of pixels in each zone in
+    counts and the (row_min, row_max, col_min, col_max) bounding box of each
+    basin in bbox. It can be saved to and loaded from a .npz file, see
+    zonal_stats().
+
+    Args
+    ------
+    masks {dict}: snowav masks dictionary, {name: {'mask': arr, ...}}
+    ixd {arr}: np.digitize() of the dem with the elevation bins
+    edges {arr}: elevation band labels
+    pixel {int}: [m] model pixel size
+    units {str}: conversion units, options are 'TAF', 'SI', 'AWSM'
+    decimals {int}: decimals for rounding
+    """
+
+    def __init__(self, masks, ixd, edges, pixel, units='TAF', decimals=3):
+
+        self.names = list(masks.keys())
+        self.edges = list(edges)
+        self.nbands = len(self.edges)
+        self.shape = np.shape(ixd)
+        self.pixel = pixel
+        self.units = units
+        self.decimals = decimals
+
+        ixd = np.asarray(ixd).ravel()
+        index = []
+        zones = []
+        bbox = []
+
+        for i, name in enumerate(self.names):
+            mask = np.ma.filled(masks[name]['mask'], 0)
+
+            if mask.shape != self.shape:
+                raise Exception('mask {}, {} and dem {} do not '
+                                'match'.format(name, mask.shape, self.shape))
+
+            idx = np.flatnonzero(mask >= 1)
+            band = np.minimum(ixd[idx], self.nbands)
+            index.append(idx)
+            zones.append(i * (self.nbands + 1) + band)
+
+            rows, cols = np.nonzero(mask >= 1)
+            if rows.size:
+                bbox.append([rows.min(), rows.max(), cols.min(), cols.max()])
+            else:
+                bbox.append([0, -1, 0, -1])
+
+        # int32 keeps the index and the cache files compact
+        dtype = np.int32 if ixd.size < np.iinfo(np.int32).max else np.int64
+        index = np.concatenate(index).astype(dtype)
+        zones = np.concatenate(zones).astype(dtype)
+        order = np.argsort(zones, kind='stable')
+
+        self.index = index[order]
+        self.zones = zones[order]
+        self.nzones = len(self.names) * (self.nbands + 1)
+        self.counts = np.bincount(self.zones, minlength=self.nzones)
+        self.bbox = dict(zip(self.names, [tuple(b) for b in bbox]))
+
+    def save(self, path):
+        """ Save the zone index to a .npz file.
+
+        Args
+        ------
+        path {str}: .npz file path
+        """
+
+        np.savez(path,
+                 names=np.array(self.names),
+                 edges=np.array(self.edges),
+                 shape=np.array(self.shape),
+                 index=self.index,
+                 zones=self.zones,
+                 counts=self.counts,
+                 bbox=np.array([self.bbox[n] for n in self.names]))
+
+    @classmethod
+    def load(cls, path, pixel, units='TAF', decimals=3):
+        """ Load a zone index that was saved with save().
+
+        Args
+        ------
+        path {str}: .npz file path
+        pixel {int}: [m] model pixel size
+        units {str}: conversion units, options are 'TAF', 'SI', 'AWSM'
+        decimals {int}: decimals for rounding
+
+        Returns
+        ------
+        zs {class}: ZonalStats
+        """
+
+        zs = cls.__new__(cls)
+
+        with np.load(path) as npz:
+            zs.names = [str(n) for n in npz['names']]
+            zs.edges = npz['edges'].tolist()
+            zs.shape = tuple(npz['shape'])
+            zs.index = npz['index']
+            zs.zones = npz['zones']
+            zs.counts = npz['counts']
+            zs.bbox = dict(zip(zs.names, [tuple(b) for b in npz['bbox']]))
+
+        zs.nbands = len(zs.edges)
+        zs.nzones = len(zs.names) * (zs.nbands + 1)
+        zs.pixel = pixel
+        zs.units = units
+        zs.decimals = decimals
+
+        return zs
+
+    def reduce(self, array, where=None):
+        """ Sum and count valid pixels in every zone.
+
+        Args
+        ------
+        array {arr}: image, the same shape as the masks
+        where {arr}: optional boolean image, pixels that are False are
+            excluded
+
+        Returns
+        ------
+        sums {arr}: (nbasins, nbands + 1) sums
+        counts {arr}: (nbasins, nbands + 1) number of valid pixels
+        """
+
+        if np.shape(array) != self.shape:
+            raise Exception('array {} and masks {} do not '
+                            'match'.format(np.shape(array), self.shape))
+
+        values = np.ma.filled(array, np.nan).ravel()[self.index]
+        valid = ~np.isnan(values)
+
+        if where is not None:
+            valid &= np.ma.filled(where, False).ravel()[self.index]
+
+        zones = self.zones[valid]
+        sums = np.bincount(zones, weights=values[valid],
+                           minlength=self.nzones)
+        counts = np.bincount(zones, minlength=self.nzones)
+
+        shape = (len(self.names), self.nbands + 1)
+
+        return sums.reshape(shape), counts.reshape(shape)
+
+    def calculate(self, array, method='sum', convert=None, where=None,
+                  total_where=None):
+        """ Calculate and convert values for every basin and elevation band,
+        plus the basin 'total'.
+
+        Args
+        ------
+        array {arr}: image, the same shape as the masks
+        method {str}: options are 'sum', 'mean'
+        convert {str}: conversion property, options are 'depth',
+            'snow_depth', 'volume', None
+        where {arr}: optional boolean image applied to the elevation bands
+        total_where {arr}: optional boolean image applied to the basin
+            total, default is where
+
+        Returns
+        ------
+        df {DataFrame}: elevation band and 'total' index, basin columns
+        """
+
+        method_options = ['sum', 'mean']
+
+        if method not in method_options:
+            raise Exception('method options are {}'.format(method_options))
+
+        factor = conversion_factor(self.pixel, convert, self.units)
+
+        sums, counts = self.reduce(array, where)
+        band_sums = sums[:, :self.nbands]
+        band_counts = counts[:, :self.nbands]
+
+        if total_where is not None:
+            sums, counts = self.reduce(array, total_where)
+
+        total_sums = sums.sum(axis=1)
+        total_counts = counts.sum(axis=1)
+
+        values = np.column_stack((band_sums, total_sums))
+        n = np.column_stack((band_counts, total_counts))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if method == 'mean':
+                values = values / n
+
+        values = np.where(n > 0, values * factor, np.nan)
+        values = np.round(values, self.decimals)
+
+        df = pd.DataFrame(values.T, index=self.edges + ['total'],
+                          columns=self.names)
+
+        return df
+
+
+def file_hash(path, blocksize=2 ** 20):
+    """ sha1 hex digest of a file.
+
+    Args
+    ------
+    path {str}: file path
+    blocksize {int}: read size
+
+    Returns
+    ------
+    digest {str}: sha1 hex digest
+    """
+
+    sha = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+def zonal_stats(masks, ixd, edges, pixel, units='TAF', decimals=3,
+                dempath=None, bins=None, cache_dir=None, logger=None):
+    """ Get ZonalStats for the masks and elevation bands. If dempath and
+    cache_dir are given the zone index is loaded from cache_dir when it
+    exists, and is otherwise built and saved there. Cache files are keyed on
+    the topo.nc file hash, the elevation bins, the mask names and the grid
+    shape, so changes to any of those, or a [snowav] crop window, make a new
+    index.
+
+    Args
+    ------
+    masks {dict}: snowav masks dictionary, {name: {'mask': arr, ...}}
+    ixd {arr}: np.digitize() of the dem with the elevation bins
+    edges {arr}: elevation band labels
+    pixel {int}: [m] model pixel size
+    units {str}: conversion units, options are 'TAF', 'SI', 'AWSM'
+    decimals {int}: decimals for rounding
+    dempath {str}: topo.nc path
+    bins {arr}: elevation bins used for ixd
+    cache_dir {str}: cache directory
+    logger {list}: optional list for log messages
+
+    Returns
+    ------
+    zs {class}: ZonalStats
+    """
+
+    if dempath is None or cache_dir is None:
+        return ZonalStats(masks, ixd, edges, pixel, units, decimals)
+
+    key = hashlib.sha1()
+    key.update(file_hash(dempath).encode())
+    key.update(np.asarray(bins, dtype=float).tobytes())
+    key.update(np.asarray(edges, dtype=float).tobytes())
+    key.update(units.encode())
+    key.update('|'.join(masks.keys()).encode())
+    key.update(np.asarray(np.shape(ixd), dtype=int).tobytes())
+
+    path = os.path.join(cache_dir, 'zones_{}.npz'.format(key.hexdigest()))
+
+    if os.path.isfile(path):
+        try:
+            zs = ZonalStats.load(path, pixel, units, decimals)
+            if logger is not None:
+                logger.append(' Loaded zone index {}'.format(path))
+            return zs
+
+        except Exception as e:
+            if logger is not None:
+                logger.append(' Failed loading zone index {}, {}, '
+                              'rebuilding'.format(path, e))
+
+    zs = ZonalStats(masks, ixd, edges, pixel, units, decimals)
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write and rename so that other runs never load a partial file
+        tmp = '{}.{}.tmp.npz'.format(os.path.splitext(path)[0], os.getpid())
+        zs.save(tmp)
+        os.replace(tmp, path)
+
+        if logger is not None:
+            logger.append(' Saved zone index {}'.format(path))
+
+    except OSError as e:
+        if logger is not None:
+            logger.append(' Failed saving zone index {}, {}'.format(path, e))
+
+    return zs
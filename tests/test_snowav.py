@@ -1,14 +1,36 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import logging
 import matplotlib
+import netCDF4 as nc
 import numpy as np
 import os
+import pandas as pd
+import shutil
+import sqlite3
 import subprocess
+import tempfile
+import types
 import unittest
+import utm
 
-from snowav.database.database import collect
-from snowav.utils.utilities import calculate, masks
+from snowav.database.database import collect, Database, \
+    configure_result_cache, configure_sqlite, delete_range, get_engine, \
+    last_date, query_stats
+from snowav.utils.utilities import calculate, crop_window, masks, \
+    sum_precip, input_summary, load_totals, totals_path
 from snowav.cli import can_i_snowav
-from snowav.utils.OutputReader import iSnobalReader
+from snowav.framework.consolidate import consolidate, cube_index
+from snowav.framework.outputs import outputs, skipped_dirs
+from snowav.framework.point_values import load_data
+from snowav.framework.process import Process
+from snowav.framework.process_day import process
+from snowav.database.migrate import migrate
+from snowav.database.models import AwsmInputsOutputs
+from snowav.database.writer import DatabaseWriter
+from snowav.plotting.flt_image_change import flt_image_change
+from snowav.plotting.stn_validate import station_index, station_pixels
+from snowav.utils.OutputReader import iSnobalReader, nc_array
+from snowav.utils.zonal_stats import ZonalStats, zonal_stats
 
 """
 This uses wy2019 results in the Lakes Basin, as of 2020-3-6 found at:
@@ -22,6 +44,31 @@ Tests:
 - end-to-end snowav run
 - simple topo.nc read and masks creation
 - volume and depth calculations for SWE volume and mean depth
+- ZonalStats basin and elevation band values against calculate()
+- zone index cache save and load
+- single snow.nc processing with the zone index against calculate()
+- OutputStore images against iSnobalReader
+- lazy iSnobalReader bands against full reads
+- daily precip and rain totals, and the precip cache
+- input summary rows against the 'gold' Inputs table
+- Database table cache, query instrumentation and connection errors
+- collect() result cache, in memory and saved to a cache directory
+- adding the composite indexes to an existing database
+- sqlite profile pragmas
+- background database writer order and error propagation
+- Process with a process pool against a single process, on synthetic runs
+- last processed date for [run] incremental
+- [run] incremental skipped run directories and totals on synthetic runs
+- range deletes for [database] overwrite
+- [snowav] crop window reads against full images
+- stn_validate station pixels and flight difference depths with [snowav] crop,
+    and the station index cache
+- stn_validate station pixel values against per-pixel reads, with a crop
+    window offset
+- point values load_data() time series against per-pixel reads
+- water year cube build, append, and outputs() images from the cube
+- float32 images against float64, memory and basin results
+- plain array reads with fill values as nan against masked array reads
 - database 'gold' and current values for swe_z, swe_vol, swe_unavail, precip_z,
     swi_z, swi_vol, and density
 - standard figure .png creation
@@ -48,6 +95,10 @@ gold_cnx = 'sqlite:///' + os.path.abspath(gold_db_path)
 test_cnx = 'sqlite:///' + os.path.abspath(test_db_path)
 edges = [8000, 9000, 10000, 11000]
 
+# stn_validate +- 1 pixel offsets, as in figures()
+px = (1, 1, 1, 0, 0, 0, -1, -1, -1)
+py = (1, 0, -1, 1, 0, -1, 1, 0, -1)
+
 # This basins dictionary matches the current snowav database.
 # Note: this will differ from new sqlite databases created in >v0.10.0
 basins = {'Lakes': {'watershed_id': 4, 'basin_id': 16}}
@@ -102,6 +153,1215 @@ def check_utils_calculate():
     return result
 
 
+def check_zonal_stats():
+    ''' Compare ZonalStats and calculate() basin and elevation band values. '''
+
+    result = True
+    dem_path = os.path.abspath(topo_path)
+    pixel = 50
+    out = masks(dem_path, False)
+    dem = out['dem']
+    mask = out['masks']['Lakes Basin']['mask']
+
+    step = 500
+    edges = np.arange(np.min(dem) - step, np.max(dem), step)
+    ixd = np.digitize(dem, np.arange(np.min(dem), np.max(dem) + step, step))
+
+    # synthetic depth image with some nan and zero values
+    array = (dem - np.min(dem)) * 0.5
+    array[::7, ::5] = np.nan
+    array[dem < np.percentile(dem, 20)] = 0
+    snow_mask = array > 0
+
+    zs = ZonalStats(out['masks'], ixd, edges, pixel)
+    zvol = zs.calculate(array, 'sum', 'volume')
+    zmean = zs.calculate(array, 'mean', 'depth', where=snow_mask)
+
+    for n, edge in enumerate(edges):
+        elev_mask = (ixd * mask) == n
+
+        value = calculate(array, pixel, [mask, elev_mask], 'sum', 'volume')
+        if not np.allclose(value, zvol.loc[edge, 'Lakes Basin'],
+                           equal_nan=True):
+            result = False
+
+        value = calculate(array, pixel, [mask, elev_mask, snow_mask], 'mean',
+                          'depth')
+        if not np.allclose(value, zmean.loc[edge, 'Lakes Basin'],
+                           equal_nan=True):
+            result = False
+
+    value = calculate(array, pixel, mask, 'sum', 'volume')
+    if not np.allclose(value, zvol.loc['total', 'Lakes Basin']):
+        result = False
+
+    value = calculate(array, pixel, [mask, snow_mask], 'mean', 'depth')
+    if not np.allclose(value, zmean.loc['total', 'Lakes Basin']):
+        result = False
+
+    return result
+
+
+def check_zonal_stats_cache():
+    ''' Check that a cached zone index matches a new one. '''
+
+    result = True
+    dem_path = os.path.abspath(topo_path)
+    out = masks(dem_path, False)
+    dem = out['dem']
+    bins = np.arange(6000, 9000, 500)
+    edges = bins - 500
+    ixd = np.digitize(dem, bins)
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        log = []
+        zs = zonal_stats(out['masks'], ixd, edges, 50, dempath=dem_path,
+                         bins=bins, cache_dir=cache_dir, logger=log)
+        cached = zonal_stats(out['masks'], ixd, edges, 50, dempath=dem_path,
+                             bins=bins, cache_dir=cache_dir, logger=log)
+
+        if len(os.listdir(cache_dir)) != 1 or 'Loaded' not in log[-1]:
+            result = False
+
+        if (not np.array_equal(zs.index, cached.index) or
+                not np.array_equal(zs.counts, cached.counts) or
+                zs.bbox != cached.bbox):
+            result = False
+
+        a = zs.calculate(dem, 'mean')
+        b = cached.calculate(dem, 'mean')
+        if not a.equals(b):
+            result = False
+
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return result
+
+
+def check_process_day():
+    ''' Check single snow.nc swe_vol from process() against calculate(). '''
+
+    result = True
+    dem_path = os.path.abspath(topo_path)
+    path = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+    nc_path = os.path.join(path, 'snow.nc')
+    cache_dir = tempfile.mkdtemp()
+
+    out = masks(dem_path, False)
+    dem = out['dem'] * 3.28
+    edges = np.arange(3000, 14000, 1000)
+    ixd = np.digitize(dem, np.arange(4000, 15000, 1000))
+    swe = iSnobalReader(path, snowbands=[2], embands=[]).snow_data[2][0]
+
+    try:
+        for i in range(0, 2):
+            df = process(nc_path, dem_path, 'swe_vol', logging.getLogger(),
+                         cache_dir=cache_dir)['df'][nc_path]
+
+            for name in out['masks']:
+                mask = out['masks'][name]['mask']
+                for n, edge in enumerate(edges):
+                    value = calculate(swe, 50, [mask, (ixd * mask) == n],
+                                      'sum', 'volume')
+                    if np.isnan(value):
+                        value = 0
+
+                    if not np.isclose(value, df.loc[edge, name]):
+                        result = False
+
+        if len(os.listdir(cache_dir)) != 1:
+            result = False
+
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return result
+
+
+def check_output_store():
+    ''' Compare OutputStore images and iSnobalReader. '''
+
+    result = True
+    path = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        for d in [None, cache_dir, cache_dir]:
+            out = outputs([path], 2019, ['swe_z', 'coldcont'], start_date,
+                          end_date, cache_size=1, cache_dir=d)
+            store = out['outputs']
+
+            output = iSnobalReader(path, snowbands=[2], embands=[9], wy=2019)
+
+            if len(store['swe_z']) != 1 or store['dates'] != [end_date]:
+                result = False
+
+            if not np.array_equal(store['swe_z'][0], output.snow_data[2][0],
+                                  equal_nan=True):
+                result = False
+
+            if not np.array_equal(store['coldcont'][-1], output.em_data[9][0],
+                                  equal_nan=True):
+                result = False
+
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return result
+
+
+def check_reader_lazy():
+    ''' Compare lazy iSnobalReader bands and full reads. '''
+
+    result = True
+    path = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+
+    output = iSnobalReader(path, snowbands=[0, 1, 2], embands=[8, 9], wy=2019)
+
+    with iSnobalReader(path, snowbands=[0, 1, 2], embands=[8, 9], wy=2019,
+                       lazy=True) as lazy:
+
+        if not np.array_equal(lazy.time, output.time):
+            result = False
+
+        for b in [0, 1, 2]:
+            if not np.array_equal(lazy.snow_data[b][0, :, :],
+                                  output.snow_data[b][0, :, :],
+                                  equal_nan=True):
+                result = False
+
+        for b in [8, 9]:
+            if not np.array_equal(lazy.em(b), output.em_data[b],
+                                  equal_nan=True):
+                result = False
+
+    return result
+
+
+def check_sum_precip():
+    ''' Check daily precip and rain totals against hourly sums. '''
+
+    result = True
+    path = os.path.abspath('./tests/lakes/gold/data/data20190402/smrfOutputs/')
+    precip_path = os.path.join(path, 'precip.nc')
+    percent_snow_path = os.path.join(path, 'percent_snow.nc')
+    cache_dir = tempfile.mkdtemp()
+
+    ncf = nc.Dataset(precip_path)
+    hourly = ncf.variables['precip'][0:24]
+    ncf.close()
+    ncf = nc.Dataset(percent_snow_path)
+    ps = ncf.variables['percent_snow'][0:24]
+    ncf.close()
+
+    try:
+        for i in range(0, 2):
+            precip, rain = sum_precip(precip_path, percent_snow_path,
+                                      cache_dir=cache_dir)
+
+            if not np.allclose(precip, np.sum(hourly, axis=0)):
+                result = False
+
+            if not np.allclose(rain, np.sum(hourly * (1 - ps), axis=0)):
+                result = False
+
+        if len(os.listdir(cache_dir)) != 1:
+            result = False
+
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return result
+
+
+def check_input_summary():
+    ''' Check input_summary() rows against the 'gold' Inputs table. '''
+
+    result = True
+    path = './tests/lakes/gold/data/data20190402/smrfOutputs/precip.nc'
+    out = masks(topo_path, False, plotorder=plotorder_test)
+    mask = out['masks'][plotorder_test[0]]['mask']
+
+    rows = input_summary(path, 'precip', ['nanmean', 'nanpercentile'],
+                         [25, 75], {'Lakes Basin': mask},
+                         {'Lakes Basin': 16}, 'test', 89, unit='mm')
+
+    cnx = sqlite3.connect(gold_db_path)
+    gold = cnx.execute("SELECT date_time, function, value FROM Inputs "
+                       "WHERE date_time >= '2019-04-02'").fetchall()
+    cnx.close()
+
+    gold = dict(((d[0:19], f), v) for d, f, v in gold)
+
+    if len(rows) != len(gold):
+        result = False
+
+    for row in rows:
+        key = (row['date_time'].strftime('%Y-%m-%d %H:%M:%S'),
+               row['function'])
+
+        if key not in gold or gold[key] != row['value']:
+            result = False
+
+    return result
+
+
+def check_database_stats():
+    ''' Check Database table cache and query counts. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+
+    try:
+        db = Database(db_type='sqlite',
+                      database='sqlite:///' + os.path.join(path, 'stats.db'))
+        db.make_connection()
+        db.check_tables()
+
+        db.insert('RunMetadata', {'run_id': 1, 'run_name': 'stats'})
+        n = db.stats.queries
+        db.insert('RunMetadata', {'run_id': 2, 'run_name': 'stats'})
+
+        if list(db.tables.keys()) != ['RunMetadata']:
+            result = False
+
+        # the second insert uses the cached table
+        if db.stats.queries != n + 1 or db.stats.time <= 0:
+            result = False
+
+        # connection errors are raised rather than printed
+        db = Database(db_type='sqlite', database='not_a_connector')
+        try:
+            db.make_connection()
+            result = False
+        except Exception:
+            pass
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_result_cache():
+    ''' Check that repeated collect() calls use the result cache. '''
+
+    result = True
+    cache_dir = tempfile.mkdtemp()
+    stats = query_stats(gold_cnx)
+
+    try:
+        cache = configure_result_cache(True, cache_dir)
+        first = collect(gold_cnx, plotorder, basins, start_date, end_date,
+                        'swe_vol', run_name_gold, edges, 'end')
+        n = stats.queries
+
+        # changes to returned results don't change the cached values
+        first.iloc[0, 0] = -1
+        second = collect(gold_cnx, plotorder, basins, start_date, end_date,
+                         'swe_vol', run_name_gold, edges, 'end')
+
+        if stats.queries != n or cache.hits != 1 or second.iloc[0, 0] < 0:
+            result = False
+
+        # a new in-memory cache loads the saved result
+        cache = configure_result_cache(True, cache_dir)
+        third = collect(gold_cnx, plotorder, basins, start_date, end_date,
+                        'swe_vol', run_name_gold, edges, 'end')
+
+        if stats.queries != n or not third.equals(second):
+            result = False
+
+    finally:
+        configure_result_cache()
+        shutil.rmtree(cache_dir)
+
+    return result
+
+
+def check_migrate():
+    ''' Check that migrate() adds the composite indexes to a copy of the
+    'gold' database without changing records. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+    db_path = os.path.join(path, 'migrate.db')
+    shutil.copy(gold_db_path, db_path)
+
+    try:
+        cnx = sqlite3.connect(db_path)
+        before = cnx.execute('SELECT COUNT(*) FROM Results').fetchone()
+        cnx.close()
+
+        created = migrate('sqlite:///' + db_path)
+
+        cnx = sqlite3.connect(db_path)
+        after = cnx.execute('SELECT COUNT(*) FROM Results').fetchone()
+        indexes = [r[0] for r in cnx.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")]
+        cnx.close()
+
+        if before != after:
+            result = False
+
+        for name in ['ix_Results_run_variable_basin',
+                     'ix_Results_run_date_basin', 'ix_Inputs_run_date_basin']:
+            if name not in created or name not in indexes:
+                result = False
+
+        # and nothing to do the second time
+        if migrate('sqlite:///' + db_path) != []:
+            result = False
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_sqlite_profile():
+    ''' Check that the 'fast' sqlite profile is applied to connections. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+
+    try:
+        configure_sqlite('fast')
+        engine = get_engine('sqlite:///' + os.path.join(path, 'fast.db'))
+
+        with engine.connect() as conn:
+            mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            sync = conn.execute('PRAGMA synchronous').fetchone()[0]
+
+        # synchronous NORMAL is 1
+        if mode.lower() != 'wal' or sync != 1:
+            result = False
+
+        engine.dispose()
+
+    finally:
+        configure_sqlite()
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_database_writer():
+    ''' Check that DatabaseWriter makes writes in order in the background
+    and raises write errors in the calling thread. '''
+
+    result = True
+
+    for maxsize in [0, 2]:
+        written = []
+        with DatabaseWriter(maxsize) as writer:
+            for n in range(0, 10):
+                writer.put(written.append, n)
+
+        if written != list(range(0, 10)) or writer.writes != 10:
+            result = False
+
+    def fail():
+        raise ValueError('write failed')
+
+    writer = DatabaseWriter(2)
+    writer.put(fail)
+
+    try:
+        writer.flush()
+        result = False
+    except ValueError:
+        pass
+
+    writer.close(raise_error=False)
+
+    return result
+
+
+def make_runs(path, dates, shape):
+    ''' Write synthetic awsm_daily snow.nc, em.nc, precip.nc and
+    percent_snow.nc for each date. '''
+
+    rng = np.random.RandomState(0)
+    snow = ['thickness', 'snow_density', 'specific_mass', 'liquid_water',
+            'temp_surf', 'temp_lower', 'temp_snowcover', 'thickness_lower',
+            'water_saturation']
+    em = ['net_rad', 'sensible_heat', 'latent_heat', 'snow_soil',
+          'precip_advected', 'sum_EB', 'evaporation', 'snowmelt', 'SWI',
+          'cold_content']
+    units = 'hours since 2018-10-01 00:00:00'
+    run_dirs = []
+
+    for date in dates:
+        run_dir = os.path.join(path, 'runs', date.strftime('run%Y%m%d'))
+        smrf = os.path.join(path, 'data', date.strftime('data%Y%m%d'),
+                            'smrfOutputs')
+        os.makedirs(run_dir)
+        os.makedirs(smrf)
+        run_dirs.append(run_dir)
+
+        hours = [date - timedelta(hours=h) for h in range(23, -1, -1)]
+        files = [(os.path.join(run_dir, 'snow.nc'), snow, [date]),
+                 (os.path.join(run_dir, 'em.nc'), em, [date]),
+                 (os.path.join(smrf, 'precip.nc'), ['precip'], hours),
+                 (os.path.join(smrf, 'percent_snow.nc'), ['percent_snow'],
+                  hours)]
+
+        for f, names, times in files:
+            ncf = nc.Dataset(f, 'w')
+            ncf.createDimension('time', None)
+            ncf.createDimension('y', shape[0])
+            ncf.createDimension('x', shape[1])
+            t = ncf.createVariable('time', 'f8', ('time',))
+            t.units = units
+            t.calendar = 'standard'
+            t[:] = nc.date2num(times, units, 'standard')
+            ncf.createVariable('y', 'f8', ('y',))[:] = np.arange(shape[0])
+            ncf.createVariable('x', 'f8', ('x',))[:] = np.arange(shape[1])
+
+            for name in names:
+                v = ncf.createVariable(name, 'f4', ('time', 'y', 'x'))
+                v[:] = rng.rand(len(times), shape[0], shape[1])
+            ncf.close()
+
+    return run_dirs
+
+
+def run_process(path, run_dirs, name, start, end, processes=1,
+                last=None, skip_before=None, totals=None, dtype=np.float64):
+    ''' Run Process on synthetic run directories from make_runs(), with
+    the Lakes Basin masks and a new sqlite database, or the existing one
+    for name. Returns the Process and the Results rows. '''
+
+    out = masks(topo_path, False)
+    bins = np.arange(7000, 9500, 500)
+    properties = ['swi_z', 'evap_z', 'swe_z', 'depth', 'density',
+                  'coldcont', 'precip_z']
+    db_path = os.path.join(path, '{}.db'.format(name))
+    connector = 'sqlite:///' + db_path
+    new = not os.path.isfile(db_path)
+
+    db = Database(db_type='sqlite', database=connector)
+    db.make_connection()
+    db.check_tables()
+
+    if new:
+        db.insert('RunMetadata', {'run_id': 1, 'run_name': name})
+
+    cfg = types.SimpleNamespace()
+    cfg.masks = out['masks']
+    cfg.plotorder = out['plotorder']
+    cfg.dem = out['dem']
+    cfg.nrows, cfg.ncols = out['dem'].shape
+    cfg.edges = bins - 500
+    cfg.ixd = np.digitize(cfg.dem * 3.28, bins)
+    cfg.zonal = ZonalStats(cfg.masks, cfg.ixd, cfg.edges, 50)
+    cfg.variables = AwsmInputsOutputs()
+    cfg.variables.make_variables(properties, cfg.edges, cfg.masks.keys())
+    cfg.vid = dict((v, i + 1) for i, v in
+                   enumerate(cfg.variables.variables.keys()))
+    results = outputs(list(run_dirs), 2019, properties, start, end,
+                      dtype=dtype, skip_before=skip_before)
+    cfg.outputs = results['outputs']
+    cfg.rundirs_dict = results['rdict']
+    cfg.basins = {cfg.plotorder[0]: {'basin_id': 1, 'watershed_id': 1}}
+    cfg.connector = connector
+    cfg.run_name = name
+    cfg.run_id = 1
+    cfg.processes = processes
+    cfg.cclimit = -5 * 1000 * 1000
+    cfg.dplcs = 3
+    cfg.window = None
+    cfg.dtype = np.dtype(dtype)
+    cfg.mask_and_scale = True
+    cfg.precip_cache_dir = None
+    cfg.db_write_queue = 4
+    cfg.db_overwrite = False
+    cfg.last_date = last
+    cfg.totals = totals
+    cfg.totals_path = totals_path(path, connector, name, start)
+    cfg.totals_names = ['precip', 'rain', 'swi', 'swi_last']
+    cfg.inputs_flag = False
+    cfg.density_flag = True
+    cfg.swi_flag = True
+    cfg.precip_depth_flag = True
+    cfg.diagnostics_flag = False
+    cfg._logger = logging.getLogger()
+
+    p = Process(cfg, db)
+    p.dates = list(cfg.outputs['dates'])
+    cfg.outputs.close()
+
+    cnx = sqlite3.connect(db_path)
+    rows = cnx.execute('SELECT date_time, variable, elevation, value FROM '
+                       'Results ORDER BY date_time, variable, '
+                       'elevation').fetchall()
+    cnx.close()
+
+    return p, rows
+
+
+def check_process_pool():
+    ''' Check that Process with processes: 2 writes the same Results and
+    sums the same precip as a single process. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+    dates = [datetime(2019, 4, 1, 23) + timedelta(days=d)
+             for d in range(0, 3)]
+
+    try:
+        out = masks(topo_path, False)
+        run_dirs = make_runs(path, dates, out['dem'].shape)
+        runs = {}
+
+        for processes in [1, 2]:
+            runs[processes] = run_process(path, run_dirs,
+                                          'pool_{}'.format(processes),
+                                          dates[0], dates[-1], processes)
+
+        p1, rows1 = runs[1]
+        p2, rows2 = runs[2]
+
+        if (len(rows1) == 0 or rows1 != rows2 or
+                not np.array_equal(p1.precip_total, p2.precip_total) or
+                not np.array_equal(p1.rain_total, p2.rain_total) or
+                not np.array_equal(p1.swi_total, p2.swi_total)):
+            result = False
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_last_date():
+    ''' Check the last processed date that [run] incremental starts
+    after. '''
+
+    result = True
+
+    if last_date(gold_cnx, run_name_gold) != end_date:
+        result = False
+
+    if last_date(gold_cnx, 'not_a_run_name') is not None:
+        result = False
+
+    return result
+
+
+def check_delete_range():
+    ''' Check that delete_range() removes one day of Results and Inputs
+    with dates, and then the rest of a run with its RunMetadata and
+    VariableUnits. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+
+    try:
+        db_path = os.path.join(path, 'delete.db')
+        shutil.copyfile(gold_db_path, db_path)
+        cnx = 'sqlite:///' + db_path
+        conn = sqlite3.connect(db_path)
+        count = 'select count(*) from {} where run_id = 1'
+        inputs = ("select count(*) from Inputs where date_time >= '{}' and "
+                  "date_time < '{}'")
+
+        # the gold Inputs have another run_name
+        conn.execute('update Inputs set run_name = ?', (run_name_gold,))
+        conn.commit()
+        first_inputs = conn.execute(inputs.format(
+            '2019-04-01', '2019-04-02')).fetchone()[0]
+        last_inputs = conn.execute(inputs.format(
+            '2019-04-02', '2019-04-03')).fetchone()[0]
+
+        # the first day is in the range but not in dates
+        out = delete_range(cnx, run_name_gold, start_date, end_date, [16],
+                           input_basin_ids=[16], dates=[end_date])
+        if (out['results'] != 80 or out['run_ids'] != [] or
+                out['inputs'] != last_inputs or last_inputs == 0 or
+                conn.execute(count.format('Results')).fetchone()[0] != 80 or
+                conn.execute(inputs.format(
+                    '2019-04-01', '2019-04-02')).fetchone()[0] !=
+                first_inputs):
+            result = False
+
+        out = delete_range(cnx, run_name_gold, start_date, end_date, [16])
+        if out['results'] != 80 or out['run_ids'] != [1]:
+            result = False
+
+        for table in ['Results', 'VariableUnits', 'RunMetadata']:
+            if conn.execute(count.format(table)).fetchone()[0] != 0:
+                result = False
+
+        conn.close()
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_crop_window():
+    ''' Check reads over the [snowav] crop window against full reads. '''
+
+    result = True
+    out = masks(topo_path, False, plotorder=plotorder_test)
+    window = crop_window(out['masks'])
+    mask = out['masks'][plotorder_test[0]]['mask']
+
+    if mask[window].sum() != mask.sum():
+        result = False
+
+    path = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+
+    with iSnobalReader(path, snowbands=[2], embands=[8], wy=2019,
+                       lazy=True) as full:
+        with iSnobalReader(path, snowbands=[2], embands=[8], wy=2019,
+                           lazy=True, window=window) as crop:
+
+            if not np.array_equal(crop.snow(2),
+                                  full.snow(2)[:, window[0], window[1]],
+                                  equal_nan=True):
+                result = False
+
+            if not np.array_equal(crop.em(8, 0), full.em(8, 0)[window],
+                                  equal_nan=True):
+                result = False
+
+    path = os.path.abspath('./tests/lakes/gold/data/data20190402/smrfOutputs/')
+    precip_path = os.path.join(path, 'precip.nc')
+    percent_snow_path = os.path.join(path, 'percent_snow.nc')
+
+    precip, rain = sum_precip(precip_path, percent_snow_path)
+    crop_precip, crop_rain = sum_precip(precip_path, percent_snow_path,
+                                        window=window)
+
+    if (not np.array_equal(crop_precip, precip[window]) or
+            not np.array_equal(crop_rain, rain[window])):
+        result = False
+
+    args = (precip_path, 'precip', ['nanmean', 'nanpercentile'], [25, 75])
+    rows = input_summary(*args, {'Lakes Basin': mask}, {'Lakes Basin': 16},
+                         'test', 89, unit='mm')
+    crop_rows = input_summary(*args, {'Lakes Basin': mask[window]},
+                              {'Lakes Basin': 16}, 'test', 89, unit='mm',
+                              window=window)
+
+    if rows != crop_rows:
+        result = False
+
+    return result
+
+
+def station_metadata(pixels):
+    ''' Weather database station metadata for the topo.nc (row, column)
+    pixels of each station, with the topo x and y vectors. '''
+
+    topo = nc.Dataset(topo_path)
+    x = topo.variables['x'][:]
+    y = topo.variables['y'][:]
+    topo.close()
+
+    metadata = pd.DataFrame(
+        [utm.to_latlon(x[c], y[r], 11, northern=True)
+         for r, c in pixels.values()],
+        index=list(pixels.keys()), columns=['latitude', 'longitude'])
+
+    return metadata, x, y
+
+
+def check_crop_stations():
+    ''' Check stn_validate station pixels with [snowav] crop, for stations
+    inside, on the edge of, and outside of the crop window. '''
+
+    result = True
+    out = masks(topo_path, False)
+    window = crop_window(out['masks'])
+    oy, ox = window[0].start, window[1].start
+
+    pixels = {'inside': (80, 70),
+              'edge': (oy, window[1].stop - 1),
+              'outside': (2, 2)}
+    metadata, x, y = station_metadata(pixels)
+    stns = list(pixels.keys())
+
+    full = station_index(stns, metadata, x, y, px, py, out['dem'])
+    crop = station_index(stns, metadata, x, y, px, py, out['dem'],
+                         window=window)
+
+    for stn, (r, c) in pixels.items():
+        if (full[stn]['row'] != r or full[stn]['col'] != c or
+                crop[stn]['row'] != r - oy or crop[stn]['col'] != c - ox or
+                not full[stn]['inside'] or not crop[stn]['inside'] or
+                crop[stn]['elev'] != out['dem'][r, c] or
+                not np.array_equal(crop[stn]['rows'], full[stn]['rows'] - oy)):
+            result = False
+
+    # the index is saved to cache_dir, and loaded from it on the next call
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        for i in range(0, 2):
+            cached = station_index(stns, metadata, x, y, px, py, out['dem'],
+                                   window=window, cache_dir=cache_dir)
+
+            for stn in stns:
+                for k in ['row', 'col', 'elev', 'inside']:
+                    if cached[stn][k] != crop[stn][k]:
+                        result = False
+
+                for k in ['rows', 'cols']:
+                    if not np.array_equal(cached[stn][k], crop[stn][k]):
+                        result = False
+
+        if len(os.listdir(cache_dir)) != 1:
+            result = False
+
+    finally:
+        shutil.rmtree(cache_dir)
+
+    return result
+
+
+def check_station_pixels():
+    ''' Check station_pixels() values against reading each station pixel,
+    with and without a crop window offset. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+    dates = [datetime(2019, 4, 1, 23), datetime(2019, 4, 2, 23)]
+    pixels = {'inside': (80, 70), 'outside': (2, 2), 'corner': (166, 1)}
+    stns = list(pixels.keys())
+    columns = ['{}_{}'.format(stn, ix) for stn in stns for ix in range(9)]
+
+    try:
+        out = masks(topo_path, False)
+        run_dirs = make_runs(path, dates, out['dem'].shape)
+        metadata, x, y = station_metadata(pixels)
+
+        for window in [None, crop_window(out['masks'])]:
+            index = station_index(stns, metadata, x, y, px, py, out['dem'],
+                                  window=window)
+            model = pd.DataFrame(index=pd.date_range(dates[0].date(),
+                                                     dates[-1].date()),
+                                 columns=columns)
+            model = station_pixels(run_dirs, index, dates[-1], model,
+                                   window=window)
+
+            for run_dir, date in zip(run_dirs, dates):
+                ncf = nc.Dataset(os.path.join(run_dir, 'snow.nc'))
+                image = ncf.variables['specific_mass']
+
+                for stn, (r, c) in pixels.items():
+                    for ix in range(0, len(px)):
+                        value = float(image[0, r + py[ix], c + px[ix]])
+                        column = '{}_{}'.format(stn, ix)
+
+                        if float(model.loc[pd.Timestamp(date.date()),
+                                           column]) != value:
+                            result = False
+
+                ncf.close()
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_load_data():
+    ''' Check point values load_data() time series against reading each
+    location's pixel from every file, on synthetic runs. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+    dates = [datetime(2019, 4, 1, 23), datetime(2019, 4, 2, 23)]
+    locs = [(70, 80), (12, 150), (140, 9), (71, 80)]
+
+    try:
+        run_dirs = make_runs(path, dates, (168, 156))
+        data_dirs = [os.path.join(d.replace('/runs/run', '/data/data'),
+                                  'smrfOutputs') for d in run_dirs]
+
+        pv = types.SimpleNamespace()
+        pv.run_dirs = run_dirs
+        pv.data_dirs = data_dirs
+        pv.cube = None
+        pv.basin_x = 156
+        pv.basin_y = 168
+        pv.logger = logging.getLogger()
+        pv.name_col = 'name'
+        pv.description_col = 'description'
+        pv.model_xind = 'model xind'
+        pv.model_yind = 'model yind'
+        pv.data = pd.DataFrame({'model xind': [loc[0] for loc in locs],
+                                'model yind': [loc[1] for loc in locs],
+                                'name': ['p{}'.format(i) for i in
+                                         range(0, len(locs))],
+                                'description': ''})
+        pv.bandsmap = {'swe_z': 'specific_mass', 'density': 'snow_density',
+                       'swi_z': 'SWI'}
+        pv.properties_lookup = {
+            'snow.nc': {'bands': {'swe_z': 2, 'density': 1}},
+            'em.nc': {'bands': {'swi_z': 8}},
+            'precip.nc': {'bands': {'precip': None}}}
+        pv.tvar = pd.DataFrame(columns=['specific_mass', 'density', 'SWI',
+                                        'precip'])
+
+        load_data(pv)
+
+        files = {'specific_mass': ('snow.nc', 'specific_mass', run_dirs),
+                 'density': ('snow.nc', 'snow_density', run_dirs),
+                 'SWI': ('em.nc', 'SWI', run_dirs),
+                 'precip': ('precip.nc', 'precip', data_dirs)}
+
+        for x, y in locs:
+            df = pv.var_dict[(x, y)]['data']
+
+            for column, (file, v, dirs) in files.items():
+                for d in dirs:
+                    ncf = nc.Dataset(os.path.join(d, file))
+                    times = nc.num2date(ncf.variables['time'][:],
+                                        ncf.variables['time'].units)
+                    values = ncf.variables[v][:, y, x]
+                    ncf.close()
+
+                    for t, value in zip(times, values):
+                        t = datetime(t.year, t.month, t.day, t.hour)
+                        if df.loc[t, column] != float(value):
+                            result = False
+
+            if list(df.columns) != list(pv.tvar.columns) or len(df) != 48:
+                result = False
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_crop_flight():
+    ''' Check the flight difference figure with [snowav] crop, where flight
+    depths are read over the crop window. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+
+    try:
+        out = masks(topo_path, False)
+        window = crop_window(out['masks'])
+        mask = out['masks']['Lakes Basin']['mask']
+        shape = mask[window].shape
+
+        # one flight on end_date, with depths masked outside of the basin
+        file = os.path.join(path, 'lidar_depths.nc')
+        ncf = nc.Dataset(file, 'w')
+        ncf.createDimension('time', None)
+        ncf.createDimension('y', mask.shape[0])
+        ncf.createDimension('x', mask.shape[1])
+        ncf.createVariable('time', 'f8', ('time',))[:] = \
+            (end_date - datetime(2018, 10, 1)).total_seconds() / 3600
+        depth = ncf.createVariable('depth', 'f4', ('time', 'y', 'x'),
+                                   fill_value=-9999.0)
+        depth[:] = np.ma.masked_array(np.ones((1,) + mask.shape),
+                                      mask=(mask == 0)[np.newaxis])
+        ncf.close()
+
+        flight_outputs = {'swe_z': [np.full(shape, 2.0)], 'dates': [end_date]}
+        pre_flight_outputs = {'swe_z': [np.ones(shape)]}
+        args = (file, None, end_date, flight_outputs, pre_flight_outputs,
+                {'Lakes': {'mask': mask[window]}}, [5, 95], ['xkcd:blue'],
+                edges, gold_cnx, plotorder, 2019, 0.03937, basins,
+                run_name_gold, (10, 5), 'in', 'ft', 'TAF', 2, path)
+
+        names, df = flt_image_change(*args, window=window)
+
+        if (len(names) != 1 or
+                not os.path.isfile(os.path.join(path, names[0]))):
+            result = False
+
+        # full flight depths don't match the cropped images
+        try:
+            flt_image_change(*args)
+            result = False
+        except Exception:
+            pass
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
+def check_consolidate():
+    ''' Check outputs() images from a water year cube against the run
+    directories, and that consolidating again only appends new days. '''
+
+    result = True
+    path = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+    cube_dir = tempfile.mkdtemp()
+    cube = os.path.join(cube_dir, 'wy2019.nc')
+    bands = ['swe_z', 'depth', 'coldcont', 'swi_z']
+
+    try:
+        counts = consolidate([path], cube, time_chunk=4, tile=64)
+        if counts['added'] != 1:
+            result = False
+
+        counts = consolidate([path], cube)
+        if counts['added'] != 0 or counts['skipped'] != 1:
+            result = False
+
+        if list(cube_index(cube).keys()) != [path]:
+            result = False
+
+        files = outputs([path], 2019, bands, start_date, end_date)
+        out = outputs([path], 2019, bands, start_date, end_date, cube=cube)
+
+        if (out['outputs']['dates'] != files['outputs']['dates'] or
+                out['rdict'] != files['rdict'] or
+                out['outputs'].entries[0][0] != cube):
+            result = False
+
+        for band in bands:
+            if not np.array_equal(out['outputs'][band][0],
+                                  files['outputs'][band][0], equal_nan=True):
+                result = False
+
+        out['outputs'].close()
+        files['outputs'].close()
+
+    finally:
+        shutil.rmtree(cube_dir)
+
+    return result
+
+
+def check_dtype():
+    ''' Check that float32 images and daily precip totals use half the
+    memory of float64 and give the same basin and elevation band results. '''
+
+    result = True
+    path = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+    out = masks(topo_path, False, plotorder=plotorder_test)
+    dem = out['dem'] * 3.28
+    ixd = np.digitize(dem, np.arange(9000, 13000, 1000))
+    zs = ZonalStats(out['masks'], ixd, edges, 50, 'TAF', 3)
+    mask = out['masks'][plotorder_test[0]]['mask']
+    bands = ['swe_z', 'depth', 'density', 'coldcont']
+
+    images = {}
+    for dtype in [np.float64, np.float32]:
+        store = outputs([path], 2019, bands, start_date, end_date,
+                        dtype=dtype)['outputs']
+        images[dtype] = dict((b, store[b][0]) for b in bands)
+        store.close()
+
+    for band in bands:
+        i64 = images[np.float64][band]
+        i32 = images[np.float32][band]
+
+        if i32.dtype != np.float32 or i32.nbytes * 2 != i64.nbytes:
+            result = False
+
+        for method, convert in [('sum', 'volume'), ('mean', 'depth')]:
+            if not zs.calculate(i32, method, convert).equals(
+                    zs.calculate(i64, method, convert)):
+                result = False
+
+        if not np.allclose(calculate(i32, 50, mask, 'sum', 'volume'),
+                           calculate(i64, 50, mask, 'sum', 'volume'),
+                           equal_nan=True):
+            result = False
+
+    smrf = os.path.abspath('./tests/lakes/gold/data/data20190402/smrfOutputs/')
+    precip = dict((dtype, sum_precip(os.path.join(smrf, 'precip.nc'),
+                                     os.path.join(smrf, 'percent_snow.nc'),
+                                     dtype=dtype))
+                  for dtype in [np.float64, np.float32])
+
+    for a, b in zip(precip[np.float64], precip[np.float32]):
+        if (a.dtype != np.float64 or b.dtype != np.float32 or
+                not np.allclose(a, b, rtol=1e-5, equal_nan=True)):
+            result = False
+
+    return result
+
+
+def check_mask_and_scale():
+    ''' Check nc_array() fill values, packing and nan_values against netCDF4
+    masked arrays, masked and plain array reads with a mask, and plain array
+    reads of snow.nc, em.nc and smrf outputs against masked array reads. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+    ncpath = os.path.join(path, 'fills.nc')
+
+    try:
+        ncf = nc.Dataset(ncpath, 'w')
+        ncf.createDimension('time', 2)
+        ncf.createDimension('y', 3)
+        ncf.createDimension('x', 4)
+        temp = ncf.createVariable('temp', 'f4', ('time', 'y', 'x'),
+                                  fill_value=-9999.0)
+        packed = ncf.createVariable('packed', 'i2', ('time', 'y', 'x'),
+                                    fill_value=-32767)
+        packed.scale_factor = 0.5
+        packed.add_offset = 10.0
+        default = ncf.createVariable('default', 'f4', ('time', 'y', 'x'))
+
+        values = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+        values[0, 1, 1] = -75.0
+        temp[:] = np.ma.masked_where(values == 5, values)
+        packed[:] = np.ma.masked_where(values == 7, values)
+        default[1] = values[1]
+        ncf.close()
+
+        ncf = nc.Dataset(ncpath, 'r')
+        for name in ['temp', 'packed', 'default']:
+            for dtype in [np.float64, np.float32]:
+                expected = np.ma.filled(np.ma.asarray(
+                    ncf.variables[name][:], dtype=dtype), np.nan)
+                expected[expected == -75.0] = np.nan
+
+                array = nc_array(ncf.variables[name], slice(None), dtype,
+                                 [-75.0])
+
+                if (array.dtype != dtype or
+                        not np.allclose(array, expected, equal_nan=True)):
+                    result = False
+
+                # the variable's auto mask and scale is restored
+                if (not ncf.variables[name].mask or
+                        not ncf.variables[name].scale):
+                    result = False
+        ncf.close()
+
+        # with a mask, -75.0 temperatures are nan inside and outside of the
+        # mask in both paths, rows and columns 0:5 are outside of it
+        out = masks(topo_path, False, plotorder=plotorder_test)
+        mask = out['masks'][plotorder_test[0]]['mask']
+        run = make_runs(path, [end_date], mask.shape)[0]
+        ncf = nc.Dataset(os.path.join(run, 'snow.nc'), 'a')
+        ncf.variables['temp_surf'][0, 0:5, 0:5] = -75.0
+        ncf.variables['temp_surf'][0, 80:90, 70:80] = -75.0
+        ncf.close()
+
+        reads = [iSnobalReader(run, wy=2019, snowbands=[4], mask=mask,
+                               mask_and_scale=m).snow_data[4]
+                 for m in [True, False]]
+        sentinels = np.zeros(mask.shape, dtype=bool)
+        sentinels[0:5, 0:5] = True
+        sentinels[80:90, 70:80] = True
+
+        for array in reads:
+            if (not np.all(np.isnan(array[0][sentinels])) or
+                    not np.all(array[0][(mask == 0) & ~sentinels] == 0)):
+                result = False
+
+        if not np.array_equal(reads[0], reads[1], equal_nan=True):
+            result = False
+
+    finally:
+        shutil.rmtree(path)
+
+    run = os.path.abspath('./tests/lakes/gold/runs/run20190402/')
+    masked = iSnobalReader(run, wy=2019)
+    plain = iSnobalReader(run, wy=2019, mask_and_scale=False)
+
+    for data in ['snow_data', 'em_data']:
+        for band, array in getattr(masked, data).items():
+            if not np.array_equal(array, getattr(plain, data)[band],
+                                  equal_nan=True):
+                result = False
+
+    smrf = os.path.abspath('./tests/lakes/gold/data/data20190402/smrfOutputs/')
+    precip_path = os.path.join(smrf, 'precip.nc')
+    percent_snow_path = os.path.join(smrf, 'percent_snow.nc')
+
+    for a, b in zip(sum_precip(precip_path, percent_snow_path),
+                    sum_precip(precip_path, percent_snow_path,
+                               mask_and_scale=False)):
+        if not np.array_equal(a, b, equal_nan=True):
+            result = False
+
+    out = masks(topo_path, False, plotorder=plotorder_test)
+    mask = out['masks'][plotorder_test[0]]['mask']
+    rows = [input_summary(precip_path, 'precip', ['nanmean', 'nanpercentile'],
+                          [25, 75], {'Lakes Basin': mask},
+                          {'Lakes Basin': 16}, 'test', 89, unit='mm',
+                          mask_and_scale=m) for m in [True, False]]
+
+    if rows[0] != rows[1]:
+        result = False
+
+    return result
+
+
+def check_incremental():
+    ''' Check that [run] incremental skips the run directories that were
+    processed by the last run, and that the saved totals give the same
+    Results, precip, rain and swi totals as processing every day, with
+    totals in float64 and float32. '''
+
+    result = True
+    path = tempfile.mkdtemp()
+    dates = [datetime(2019, 4, 1, 23) + timedelta(days=d)
+             for d in range(0, 5)]
+
+    try:
+        out = masks(topo_path, False)
+        shape = out['dem'].shape
+        run_dirs = make_runs(path, dates, shape)
+        full, full_rows = run_process(path, run_dirs, 'full', dates[0],
+                                      dates[-1])
+
+        for dtype in [np.float64, np.float32]:
+            name = 'inc_{}'.format(np.dtype(dtype).name)
+
+            # the first run saves totals through dates[2]
+            run_process(path, run_dirs, name, dates[0], dates[2],
+                        dtype=dtype)
+            connector = 'sqlite:///' + os.path.join(path, name + '.db')
+            last = last_date(connector, name)
+            totals = load_totals(totals_path(path, connector, name,
+                                             dates[0]),
+                                 dates[0], shape, last,
+                                 ['precip', 'rain', 'swi', 'swi_last'])
+
+            if last != dates[2] or totals is None or totals['date'] != last:
+                return False
+
+            skip = skipped_dirs(run_dirs, dates[0], totals['date'])
+            if skip != run_dirs[1:3]:
+                result = False
+
+            p, rows = run_process(path, run_dirs, name, dates[0], dates[-1],
+                                  last=last, skip_before=totals['date'],
+                                  totals=totals, dtype=dtype)
+
+            if p.dates != [dates[0]] + dates[3:]:
+                result = False
+
+            # float32 Results can differ from float64 in the last decimal
+            if dtype == np.float64 and rows != full_rows:
+                result = False
+
+            for total in ['precip_total', 'rain_total', 'swi_total']:
+                if (getattr(p, total).dtype != dtype or
+                        not np.allclose(getattr(p, total),
+                                        getattr(full, total), rtol=1e-5)):
+                    result = False
+
+    finally:
+        shutil.rmtree(path)
+
+    return result
+
+
 def check_gold_results():
     ''' Check database 'gold' values '''
 
@@ -469,6 +1729,150 @@ class TestStandardLakes(unittest.TestCase):
         a = check_utils_calculate()
         assert a
 
+    def test_zonal_stats(self):
+        ''' Check ZonalStats against calculate utility '''
+
+        a = check_zonal_stats()
+        assert a
+
+    def test_zonal_stats_cache(self):
+        ''' Check zone index cache '''
+
+        a = check_zonal_stats_cache()
+        assert a
+
+    def test_process_day(self):
+        ''' Check single snow.nc processing '''
+
+        a = check_process_day()
+        assert a
+
+    def test_output_store(self):
+        ''' Check OutputStore images '''
+
+        a = check_output_store()
+        assert a
+
+    def test_reader_lazy(self):
+        ''' Check lazy iSnobalReader '''
+
+        a = check_reader_lazy()
+        assert a
+
+    def test_sum_precip(self):
+        ''' Check daily precip totals '''
+
+        a = check_sum_precip()
+        assert a
+
+    def test_input_summary(self):
+        ''' Check input summary rows against gold Inputs '''
+
+        a = check_input_summary()
+        assert a
+
+    def test_database_stats(self):
+        ''' Check Database table cache and query instrumentation '''
+
+        a = check_database_stats()
+        assert a
+
+    def test_result_cache(self):
+        ''' Check collect() result cache '''
+
+        a = check_result_cache()
+        assert a
+
+    def test_migrate(self):
+        ''' Check database index migration '''
+
+        a = check_migrate()
+        assert a
+
+    def test_sqlite_profile(self):
+        ''' Check sqlite profile pragmas '''
+
+        a = check_sqlite_profile()
+        assert a
+
+    def test_database_writer(self):
+        """ Check background database writer """
+
+        a = check_database_writer()
+        assert(a)
+
+    def test_process_pool(self):
+        """ Check Process with a process pool """
+
+        a = check_process_pool()
+        assert(a)
+
+    def test_last_date(self):
+        """ Check last processed date for incremental runs """
+
+        a = check_last_date()
+        assert(a)
+
+    def test_incremental(self):
+        """ Check incremental runs """
+
+        a = check_incremental()
+        assert(a)
+
+    def test_delete_range(self):
+        """ Check range deletes and RunMetadata cleanup """
+
+        a = check_delete_range()
+        assert(a)
+
+    def test_crop_window(self):
+        """ Check [snowav] crop window reads """
+
+        a = check_crop_window()
+        assert(a)
+
+    def test_crop_stations(self):
+        """ Check stn_validate station pixels with [snowav] crop """
+
+        a = check_crop_stations()
+        assert(a)
+
+    def test_station_pixels(self):
+        """ Check stn_validate station pixel values """
+
+        a = check_station_pixels()
+        assert(a)
+
+    def test_load_data(self):
+        """ Check point values time series """
+
+        a = check_load_data()
+        assert(a)
+
+    def test_crop_flight(self):
+        """ Check flight difference figure with [snowav] crop """
+
+        a = check_crop_flight()
+        assert(a)
+
+    def test_consolidate(self):
+        """ Check water year cube outputs """
+
+        a = check_consolidate()
+        assert(a)
+
+    def test_dtype(self):
+        """ Check float32 images """
+
+        a = check_dtype()
+        assert(a)
+
+    def test_mask_and_scale(self):
+        """ Check plain array netcdf reads """
+
+        a = check_mask_and_scale()
+        assert(a)
+
     def test_gold_results(self):
         ''' Check that gold results are on database '''
 